@@ -1,10 +1,16 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 import sqlite3
-from datetime import datetime, timedelta
-import pytz
+import hashlib
+import json
+from datetime import timedelta
 import os
 from dotenv import load_dotenv
+import clock
+import db
+import cache
+import pubsub
+import migrations
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -12,44 +18,312 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Разрешаем CORS для фронтенда
 
-# Функция для получения тайского времени
-def get_thai_time():
-    """Получить текущее время в тайском часовом поясе"""
-    thai_tz = pytz.timezone('Asia/Bangkok')
-    utc_now = datetime.now(pytz.UTC)
-    thai_now = utc_now.astimezone(thai_tz)
-    return thai_now
+# Время: часовой пояс семьи из настроек, по умолчанию тайский
+def get_thai_time(family_id=None):
+    """Получить текущее время в часовом поясе семьи (по умолчанию тайском)"""
+    return clock.default.now(family_id)
 
-def get_thai_date():
-    """Получить текущую дату в тайском часовом поясе"""
-    return get_thai_time().date()
+def get_thai_date(family_id=None):
+    """Получить текущую дату в часовом поясе семьи (по умолчанию тайском)"""
+    return get_thai_time(family_id).date()
+
+def load_family_timezone(family_id):
+    """Имя часового пояса семьи из настроек (None — пояс по умолчанию)"""
+    database = get_db()
+    if not database:
+        return None
+    row = database.fetchone("SELECT timezone FROM settings WHERE family_id = ?", (family_id,))
+    return row["timezone"] if row else None
+
+clock.default.loader = load_family_timezone
+
+# Менеджеры подключений по пути к файлу БД: Flask обслуживает каждый запрос
+# в новом потоке, поэтому соединения после запроса возвращаются в общий пул
+_db_managers = {}
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+
+# Подписчики на обновления дашбордов и наблюдатели за базами (по пути к файлу)
+broker = pubsub.Broker()
+_watchers = {}
+
+# Как часто поток дашборда проверяет данные без уведомлений (смена минуты, суток)
+STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', '15'))
+
+# Базы, схема которых уже проверена (миграции выполняет только бот при запуске)
+_schema_checked = set()
+
+def schema_is_current(manager):
+    """Схема базы не старше той, на которую рассчитаны запросы API"""
+    if manager.path in _schema_checked:
+        return True
+    version = migrations.schema_version(manager)
+    if version < migrations.LATEST_VERSION:
+        print(f"⚠️ Схема {manager.path} устарела (версия {version}, нужна {migrations.LATEST_VERSION}), ждём миграции бота")
+        return False
+    _schema_checked.add(manager.path)
+    return True
 
 # Функция для безопасного подключения к БД
-def get_db_connection():
-    """Безопасное подключение к базе данных"""
+def get_db():
+    """Получить менеджер подключений к доступной базе данных"""
     try:
-        # Пытаемся подключиться к локальной БД (для разработки)
-        if os.path.exists("babybot.db"):
-            conn = sqlite3.connect("babybot.db")
-            print("✅ Подключение к локальной БД babybot.db")
-        elif os.path.exists("babybot_render.db"):
-            conn = sqlite3.connect("babybot_render.db")
-            print("✅ Подключение к БД babybot_render.db")
-        else:
-            # На Render создаем тестовую БД или возвращаем None
-            print("⚠️ База данных не найдена, используем тестовые данные")
-            return None
-            
-        conn.row_factory = sqlite3.Row  # Возвращаем результаты как словари
-        return conn
+        # Пытаемся подключиться к локальной БД (для разработки), затем к копии для Render
+        for path in ("babybot.db", "babybot_render.db"):
+            if os.path.exists(path):
+                if path not in _db_managers:
+                    # Возвращаем результаты как словари
+                    manager = db.ConnectionManager(path, row_factory=sqlite3.Row, pool_size=DB_POOL_SIZE)
+                    _db_managers[path] = manager
+                    print(f"✅ Подключение к БД {path}")
+                return _db_managers[path]
+        
+        # На Render создаем тестовую БД или возвращаем None
+        print("⚠️ База данных не найдена, используем тестовые данные")
+        return None
     except Exception as e:
         print(f"❌ Ошибка подключения к БД: {e}")
         return None
 
+@app.before_request
+def require_current_schema():
+    """Не обслуживать запросы к базе, которую бот ещё не перевёл на актуальную схему"""
+    if request.endpoint == 'health_check':
+        return None
+    database = get_db()
+    if database and not schema_is_current(database):
+        return jsonify({"error": "Database schema is out of date"}), 503
+    return None
+
+@app.teardown_appcontext
+def release_db(exception=None):
+    """Вернуть соединения потока запроса в пул"""
+    for manager in list(_db_managers.values()):
+        manager.release()
+
+# Дашборд семьи одним запросом: последние события присоединяются подзапросами
+# с LIMIT 1 по индексу (family_id, ts) (пустой подзапрос даёт NULL), счётчики за
+# период суммируются по суточной статистике — O(дней), а не O(событий)
+DASHBOARD_QUERY = """
+    SELECT f.name AS family_name,
+           s.family_id IS NOT NULL AS has_settings,
+           s.feed_interval, s.diaper_interval, s.baby_age_months, s.baby_birth_date,
+           s.tips_enabled, s.bath_reminder_enabled, s.activity_reminder_enabled,
+           lf.timestamp AS feeding_time, lf.ts AS feeding_ts,
+           lf.author_role AS feeding_author_role, lf.author_name AS feeding_author_name,
+           ld.timestamp AS diaper_time, ld.ts AS diaper_ts,
+           ld.author_role AS diaper_author_role, ld.author_name AS diaper_author_name,
+           lb.timestamp AS bath_time, lb.ts AS bath_ts,
+           lb.author_role AS bath_author_role, lb.author_name AS bath_author_name,
+           la.timestamp AS activity_time, la.ts AS activity_ts, la.activity_type,
+           la.author_role AS activity_author_role, la.author_name AS activity_author_name,
+           sl.start_time AS sleep_start, sl.start_ts AS sleep_start_ts,
+           sl.author_role AS sleep_author_role, sl.author_name AS sleep_author_name,
+           (SELECT COALESCE(SUM(count), 0) FROM daily_stats
+            WHERE family_id = f.id AND kind = 'feedings' AND day BETWEEN :start AND :end) AS feedings_count,
+           (SELECT COALESCE(SUM(count), 0) FROM daily_stats
+            WHERE family_id = f.id AND kind = 'diapers' AND day BETWEEN :start AND :end) AS diapers_count,
+           (SELECT COALESCE(SUM(count), 0) FROM daily_stats
+            WHERE family_id = f.id AND kind = 'baths' AND day BETWEEN :start AND :end) AS baths_count,
+           (SELECT COALESCE(SUM(count), 0) FROM daily_stats
+            WHERE family_id = f.id AND kind = 'activities' AND day BETWEEN :start AND :end) AS activities_count
+    FROM families f
+    LEFT JOIN settings s ON s.family_id = f.id
+    LEFT JOIN (SELECT timestamp, ts, author_role, author_name
+               FROM feedings WHERE family_id = :family_id
+               ORDER BY ts DESC LIMIT 1) lf ON 1
+    LEFT JOIN (SELECT timestamp, ts, author_role, author_name
+               FROM diapers WHERE family_id = :family_id
+               ORDER BY ts DESC LIMIT 1) ld ON 1
+    LEFT JOIN (SELECT timestamp, ts, author_role, author_name
+               FROM baths WHERE family_id = :family_id
+               ORDER BY ts DESC LIMIT 1) lb ON 1
+    LEFT JOIN (SELECT timestamp, ts, activity_type, author_role, author_name
+               FROM activities WHERE family_id = :family_id
+               ORDER BY ts DESC LIMIT 1) la ON 1
+    LEFT JOIN (SELECT start_time, start_ts, author_role, author_name
+               FROM sleep_sessions WHERE family_id = :family_id AND is_active = 1
+               ORDER BY start_ts DESC LIMIT 1) sl ON 1
+    WHERE f.id = :family_id
+"""
+
+def fetch_dashboard_row(database, family_id, start_date, end_date):
+    """Строка дашборда семьи (или None, если семьи нет)"""
+    row = database.fetchone(DASHBOARD_QUERY, {"family_id": family_id, "start": start_date, "end": end_date})
+    return dict(row) if row else None
+
+def cached(database, family_id, version, key, load):
+    """Данные семьи из кэша ответов; load() вызывается, если версия семьи изменилась"""
+    return cache.default.get_or_load((database.path, family_id) + key, version, load)
+
+def family_etag(database, family_id, key):
+    """Версия данных семьи и строгий ETag ответа, зависящий от версии и параметров запроса"""
+    version = cache.family_version(database, family_id)
+    etag = hashlib.sha1(repr((database.path, family_id, version) + key).encode("utf-8")).hexdigest()
+    return version, etag
+
+def not_modified(etag):
+    """Ответ 304, если клиент прислал этот ETag в If-None-Match (иначе None)"""
+    if request.if_none_match.contains(etag):
+        return with_etag(Response(status=304), etag)
+    return None
+
+def with_etag(response, etag):
+    """Добавить ETag; no-cache заставляет браузер перепроверять ответ при каждом запросе"""
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def time_since(now_ts, ts):
+    """Сколько прошло с момента ts (секунды epoch): часы и минуты"""
+    if ts is None:
+        return None
+    seconds = now_ts - ts
+    return {
+        "hours": int(seconds // 3600),
+        "minutes": int((seconds % 3600) // 60)
+    }
+
+def current_minute_ts():
+    """Текущее время в epoch, округлённое вниз до минуты"""
+    return clock.default.timestamp() // 60 * 60
+
+def dashboard_period(period, family_id=None):
+    """Первый и последний местный день периода статистики дашборда"""
+    today = get_thai_date(family_id)
+    if period == 'week':
+        start_date = today - timedelta(days=6)
+    elif period == 'month':
+        start_date = today - timedelta(days=29)
+    else:  # today
+        start_date = today
+    return start_date.isoformat(), today.isoformat()
+
+def load_dashboard(database, family_id, version, start_date, end_date, now_ts):
+    """Данные дашборда семьи (или None, если семьи нет)"""
+    # Семья, настройки, последние события, активный сон и статистика — одним запросом
+    # (из кэша, пока данные семьи не менялись)
+    row = cached(database, family_id, version, ("dashboard", start_date, end_date),
+                 lambda: fetch_dashboard_row(database, family_id, start_date, end_date))
+    if not row:
+        return None
+    has_settings = row['has_settings']
+
+    dashboard_data = {
+        "family": {
+            "id": family_id,
+            "name": row['family_name']
+        },
+        "settings": {
+            "feed_interval": row['feed_interval'] if has_settings else 3,
+            "diaper_interval": row['diaper_interval'] if has_settings else 2,
+            "baby_age_months": row['baby_age_months'] if has_settings else 0,
+            "baby_birth_date": row['baby_birth_date'] if has_settings else None,
+            "tips_enabled": bool(row['tips_enabled']) if has_settings else True,
+            "bath_reminder_enabled": bool(row['bath_reminder_enabled']) if has_settings else True,
+            "activity_reminder_enabled": bool(row['activity_reminder_enabled']) if has_settings else True
+        },
+        "last_events": {},
+        "sleep": {
+            "is_active": row['sleep_start'] is not None,
+            "start_time": row['sleep_start'],
+            "author_role": row['sleep_author_role'],
+            "author_name": row['sleep_author_name'],
+            "duration": time_since(now_ts, row['sleep_start_ts'])
+        },
+        "today_stats": {
+            "feedings": row['feedings_count'],
+            "diapers": row['diapers_count'],
+            "baths": row['baths_count'],
+            "activities": row['activities_count']
+        }
+    }
+
+    for kind in ("feeding", "diaper", "bath", "activity"):
+        event = {
+            "timestamp": row[f'{kind}_time'],
+            "author_role": row[f'{kind}_author_role'],
+            "author_name": row[f'{kind}_author_name'],
+            "time_ago": time_since(now_ts, row[f'{kind}_ts'])
+        }
+        if kind == "activity":
+            event["activity_type"] = row['activity_type']
+        dashboard_data["last_events"][kind] = event
+    return dashboard_data
+
+def dashboard_delta(previous, current):
+    """Разделы дашборда, которые изменились с прошлой отправки"""
+    return {section: value for section, value in current.items() if previous.get(section) != value}
+
+# Число событий семьи по местным дням и видам из суточной статистики
+HISTORY_QUERY = """
+    SELECT day, kind, count
+    FROM daily_stats
+    WHERE family_id = :family_id
+      AND kind IN ('feedings', 'diapers', 'baths', 'activities')
+      AND day BETWEEN :start AND :end
+"""
+
+# Максимальная длина истории в днях
+MAX_HISTORY_DAYS = 366
+
+def load_history(database, family_id, start_date, days):
+    """Название семьи и число событий по дням (или None, если семьи нет)"""
+    end_date = start_date + timedelta(days=days-1)
+    with database.cursor() as cur:
+        # Проверяем существование семьи
+        cur.execute("SELECT name FROM families WHERE id = ?", (family_id,))
+        family = cur.fetchone()
+        if not family:
+            return None
+
+        cur.execute(HISTORY_QUERY, {
+            "family_id": family_id,
+            "start": start_date.isoformat(),
+            "end": end_date.isoformat(),
+        })
+        counts = {(row['day'], row['kind']): row['count'] for row in cur.fetchall()}
+
+    # Формируем данные по дням
+    history_data = []
+    for i in range(days):
+        date_str = (start_date + timedelta(days=i)).isoformat()
+        history_data.append({
+            "date": date_str,
+            "feedings": counts.get((date_str, "feedings"), 0),
+            "diapers": counts.get((date_str, "diapers"), 0),
+            "baths": counts.get((date_str, "baths"), 0),
+            "activities": counts.get((date_str, "activities"), 0)
+        })
+    return family['name'], history_data
+
+def load_members(database, family_id):
+    """Название семьи и список её членов (или None, если семьи нет)"""
+    with database.cursor() as cur:
+        # Проверяем существование семьи
+        cur.execute("SELECT name FROM families WHERE id = ?", (family_id,))
+        family = cur.fetchone()
+        if not family:
+            return None
+
+        # Получаем членов семьи
+        cur.execute("""
+            SELECT user_id, role, name 
+            FROM family_members 
+            WHERE family_id = ? 
+            ORDER BY role, name
+        """, (family_id,))
+        members = [dict(row) for row in cur.fetchall()]
+    return family['name'], members
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Проверка здоровья API"""
-    return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
+    return jsonify({
+        "status": "healthy",
+        "timestamp": get_thai_time().isoformat(),
+        "cache": cache.default.metrics(),
+        "stream": broker.metrics()
+    })
 
 @app.route('/api/family/<int:family_id>/dashboard', methods=['GET'])
 def get_family_dashboard(family_id):
@@ -57,8 +331,8 @@ def get_family_dashboard(family_id):
     # Получаем параметр периода
     period = request.args.get('period', 'today')
     try:
-        conn = get_db_connection()
-        if not conn:
+        database = get_db()
+        if not database:
             print(f"⚠️ База данных недоступна, возвращаем тестовые данные для семьи {family_id}")
             # Возвращаем тестовые данные для демонстрации
             test_data = {
@@ -118,232 +392,85 @@ def get_family_dashboard(family_id):
             }
             return jsonify(test_data)
         
-        cur = conn.cursor()
-        
-        # Получаем информацию о семье
-        cur.execute("SELECT name FROM families WHERE id = ?", (family_id,))
-        family = cur.fetchone()
-        if not family:
+        start_date, end_date = dashboard_period(period, family_id)
+
+        # Время «назад» считаем с точностью до минуты, поэтому в пределах минуты
+        # ответ зависит только от версии данных семьи и его можно не отдавать заново
+        now_ts = current_minute_ts()
+        version, etag = family_etag(database, family_id, ("dashboard", start_date, end_date, now_ts))
+        response = not_modified(etag)
+        if response:
+            return response
+
+        dashboard_data = load_dashboard(database, family_id, version, start_date, end_date, now_ts)
+        if not dashboard_data:
             return jsonify({"error": "Family not found"}), 404
-        
-        # Получаем настройки семьи
-        cur.execute("""
-            SELECT feed_interval, diaper_interval, baby_age_months, baby_birth_date,
-                   tips_enabled, bath_reminder_enabled, activity_reminder_enabled
-            FROM settings WHERE family_id = ?
-        """, (family_id,))
-        settings = cur.fetchone()
-        
-        # Получаем последние события
-        today = get_thai_date()
-        
-        # Определяем период для статистики
-        if period == 'week':
-            start_date = datetime.combine(today - timedelta(days=6), datetime.min.time()).isoformat()
-            end_date = datetime.combine(today, datetime.max.time()).isoformat()
-        elif period == 'month':
-            start_date = datetime.combine(today - timedelta(days=29), datetime.min.time()).isoformat()
-            end_date = datetime.combine(today, datetime.max.time()).isoformat()
-        else:  # today
-            start_date = datetime.combine(today, datetime.min.time()).isoformat()
-            end_date = datetime.combine(today, datetime.max.time()).isoformat()
-        
-        # Последнее кормление
-        cur.execute("""
-            SELECT timestamp, author_role, author_name 
-            FROM feedings 
-            WHERE family_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 1
-        """, (family_id,))
-        last_feeding = cur.fetchone()
-        
-        # Последняя смена подгузника
-        cur.execute("""
-            SELECT timestamp, author_role, author_name 
-            FROM diapers 
-            WHERE family_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 1
-        """, (family_id,))
-        last_diaper = cur.fetchone()
-        
-        # Последнее купание
-        cur.execute("""
-            SELECT timestamp, author_role, author_name 
-            FROM baths 
-            WHERE family_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 1
-        """, (family_id,))
-        last_bath = cur.fetchone()
-        
-        # Последняя активность
-        cur.execute("""
-            SELECT timestamp, activity_type, author_role, author_name 
-            FROM activities 
-            WHERE family_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 1
-        """, (family_id,))
-        last_activity = cur.fetchone()
-        
-        # Активная сессия сна
-        cur.execute("""
-            SELECT start_time, author_role, author_name 
-            FROM sleep_sessions 
-            WHERE family_id = ? AND is_active = 1 
-            ORDER BY start_time DESC 
-            LIMIT 1
-        """, (family_id,))
-        active_sleep = cur.fetchone()
-        
-        # Статистика за сегодня
-        cur.execute("""
-            SELECT COUNT(*) as count 
-            FROM feedings 
-            WHERE family_id = ? AND timestamp BETWEEN ? AND ?
-        """, (family_id, start_date, end_date))
-        today_feedings = cur.fetchone()['count']
-        
-        cur.execute("""
-            SELECT COUNT(*) as count 
-            FROM diapers 
-            WHERE family_id = ? AND timestamp BETWEEN ? AND ?
-        """, (family_id, start_date, end_date))
-        today_diapers = cur.fetchone()['count']
-        
-        cur.execute("""
-            SELECT COUNT(*) as count 
-            FROM baths 
-            WHERE family_id = ? AND timestamp BETWEEN ? AND ?
-        """, (family_id, start_date, end_date))
-        today_baths = cur.fetchone()['count']
-        
-        cur.execute("""
-            SELECT COUNT(*) as count 
-            FROM activities 
-            WHERE family_id = ? AND timestamp BETWEEN ? AND ?
-        """, (family_id, start_date, end_date))
-        today_activities = cur.fetchone()['count']
-        
-        # Вычисляем время с последних событий
-        current_time = get_thai_time()
-        
-        dashboard_data = {
-            "family": {
-                "id": family_id,
-                "name": family['name']
-            },
-            "settings": {
-                "feed_interval": settings['feed_interval'] if settings else 3,
-                "diaper_interval": settings['diaper_interval'] if settings else 2,
-                "baby_age_months": settings['baby_age_months'] if settings else 0,
-                "baby_birth_date": settings['baby_birth_date'] if settings else None,
-                "tips_enabled": bool(settings['tips_enabled']) if settings else True,
-                "bath_reminder_enabled": bool(settings['bath_reminder_enabled']) if settings else True,
-                "activity_reminder_enabled": bool(settings['activity_reminder_enabled']) if settings else True
-            },
-            "last_events": {
-                "feeding": {
-                    "timestamp": last_feeding['timestamp'] if last_feeding else None,
-                    "author_role": last_feeding['author_role'] if last_feeding else None,
-                    "author_name": last_feeding['author_name'] if last_feeding else None,
-                    "time_ago": None
-                },
-                "diaper": {
-                    "timestamp": last_diaper['timestamp'] if last_diaper else None,
-                    "author_role": last_diaper['author_role'] if last_diaper else None,
-                    "author_name": last_diaper['author_name'] if last_diaper else None,
-                    "time_ago": None
-                },
-                "bath": {
-                    "timestamp": last_bath['timestamp'] if last_bath else None,
-                    "author_role": last_bath['author_role'] if last_bath else None,
-                    "author_name": last_bath['author_name'] if last_bath else None,
-                    "time_ago": None
-                },
-                "activity": {
-                    "timestamp": last_activity['timestamp'] if last_activity else None,
-                    "activity_type": last_activity['activity_type'] if last_activity else None,
-                    "author_role": last_activity['author_role'] if last_activity else None,
-                    "author_name": last_activity['author_name'] if last_activity else None,
-                    "time_ago": None
-                }
-            },
-            "sleep": {
-                "is_active": active_sleep is not None,
-                "start_time": active_sleep['start_time'] if active_sleep else None,
-                "author_role": active_sleep['author_role'] if active_sleep else None,
-                "author_name": active_sleep['author_name'] if active_sleep else None,
-                "duration": None
-            },
-            "today_stats": {
-                "feedings": today_feedings,
-                "diapers": today_diapers,
-                "baths": today_baths,
-                "activities": today_activities
-            }
-        }
-        
-        # Вычисляем время с последних событий
-        if last_feeding:
-            last_feeding_time = datetime.fromisoformat(last_feeding['timestamp'])
-            time_diff = current_time - last_feeding_time
-            dashboard_data["last_events"]["feeding"]["time_ago"] = {
-                "hours": int(time_diff.total_seconds() // 3600),
-                "minutes": int((time_diff.total_seconds() % 3600) // 60)
-            }
-        
-        if last_diaper:
-            last_diaper_time = datetime.fromisoformat(last_diaper['timestamp'])
-            time_diff = current_time - last_diaper_time
-            dashboard_data["last_events"]["diaper"]["time_ago"] = {
-                "hours": int(time_diff.total_seconds() // 3600),
-                "minutes": int((time_diff.total_seconds() % 3600) // 60)
-            }
-        
-        if last_bath:
-            last_bath_time = datetime.fromisoformat(last_bath['timestamp'])
-            time_diff = current_time - last_bath_time
-            dashboard_data["last_events"]["bath"]["time_ago"] = {
-                "hours": int(time_diff.total_seconds() // 3600),
-                "minutes": int((time_diff.total_seconds() % 3600) // 60)
-            }
-        
-        if last_activity:
-            last_activity_time = datetime.fromisoformat(last_activity['timestamp'])
-            time_diff = current_time - last_activity_time
-            dashboard_data["last_events"]["activity"]["time_ago"] = {
-                "hours": int(time_diff.total_seconds() // 3600),
-                "minutes": int((time_diff.total_seconds() % 3600) // 60)
-            }
-        
-        # Вычисляем длительность сна
-        if active_sleep:
-            start_time = datetime.fromisoformat(active_sleep['start_time'])
-            time_diff = current_time - start_time
-            dashboard_data["sleep"]["duration"] = {
-                "hours": int(time_diff.total_seconds() // 3600),
-                "minutes": int((time_diff.total_seconds() % 3600) // 60)
-            }
-        
-        conn.close()
-        return jsonify(dashboard_data)
+
+        return with_etag(jsonify(dashboard_data), etag)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/family/<int:family_id>/stream', methods=['GET'])
+def stream_family_dashboard(family_id):
+    """Поток Server-Sent Events с изменениями дашборда семьи"""
+    period = request.args.get('period', 'today')
+    database = get_db()
+    if not database:
+        # Без базы обновлений не будет — клиент продолжит опрашивать дашборд
+        return jsonify({"error": "Stream unavailable"}), 503
+
+    if database.path not in _watchers:
+        _watchers[database.path] = pubsub.VersionWatcher(database, broker)
+    _watchers[database.path].start()
+
+    def snapshot():
+        start_date, end_date = dashboard_period(period, family_id)
+        version = cache.family_version(database, family_id)
+        return load_dashboard(database, family_id, version, start_date, end_date, current_minute_ts())
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def events():
+        subscription = broker.subscribe(family_id)
+        try:
+            current = snapshot()
+            if current is None:
+                yield sse("error", {"error": "Family not found"})
+                return
+            # Сначала полный дашборд, затем только изменившиеся разделы
+            yield "retry: 5000\n"
+            yield sse("dashboard", current)
+            while True:
+                subscription.get(timeout=STREAM_HEARTBEAT)
+                latest = snapshot()
+                if latest is None:
+                    return
+                delta = dashboard_delta(current, latest)
+                current = latest
+                if delta:
+                    yield sse("delta", delta)
+                else:
+                    # Комментарий держит соединение открытым через прокси
+                    yield ": ping\n\n"
+        finally:
+            subscription.close()
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 @app.route('/api/family/<int:family_id>/history', methods=['GET'])
 def get_family_history(family_id):
     """Получить историю событий для семьи"""
     try:
         days = request.args.get('days', 7, type=int)
-        if days > 30:  # Ограничиваем максимум 30 дней
-            days = 30
+        days = max(1, min(days, MAX_HISTORY_DAYS))  # От одного дня до года
         
-        conn = get_db_connection()
-        if not conn:
+        database = get_db()
+        if not database:
             print(f"⚠️ База данных недоступна, возвращаем тестовые данные истории для семьи {family_id}")
             # Возвращаем тестовые данные для демонстрации
             from datetime import date
@@ -365,82 +492,28 @@ def get_family_history(family_id):
                 "history": test_history
             })
         
-        cur = conn.cursor()
-        
-        # Проверяем существование семьи
-        cur.execute("SELECT name FROM families WHERE id = ?", (family_id,))
-        family = cur.fetchone()
-        if not family:
-            return jsonify({"error": "Family not found"}), 404
-        
         # Получаем события за последние N дней
-        end_date = get_thai_date()
+        end_date = get_thai_date(family_id)
         start_date = end_date - timedelta(days=days-1)
-        
-        start_datetime = datetime.combine(start_date, datetime.min.time()).isoformat()
-        end_datetime = datetime.combine(end_date, datetime.max.time()).isoformat()
-        
-        # Кормления
-        cur.execute("""
-            SELECT DATE(timestamp) as date, COUNT(*) as count
-            FROM feedings 
-            WHERE family_id = ? AND timestamp BETWEEN ? AND ?
-            GROUP BY DATE(timestamp)
-            ORDER BY date
-        """, (family_id, start_datetime, end_datetime))
-        feedings_by_day = {row['date']: row['count'] for row in cur.fetchall()}
-        
-        # Смены подгузников
-        cur.execute("""
-            SELECT DATE(timestamp) as date, COUNT(*) as count
-            FROM diapers 
-            WHERE family_id = ? AND timestamp BETWEEN ? AND ?
-            GROUP BY DATE(timestamp)
-            ORDER BY date
-        """, (family_id, start_datetime, end_datetime))
-        diapers_by_day = {row['date']: row['count'] for row in cur.fetchall()}
-        
-        # Купания
-        cur.execute("""
-            SELECT DATE(timestamp) as date, COUNT(*) as count
-            FROM baths 
-            WHERE family_id = ? AND timestamp BETWEEN ? AND ?
-            GROUP BY DATE(timestamp)
-            ORDER BY date
-        """, (family_id, start_datetime, end_datetime))
-        baths_by_day = {row['date']: row['count'] for row in cur.fetchall()}
-        
-        # Активности
-        cur.execute("""
-            SELECT DATE(timestamp) as date, COUNT(*) as count
-            FROM activities 
-            WHERE family_id = ? AND timestamp BETWEEN ? AND ?
-            GROUP BY DATE(timestamp)
-            ORDER BY date
-        """, (family_id, start_datetime, end_datetime))
-        activities_by_day = {row['date']: row['count'] for row in cur.fetchall()}
-        
-        # Формируем данные по дням
-        history_data = []
-        for i in range(days):
-            current_date = start_date + timedelta(days=i)
-            date_str = current_date.isoformat()
-            
-            history_data.append({
-                "date": date_str,
-                "feedings": feedings_by_day.get(date_str, 0),
-                "diapers": diapers_by_day.get(date_str, 0),
-                "baths": baths_by_day.get(date_str, 0),
-                "activities": activities_by_day.get(date_str, 0)
-            })
-        
-        conn.close()
-        return jsonify({
+
+        key = ("history", start_date.isoformat(), days)
+        version, etag = family_etag(database, family_id, key)
+        response = not_modified(etag)
+        if response:
+            return response
+
+        result = cached(database, family_id, version, key,
+                        lambda: load_history(database, family_id, start_date, days))
+        if not result:
+            return jsonify({"error": "Family not found"}), 404
+        family_name, history_data = result
+
+        return with_etag(jsonify({
             "family_id": family_id,
-            "family_name": family['name'],
+            "family_name": family_name,
             "period_days": days,
             "history": history_data
-        })
+        }), etag)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -449,8 +522,8 @@ def get_family_history(family_id):
 def get_family_members(family_id):
     """Получить список членов семьи"""
     try:
-        conn = get_db_connection()
-        if not conn:
+        database = get_db()
+        if not database:
             print(f"⚠️ База данных недоступна, возвращаем тестовые данные членов для семьи {family_id}")
             # Возвращаем тестовые данные для демонстрации
             test_members = [
@@ -465,29 +538,22 @@ def get_family_members(family_id):
                 "members": test_members
             })
         
-        cur = conn.cursor()
-        
-        # Проверяем существование семьи
-        cur.execute("SELECT name FROM families WHERE id = ?", (family_id,))
-        family = cur.fetchone()
-        if not family:
+        key = ("members",)
+        version, etag = family_etag(database, family_id, key)
+        response = not_modified(etag)
+        if response:
+            return response
+
+        result = cached(database, family_id, version, key, lambda: load_members(database, family_id))
+        if not result:
             return jsonify({"error": "Family not found"}), 404
-        
-        # Получаем членов семьи
-        cur.execute("""
-            SELECT user_id, role, name 
-            FROM family_members 
-            WHERE family_id = ? 
-            ORDER BY role, name
-        """, (family_id,))
-        members = [dict(row) for row in cur.fetchall()]
-        
-        conn.close()
-        return jsonify({
+        family_name, members = result
+
+        return with_etag(jsonify({
             "family_id": family_id,
-            "family_name": family['name'],
+            "family_name": family_name,
             "members": members
-        })
+        }), etag)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -497,8 +563,8 @@ def get_families():
     """Получить список всех семей (только ID и названия)"""
     try:
         print(f"🔍 Запрос на получение списка семей")
-        conn = get_db_connection()
-        if not conn:
+        database = get_db()
+        if not database:
             print(f"⚠️ База данных недоступна, возвращаем тестовые данные")
             # Возвращаем тестовые данные для демонстрации
             test_families = [
@@ -508,15 +574,13 @@ def get_families():
             print(f"✅ Возвращаем тестовые семьи: {len(test_families)}")
             return jsonify({"families": test_families})
         
-        cur = conn.cursor()
-        cur.execute("SELECT id, name FROM families ORDER BY name")
-        families = [{"id": row['id'], "name": row['name']} for row in cur.fetchall()]
-        
-        print(f"✅ Найдено семей: {len(families)}")
-        for family in families:
-            print(f"   • ID: {family['id']}, Название: {family['name']}")
-        
-        conn.close()
+        with database.cursor() as cur:
+            cur.execute("SELECT id, name FROM families ORDER BY name")
+            families = [{"id": row['id'], "name": row['name']} for row in cur.fetchall()]
+
+            print(f"✅ Найдено семей: {len(families)}")
+            for family in families:
+                print(f"   • ID: {family['id']}, Название: {family['name']}")
         return jsonify({"families": families})
         
     except Exception as e:
@@ -532,6 +596,7 @@ if __name__ == '__main__':
     print(f"   • GET /api/health - проверка здоровья")
     print(f"   • GET /api/families - список семей")
     print(f"   • GET /api/family/<id>/dashboard - дашборд семьи")
+    print(f"   • GET /api/family/<id>/stream - обновления дашборда (SSE)")
     print(f"   • GET /api/family/<id>/history - история семьи")
     print(f"   • GET /api/family/<id>/members - члены семьи")
     
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк дашборда семьи (/api/family/<id>/dashboard)
+
+Создаёт две временные базы с одними и теми же синтетическими событиями:
+прежнюю (схема из babybot_render.db, время только строкой ISO) и текущую
+(по миграциям бота). Сравнивает задержку прежней реализации (одиннадцать
+отдельных запросов по строкам timestamp) с одним агрегированным запросом
+и замеряет сам эндпоинт.
+
+    python benchmark_dashboard.py --families 200 --events 500 --requests 1000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+import api
+import clock
+import db
+import migrations
+
+# Прежняя реализация (как в api.py до перехода на один запрос): по запросу
+# на семью, настройки, каждое последнее событие, активный сон и каждый счётчик
+LEGACY_QUERIES = [
+    "SELECT name FROM families WHERE id = :family_id",
+    """SELECT feed_interval, diaper_interval, baby_age_months, baby_birth_date,
+              tips_enabled, bath_reminder_enabled, activity_reminder_enabled
+       FROM settings WHERE family_id = :family_id""",
+    "SELECT timestamp, author_role, author_name FROM feedings WHERE family_id = :family_id ORDER BY timestamp DESC LIMIT 1",
+    "SELECT timestamp, author_role, author_name FROM diapers WHERE family_id = :family_id ORDER BY timestamp DESC LIMIT 1",
+    "SELECT timestamp, author_role, author_name FROM baths WHERE family_id = :family_id ORDER BY timestamp DESC LIMIT 1",
+    "SELECT timestamp, activity_type, author_role, author_name FROM activities WHERE family_id = :family_id ORDER BY timestamp DESC LIMIT 1",
+    """SELECT start_time, author_role, author_name FROM sleep_sessions
+       WHERE family_id = :family_id AND is_active = 1 ORDER BY start_time DESC LIMIT 1""",
+    "SELECT COUNT(*) FROM feedings WHERE family_id = :family_id AND timestamp BETWEEN :start AND :end",
+    "SELECT COUNT(*) FROM diapers WHERE family_id = :family_id AND timestamp BETWEEN :start AND :end",
+    "SELECT COUNT(*) FROM baths WHERE family_id = :family_id AND timestamp BETWEEN :start AND :end",
+    "SELECT COUNT(*) FROM activities WHERE family_id = :family_id AND timestamp BETWEEN :start AND :end",
+]
+
+def legacy_dashboard(database, family_id, start, end):
+    params = {"family_id": family_id, "start": start, "end": end}
+    with database.cursor() as cur:
+        for sql in LEGACY_QUERIES:
+            cur.execute(sql, params)
+            cur.fetchone()
+
+def synthetic_events(families, events):
+    """Синтетические события: {(семья, таблица): [время, ...]}"""
+    now = clock.default.now()
+    return {
+        (family_id, table): [now - timedelta(minutes=random.randint(0, 60 * 24 * 60)) for _ in range(events)]
+        for family_id in range(1, families + 1)
+        for table in ("feedings", "diapers", "baths", "activities")
+    }
+
+def fill_database(conn, families, moments, epoch):
+    """Вставить семьи и события; epoch — есть ли колонки ts/start_ts и local_day"""
+    now = clock.default.now()
+    for family_id in range(1, families + 1):
+        conn.execute("INSERT INTO families (id, name) VALUES (?, ?)", (family_id, f"Семья {family_id}"))
+        conn.execute("INSERT INTO settings (family_id) VALUES (?)", (family_id,))
+        for table in ("feedings", "diapers", "baths", "activities"):
+            if epoch:
+                rows = [(family_id, m.isoformat(), int(m.timestamp()), m.date().isoformat())
+                        for m in moments[(family_id, table)]]
+                conn.executemany(f"INSERT INTO {table} (family_id, timestamp, ts, local_day) VALUES (?, ?, ?, ?)", rows)
+            else:
+                rows = [(family_id, m.isoformat()) for m in moments[(family_id, table)]]
+                conn.executemany(f"INSERT INTO {table} (family_id, timestamp) VALUES (?, ?)", rows)
+        if family_id % 3 == 0:
+            start = now - timedelta(minutes=40)
+            if epoch:
+                conn.execute(
+                    "INSERT INTO sleep_sessions (family_id, start_time, start_ts, is_active) VALUES (?, ?, ?, 1)",
+                    (family_id, start.isoformat(), int(start.timestamp()))
+                )
+            else:
+                conn.execute("INSERT INTO sleep_sessions (family_id, start_time, is_active) VALUES (?, ?, 1)",
+                             (family_id, start.isoformat()))
+    conn.commit()
+
+def build_database(path, families, events, moments=None):
+    """Текущая схема (миграции бота) с синтетическими семьями и событиями"""
+    manager = db.ConnectionManager(path)
+    migrations.migrate(manager)
+    manager.close()
+
+    conn = sqlite3.connect(path)
+    fill_database(conn, families, moments or synthetic_events(families, events), epoch=True)
+    conn.close()
+
+def build_legacy_database(path, schema_source, families, events, moments=None):
+    """Прежняя схема (таблицы и индексы из schema_source) с теми же событиями"""
+    source = sqlite3.connect(schema_source)
+    schema = [row[0] for row in source.execute(
+        "SELECT sql FROM sqlite_master WHERE type IN ('table', 'index') AND sql IS NOT NULL "
+        "AND name NOT LIKE 'sqlite_%'"
+    )]
+    source.close()
+
+    conn = sqlite3.connect(path)
+    for sql in schema:
+        conn.execute(sql)
+    fill_database(conn, families, moments or synthetic_events(families, events), epoch=False)
+    conn.close()
+
+def measure(name, func, family_ids, requests):
+    timings = []
+    for _ in range(requests):
+        family_id = random.choice(family_ids)
+        started = time.perf_counter()
+        func(family_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<28} среднее {statistics.mean(timings):7.3f} мс   "
+          f"медиана {statistics.median(timings):7.3f} мс   p95 {p95:7.3f} мс")
+    return statistics.mean(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк дашборда семьи")
+    parser.add_argument("--families", type=int, default=100)
+    parser.add_argument("--events", type=int, default=300, help="событий каждого вида на семью")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--period", default="week", choices=["today", "week", "month"])
+    parser.add_argument("--schema", default="babybot_render.db", help="база с прежней схемой")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "benchmark.db")
+    legacy_path = os.path.join(workdir, "legacy.db")
+    print(f"📦 Создаём базы: семей {args.families}, событий {args.events} каждого вида на семью")
+    moments = synthetic_events(args.families, args.events)
+    build_database(path, args.families, args.events, moments)
+    build_legacy_database(legacy_path, args.schema, args.families, args.events, moments)
+
+    database = db.ConnectionManager(path, row_factory=sqlite3.Row)
+    legacy = db.ConnectionManager(legacy_path, row_factory=sqlite3.Row)
+    family_ids = list(range(1, args.families + 1))
+    today = clock.default.today()
+    start_date, end_date = (today - timedelta(days=6)).isoformat(), today.isoformat()
+    # Прежний API сравнивал строки ISO с границами суток без пояса
+    legacy_start, legacy_end = f"{start_date}T00:00:00", f"{end_date}T23:59:59.999999"
+
+    before = measure("до: 11 запросов", lambda fid: legacy_dashboard(legacy, fid, legacy_start, legacy_end),
+                     family_ids, args.requests)
+    after = measure("после: 1 запрос", lambda fid: api.fetch_dashboard_row(database, fid, start_date, end_date),
+                    family_ids, args.requests)
+    print(f"⚡ Ускорение выборки: {before / after:.1f}x")
+
+    api.get_db = lambda: database
+    client = api.app.test_client()
+    measure("эндпоинт целиком", lambda fid: client.get(f"/api/family/{fid}/dashboard?period={args.period}"),
+            family_ids, args.requests)
+
+    database.close()
+    legacy.close()
+    os.remove(path)
+    os.remove(legacy_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк клиента PostgREST на локальной заглушке
+
+Поднимает в потоке HTTP-сервер, который отвечает как PostgREST (GET —
+массив строк, POST и PATCH — записанные строки), и сравнивает прежний
+способ (отдельный requests.get на каждый вызов, новое соединение) с
+postgrest.Client (пул соединений). Заглушка умеет добавлять задержку и
+отвечать 503 на каждый N-й запрос, чтобы проверить повторы. Заглушка
+работает без TLS на loopback, поэтому выигрыш здесь меньше, чем с Supabase,
+где новое соединение стоит ещё и TLS-рукопожатия.
+
+    python benchmark_postgrest.py --requests 500 --delay 5 --fail-every 20
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import postgrest
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Ответы в формате PostgREST; настройки берутся из атрибутов сервера"""
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят отдельными пакетами; без этого keep-alive упирается в delayed ACK
+    disable_nagle_algorithm = True
+
+    def _reply(self, status, body=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        with server.lock:
+            server.count += 1
+            count = server.count
+        if server.delay:
+            time.sleep(server.delay)
+        if server.fail_every and count % server.fail_every == 0:
+            self._reply(503, {"message": "stub: service unavailable"})
+            return
+        if self.command == "GET":
+            self._reply(200, [{"id": 1, "family_id": 1, "timestamp": "2025-01-01T09:00:00+07:00"}])
+        elif self.command in ("POST", "PATCH") and "return=representation" in (self.headers.get("Prefer") or ""):
+            rows = body if isinstance(body, list) else [body]
+            self._reply(201 if self.command == "POST" else 200, rows)
+        else:
+            self._reply(204)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub(delay=0.0, fail_every=0):
+    """Запустить заглушку на свободном порту; возвращает (сервер, базовый URL)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.delay = delay
+    server.fail_every = fail_every
+    server.count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def measure(name, func, requests_count):
+    timings = []
+    failures = 0
+    for _ in range(requests_count):
+        started = time.perf_counter()
+        try:
+            func()
+        except requests.exceptions.RequestException:
+            failures += 1
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<28} среднее {statistics.mean(timings):7.3f} мс   "
+          f"медиана {statistics.median(timings):7.3f} мс   p95 {p95:7.3f} мс   ошибок {failures}")
+    return statistics.mean(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк клиента PostgREST на заглушке")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--delay", type=float, default=0, help="задержка ответа заглушки, мс")
+    parser.add_argument("--fail-every", type=int, default=0, help="отвечать 503 на каждый N-й запрос")
+    args = parser.parse_args()
+
+    server, url = start_stub(args.delay / 1000, args.fail_every)
+    headers = {'apikey': 'stub', 'Authorization': 'Bearer stub'}
+    params = {'family_id': 'eq.1', 'order': 'timestamp.desc', 'limit': '1'}
+
+    def legacy():
+        response = requests.get(f"{url}/rest/v1/feedings", headers=headers, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    client = postgrest.Client(url, "stub", backoff=0.01)
+    before = measure("до: requests.get", legacy, args.requests)
+    after = measure("после: postgrest.Client", lambda: client.select("feedings", params), args.requests)
+    print(f"⚡ Ускорение: {before / after:.1f}x")
+    for name, stats in client.metrics().items():
+        print(f"📊 {name}: {stats}")
+
+    client.close()
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
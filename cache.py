@@ -0,0 +1,128 @@
+"""
+Кэш ответов API по семьям
+
+Каждая запись кэша помнит версию семьи, для которой она посчитана. Версия
+хранится в таблице family_versions и увеличивается триггерами при любой
+записи в таблицы семьи (события, сон, настройки, члены семьи), поэтому
+бот инвалидирует кэш API без прямой связи между процессами. Кэш ограничен
+по размеру (LRU) и по времени жизни записи (TTL).
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+API_CACHE_SIZE = int(os.getenv('API_CACHE_SIZE', '512'))
+API_CACHE_TTL = float(os.getenv('API_CACHE_TTL', '300'))
+
+# Таблица -> колонка с id семьи
+FAMILY_TABLES = {
+    "families": "id",
+    "family_members": "family_id",
+    "feedings": "family_id",
+    "diapers": "family_id",
+    "baths": "family_id",
+    "activities": "family_id",
+    "sleep_sessions": "family_id",
+    "settings": "family_id",
+}
+
+def _bump(ref, column):
+    return f"""
+        INSERT INTO family_versions (family_id, version) VALUES ({ref}.{column}, 1)
+        ON CONFLICT (family_id) DO UPDATE SET version = version + 1;
+    """
+
+def install_family_versions(cur):
+    """Создать таблицу версий семей и триггеры, увеличивающие версию при записи"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS family_versions (
+            family_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table, column in FAMILY_TABLES.items():
+        for op, event, body in (
+            ("i", "INSERT", _bump("NEW", column)),
+            # Запись могла перейти в другую семью — меняются обе версии
+            ("u", "UPDATE", _bump("OLD", column) + _bump("NEW", column)),
+            ("d", "DELETE", _bump("OLD", column)),
+        ):
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS family_version_{table}_{op} AFTER {event} ON {table}
+                WHEN {'OLD' if op == 'd' else 'NEW'}.{column} IS NOT NULL
+                BEGIN
+                    {body}
+                END
+            """)
+
+def family_version(manager, family_id):
+    """Текущая версия данных семьи
+
+    Для базы без таблицы версий (старая копия) версией служит время изменения
+    файла базы и её WAL, то есть кэш сбрасывается при любой записи.
+    """
+    try:
+        row = manager.fetchone("SELECT version FROM family_versions WHERE family_id = ?", (family_id,))
+        return row[0] if row else 0
+    except sqlite3.OperationalError:
+        return tuple(
+            os.path.getmtime(path) if os.path.exists(path) else None
+            for path in (manager.path, f"{manager.path}-wal")
+        )
+
+class ResponseCache:
+    """LRU-кэш с TTL; запись действительна, пока не изменилась версия семьи"""
+
+    def __init__(self, max_entries=API_CACHE_SIZE, ttl=API_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, version, load):
+        """Значение из кэша для версии или результат load(), который запоминается"""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        value = load()
+        with self._lock:
+            self._entries[key] = (version, now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def forget(self, key):
+        """Удалить запись (данные изменились раньше, чем истёк TTL)"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        """Сводка по кэшу"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+# Кэш по умолчанию для API
+default = ResponseCache()
@@ -0,0 +1,139 @@
+"""
+Часы бота: текущее время и часовые пояса семей
+
+Объекты часовых поясов (zoneinfo) создаются один раз на имя. Пояс семьи
+хранится в settings.timezone (NULL — пояс по умолчанию из BOT_TIMEZONE,
+Asia/Bangkok) и запоминается на FAMILY_TZ_TTL секунд или до вызова forget()
+после изменения настроек. Часы можно остановить и сдвигать вручную —
+для проверок и бенчмарков:
+
+    clock.default.freeze(datetime(2025, 1, 1, 9, 0, tzinfo=clock.UTC))
+    clock.default.advance(minutes=30)
+    clock.default.unfreeze()
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+UTC = timezone.utc
+
+# Пояс по умолчанию для семей без своей настройки
+DEFAULT_TIMEZONE = os.getenv('BOT_TIMEZONE', 'Asia/Bangkok')
+
+# Сколько секунд помнить пояс семьи (настройку мог изменить другой процесс)
+FAMILY_TZ_TTL = float(os.getenv('FAMILY_TZ_TTL', '300'))
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    """Часовой пояс по имени IANA или None, если такого пояса нет"""
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+def to_epoch(moment):
+    """Время с часовым поясом -> секунды UTC epoch (так время хранится в базе)"""
+    return int(moment.timestamp())
+
+class Clock:
+    """Текущее время в поясе семьи; loader(family_id) возвращает имя пояса семьи или None"""
+
+    def __init__(self, default_timezone=DEFAULT_TIMEZONE, loader=None, ttl=FAMILY_TZ_TTL):
+        self.default_zone = get_zone(default_timezone)
+        if self.default_zone is None:
+            print(f"⚠️ Неизвестный часовой пояс {default_timezone}, используем Asia/Bangkok")
+            self.default_zone = get_zone('Asia/Bangkok')
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._family_zones = {}
+        self._frozen = None
+
+    def zone(self, family_id=None):
+        """Часовой пояс семьи (или пояс по умолчанию)"""
+        if family_id is None or self.loader is None:
+            return self.default_zone
+        now = time.monotonic()
+        with self._lock:
+            entry = self._family_zones.get(family_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        try:
+            name = self.loader(family_id)
+        except Exception as e:
+            print(f"❌ Ошибка чтения часового пояса семьи {family_id}: {e}")
+            name = None
+        zone = get_zone(name) or self.default_zone
+        with self._lock:
+            self._family_zones[family_id] = (zone, now + self.ttl)
+        return zone
+
+    def forget(self, family_id=None):
+        """Сбросить запомненный пояс семьи (или всех семей)"""
+        with self._lock:
+            if family_id is None:
+                self._family_zones.clear()
+            else:
+                self._family_zones.pop(family_id, None)
+
+    def utcnow(self):
+        """Текущее время в UTC (остановленное, если часы заморожены)"""
+        frozen = self._frozen
+        return frozen if frozen is not None else datetime.now(UTC)
+
+    def now(self, family_id=None):
+        """Текущее время в поясе семьи"""
+        return self.utcnow().astimezone(self.zone(family_id))
+
+    def today(self, family_id=None):
+        """Текущая дата в поясе семьи"""
+        return self.now(family_id).date()
+
+    def timestamp(self):
+        """Текущее время в секундах UTC epoch"""
+        return to_epoch(self.utcnow())
+
+    def from_epoch(self, ts, family_id=None):
+        """Секунды UTC epoch -> время в поясе семьи"""
+        return datetime.fromtimestamp(ts, self.zone(family_id))
+
+    def localize(self, moment, family_id=None):
+        """Время без пояса считается местным для семьи; время с поясом переводится в него"""
+        zone = self.zone(family_id)
+        if moment.tzinfo is None:
+            return moment.replace(tzinfo=zone)
+        return moment.astimezone(zone)
+
+    def day_bounds(self, date, family_id=None):
+        """Границы местных суток в epoch: [начало, начало следующих суток)"""
+        start = self.localize(datetime.combine(date, datetime.min.time()), family_id)
+        end = self.localize(datetime.combine(date + timedelta(days=1), datetime.min.time()), family_id)
+        return to_epoch(start), to_epoch(end)
+
+    @property
+    def frozen(self):
+        return self._frozen is not None
+
+    def freeze(self, moment=None):
+        """Остановить часы на moment (по умолчанию — на текущем времени)"""
+        moment = moment or self.utcnow()
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=self.default_zone)
+        self._frozen = moment.astimezone(UTC)
+
+    def advance(self, **delta):
+        """Сдвинуть остановленные часы вперёд: advance(minutes=30)"""
+        if self._frozen is None:
+            self.freeze()
+        self._frozen += timedelta(**delta)
+
+    def unfreeze(self):
+        self._frozen = None
+
+# Часы по умолчанию; точки входа задают loader для поясов семей
+default = Clock()
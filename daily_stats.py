@@ -0,0 +1,130 @@
+"""
+Суточная статистика семей: daily_stats(family_id, day, kind, count, total_sleep_minutes)
+
+Таблица обновляется триггерами в той же транзакции, что и сама запись:
+добавление события увеличивает счётчик его дня, удаление (delete_entry)
+уменьшает, правка переносит событие между днями или семьями. Для сна
+учитывается и суммарная длительность завершённых сессий (по дню начала).
+День — колонка local_day события, то есть дата в часовом поясе семьи
+(строка времени может быть записана и в другом поясе, например в UTC).
+
+Заполнить таблицу по уже накопленным событиям:
+    python daily_stats.py --backfill [--db babybot.db]
+"""
+import argparse
+import sqlite3
+
+import db
+
+# Вид статистики (совпадает с таблицей) -> колонка времени события
+KINDS = {
+    "feedings": "timestamp",
+    "diapers": "timestamp",
+    "baths": "timestamp",
+    "activities": "timestamp",
+    "sleep_sessions": "start_time",
+}
+
+# Откуда берётся день события: local_day или (до миграции 8, когда колонки
+# ещё не было) первые 10 символов строки времени
+LOCAL_DAY = "local_day"
+ISO_DAY = "iso"
+
+def _day(table, ref, day):
+    if day == ISO_DAY:
+        return f"substr({ref}.{KINDS[table]}, 1, 10)"
+    return f"{ref}.local_day"
+
+def _sleep_minutes(ref):
+    return (f"COALESCE(CAST(ROUND((julianday({ref}.end_time) - julianday({ref}.start_time)) * 1440) AS INTEGER), 0)")
+
+def _change(table, ref, sign, day=LOCAL_DAY):
+    """SQL, добавляющий (sign=+1) или вычитающий (-1) событие строки ref"""
+    minutes = _sleep_minutes(ref) if table == "sleep_sessions" else "0"
+    return f"""
+        INSERT INTO daily_stats (family_id, kind, day, count, total_sleep_minutes)
+        SELECT {ref}.family_id, '{table}', {_day(table, ref, day)}, {sign}, {sign} * {minutes}
+        WHERE {ref}.family_id IS NOT NULL AND {_day(table, ref, day)} IS NOT NULL
+        ON CONFLICT (family_id, kind, day) DO UPDATE SET
+            count = count + excluded.count,
+            total_sleep_minutes = total_sleep_minutes + excluded.total_sleep_minutes;
+    """
+
+def _cleanup(ref, table, day=LOCAL_DAY):
+    # Дни, в которых не осталось событий, удаляем
+    return f"""
+        DELETE FROM daily_stats
+        WHERE family_id = {ref}.family_id AND kind = '{table}' AND day = {_day(table, ref, day)}
+          AND count <= 0;
+    """
+
+def drop_triggers(cur):
+    """Удалить триггеры (перед установкой с другим источником дня)"""
+    for table in KINDS:
+        for op in ("i", "u", "d"):
+            cur.execute(f"DROP TRIGGER IF EXISTS daily_stats_{table}_{op}")
+
+def install_daily_stats(cur, day=LOCAL_DAY):
+    """Создать таблицу и триггеры; возвращает True, если таблица только что создана"""
+    created = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_stats'"
+    ).fetchone() is None
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            family_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            total_sleep_minutes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (family_id, kind, day)
+        ) WITHOUT ROWID
+    """)
+    for table in KINDS:
+        for op, event, body in (
+            ("i", "INSERT", _change(table, "NEW", 1, day)),
+            ("u", "UPDATE", _change(table, "OLD", -1, day) + _cleanup("OLD", table, day) + _change(table, "NEW", 1, day)),
+            ("d", "DELETE", _change(table, "OLD", -1, day) + _cleanup("OLD", table, day)),
+        ):
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS daily_stats_{table}_{op} AFTER {event} ON {table}
+                BEGIN
+                    {body}
+                END
+            """)
+    return created
+
+def backfill(cur, day=LOCAL_DAY):
+    """Пересчитать таблицу заново по всем событиям; возвращает число строк"""
+    cur.execute("DELETE FROM daily_stats")
+    for table in KINDS:
+        minutes = _sleep_minutes(table) if table == "sleep_sessions" else "0"
+        day_sql = _day(table, table, day)
+        cur.execute(f"""
+            INSERT INTO daily_stats (family_id, kind, day, count, total_sleep_minutes)
+            SELECT family_id, '{table}', {day_sql}, COUNT(*), SUM({minutes})
+            FROM {table}
+            WHERE family_id IS NOT NULL AND {day_sql} IS NOT NULL
+            GROUP BY family_id, {day_sql}
+        """)
+    return cur.execute("SELECT COUNT(*) FROM daily_stats").fetchone()[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Суточная статистика семей")
+    parser.add_argument("--db", default=db.DB_PATH, help="путь к базе")
+    parser.add_argument("--backfill", action="store_true", help="пересчитать статистику по всем событиям")
+    args = parser.parse_args()
+
+    manager = db.ConnectionManager(args.db)
+    try:
+        with manager.cursor() as cur:
+            install_daily_stats(cur)
+            if args.backfill:
+                rows = backfill(cur)
+                print(f"✅ Статистика пересчитана: {rows} строк в daily_stats")
+            else:
+                print("ℹ️ Таблица и триггеры daily_stats на месте; для пересчёта добавьте --backfill")
+    except sqlite3.Error as e:
+        print(f"❌ Ошибка: {e}")
+        raise SystemExit(1)
+    finally:
+        manager.close()
@@ -0,0 +1,154 @@
+"""
+Общий слой подключений к SQLite для бота и API
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Путь к основной базе данных бота
+DB_PATH = os.getenv('BABYBOT_DB_PATH', 'babybot.db')
+
+# Настройки, которые применяются один раз при открытии соединения
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+)
+
+class ConnectionManager:
+    """Держит одно соединение на поток и переиспользует его между запросами.
+
+    С pool_size > 0 соединения, возвращённые через release(), складываются
+    в общий пул и достаются следующим потокам — так сервер, который заводит
+    новый поток на каждый запрос (Flask), не открывает соединение заново.
+    """
+
+    def __init__(self, path=DB_PATH, row_factory=None, pool_size=0):
+        self.path = path
+        self.row_factory = row_factory
+        self._local = threading.local()
+        self._pool = queue.LifoQueue(pool_size) if pool_size > 0 else None
+
+    def open(self):
+        """Открыть новое соединение и применить PRAGMA"""
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=self._pool is None)
+        for pragma in PRAGMAS:
+            try:
+                conn.execute(pragma)
+            except sqlite3.OperationalError as e:
+                # Например, WAL недоступен для базы только на чтение
+                print(f"⚠️ {pragma}: {e}")
+        if self.row_factory is not None:
+            conn.row_factory = self.row_factory
+        return conn
+
+    def connection(self):
+        """Получить соединение текущего потока (из пула или новое при первом обращении)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self._pool is not None:
+                try:
+                    conn = self._pool.get_nowait()
+                except queue.Empty:
+                    pass
+            if conn is None:
+                conn = self.open()
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def cursor(self):
+        """Курсор на общем соединении; коммит/откат выполняет только внешний блок"""
+        conn = self.connection()
+        cur = conn.cursor()
+        self._local.depth += 1
+        failed = True
+        try:
+            yield cur
+            failed = False
+        finally:
+            # Глубина уменьшается при любом выходе, в том числе при отмене задачи
+            # (CancelledError) или KeyboardInterrupt — иначе внешний блок не закоммитит
+            self._local.depth -= 1
+            try:
+                if self._local.depth == 0 and conn.in_transaction:
+                    if failed:
+                        conn.rollback()
+                    else:
+                        conn.commit()
+            finally:
+                cur.close()
+
+    def execute(self, sql, params=()):
+        """Выполнить изменяющий запрос и вернуть lastrowid"""
+        with self.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.lastrowid
+
+    def fetchone(self, sql, params=()):
+        """Выполнить запрос и вернуть первую строку"""
+        with self.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchone()
+
+    def fetchall(self, sql, params=()):
+        """Выполнить запрос и вернуть все строки"""
+        with self.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def checkpoint(self):
+        """Перенести содержимое WAL в основной файл базы (перед копированием файла)"""
+        try:
+            self.connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ Ошибка checkpoint для {self.path}: {e}")
+
+    def release(self):
+        """Отдать соединение текущего потока в пул (без пула или при переполнении — закрыть)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        if self._pool is not None and self._local.depth == 0:
+            try:
+                self._pool.put_nowait(conn)
+                return
+            except queue.Full:
+                pass
+        conn.close()
+
+    def close(self):
+        """Закрыть соединение текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+# Менеджер по умолчанию для babybot.db
+default = ConnectionManager()
+
+def connection():
+    return default.connection()
+
+def cursor():
+    return default.cursor()
+
+def execute(sql, params=()):
+    return default.execute(sql, params)
+
+def fetchone(sql, params=()):
+    return default.fetchone(sql, params)
+
+def fetchall(sql, params=()):
+    return default.fetchall(sql, params)
+
+def checkpoint():
+    default.checkpoint()
@@ -4,6 +4,9 @@ class BabyCareBot {
         this.currentUser = null;
         this.currentFamily = null;
         this.chart = null;
+        this.dashboard = null;
+        this.eventSource = null;
+        this.streamConnected = false;
         this.init();
     }
 
@@ -52,14 +55,52 @@ class BabyCareBot {
     }
 
     setupAutoRefresh() {
-        // Обновляем данные каждые 30 секунд
+        // Обновления приходят через поток SSE; пока он не работает, опрашиваем каждые 30 секунд
         setInterval(() => {
-            if (this.currentFamily) {
+            if (this.currentFamily && !this.streamConnected) {
                 this.loadDashboardData();
             }
         }, 30000);
     }
 
+    connectStream() {
+        this.disconnectStream();
+        if (!window.EventSource || !this.currentFamily) return;
+
+        const source = new EventSource(`${window.APP_CONFIG.API_BASE_URL}/family/${this.currentFamily.id}/stream`);
+
+        // Полный дашборд приходит при каждом (пере)подключении, дальше — только изменившиеся разделы
+        source.addEventListener('dashboard', (event) => {
+            this.streamConnected = true;
+            this.dashboard = JSON.parse(event.data);
+            this.renderDashboard(this.dashboard);
+        });
+
+        source.addEventListener('delta', (event) => {
+            if (!this.dashboard) return;
+            Object.assign(this.dashboard, JSON.parse(event.data));
+            this.renderDashboard(this.dashboard);
+        });
+
+        source.onerror = () => {
+            // Пока поток переподключается или недоступен, работает опрос
+            this.streamConnected = false;
+            if (source.readyState === EventSource.CLOSED) {
+                this.eventSource = null;
+            }
+        };
+
+        this.eventSource = source;
+    }
+
+    disconnectStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+        this.streamConnected = false;
+    }
+
     async handleLogin() {
         const familyName = document.getElementById('family-name').value.trim();
         const userName = document.getElementById('user-name-input').value.trim();
@@ -175,6 +216,7 @@ class BabyCareBot {
                 this.loadFamilyMembers(),
                 this.loadHistoryChart()
             ]);
+            this.connectStream();
         } catch (error) {
             console.error('Ошибка загрузки данных семьи:', error);
         }
@@ -185,15 +227,20 @@ class BabyCareBot {
             const response = await fetch(`${window.APP_CONFIG.API_BASE_URL}/family/${this.currentFamily.id}/dashboard`);
             const data = await response.json();
             
-            this.updateStats(data.today_stats);
-            this.updateLastEvents(data.last_events);
-            this.updateSleepStatus(data.sleep);
+            this.dashboard = data;
+            this.renderDashboard(data);
             
         } catch (error) {
             console.error('Ошибка загрузки дашборда:', error);
         }
     }
 
+    renderDashboard(data) {
+        this.updateStats(data.today_stats);
+        this.updateLastEvents(data.last_events);
+        this.updateSleepStatus(data.sleep);
+    }
+
     async loadFamilyMembers() {
         try {
             const response = await fetch(`${window.APP_CONFIG.API_BASE_URL}/family/${this.currentFamily.id}/members`);
@@ -524,6 +571,7 @@ class BabyCareBot {
     }
 
     handleLogout() {
+        this.disconnectStream();
         localStorage.removeItem('babycarebot_user');
         localStorage.removeItem('babycarebot_family');
         this.currentUser = null;
@@ -0,0 +1,155 @@
+"""
+Индекс последних событий семьи в памяти
+
+Для каждой семьи хранится последнее кормление, смена подгузника, купание,
+активность (по каждому типу) и активная сессия сна. Индекс прогревается
+одним проходом по базе при запуске и обновляется при каждой записи, поэтому
+напоминания и дашборд не делают запросов вида ORDER BY ts DESC LIMIT 1.
+События сравниваются по ts (секунды UTC epoch), строка ISO хранится для отображения.
+"""
+import threading
+
+import db
+
+# Вид события -> таблица
+TABLES = {
+    "feeding": "feedings",
+    "diaper": "diapers",
+    "bath": "baths",
+    "activity": "activities",
+}
+
+class LastEventIndex:
+    """family_id -> последнее событие каждого вида и активный сон"""
+
+    def __init__(self, manager=None):
+        self.manager = manager or db.default
+        self._lock = threading.Lock()
+        self._last = {}
+        self._sleep = {}
+
+    @staticmethod
+    def _key(kind, activity_type=None):
+        # Активности различаются по типу, остальные события — только по виду
+        return (kind, activity_type) if kind == "activity" else (kind, None)
+
+    def warm(self):
+        """Заполнить индекс из базы (по одному запросу на таблицу)"""
+        last = {}
+        for kind, table in TABLES.items():
+            type_column = "activity_type" if kind == "activity" else "NULL"
+            group = "family_id, activity_type" if kind == "activity" else "family_id"
+            # SQLite берёт остальные колонки из строки с MAX(ts)
+            rows = self.manager.fetchall(f"""
+                SELECT family_id, {type_column}, MAX(ts), timestamp, author_role, author_name
+                FROM {table}
+                GROUP BY {group}
+            """)
+            for family_id, activity_type, ts, timestamp, role, name in rows:
+                last.setdefault(family_id, {})[self._key(kind, activity_type)] = {
+                    "timestamp": timestamp,
+                    "ts": ts,
+                    "activity_type": activity_type,
+                    "author_role": role,
+                    "author_name": name,
+                }
+
+        sleep = {}
+        rows = self.manager.fetchall("""
+            SELECT family_id, id, start_time, start_ts, author_role, author_name
+            FROM sleep_sessions WHERE is_active = 1
+            ORDER BY start_ts
+        """)
+        for family_id, session_id, start_time, start_ts, role, name in rows:
+            sleep[family_id] = {
+                "id": session_id,
+                "start_time": start_time,
+                "start_ts": start_ts,
+                "author_role": role,
+                "author_name": name,
+            }
+
+        with self._lock:
+            self._last = last
+            self._sleep = sleep
+        print(f"✅ Индекс последних событий прогрет: семей {len(last)}, активных снов {len(sleep)}")
+
+    def record(self, family_id, kind, timestamp, ts, author_role=None, author_name=None, activity_type=None):
+        """Учесть новое событие (timestamp — строка ISO, ts — секунды epoch, как в базе)"""
+        entry = {
+            "timestamp": timestamp,
+            "ts": ts,
+            "activity_type": activity_type,
+            "author_role": author_role,
+            "author_name": author_name,
+        }
+        key = self._key(kind, activity_type)
+        with self._lock:
+            events = self._last.setdefault(family_id, {})
+            current = events.get(key)
+            # Запись задним числом не должна вытеснять более позднее событие
+            if current is None or ts >= current["ts"]:
+                events[key] = entry
+
+    def refresh(self, family_id, kind):
+        """Перечитать последнее событие вида из базы (после удаления или правки)"""
+        table = TABLES[kind]
+        type_column = "activity_type" if kind == "activity" else "NULL"
+        group = "GROUP BY activity_type" if kind == "activity" else ""
+        rows = self.manager.fetchall(f"""
+            SELECT {type_column}, MAX(ts), timestamp, author_role, author_name
+            FROM {table}
+            WHERE family_id = ?
+            {group}
+        """, (family_id,))
+        with self._lock:
+            events = self._last.setdefault(family_id, {})
+            for key in [k for k in events if k[0] == kind]:
+                del events[key]
+            for activity_type, ts, timestamp, role, name in rows:
+                if ts is None:
+                    continue
+                events[self._key(kind, activity_type)] = {
+                    "timestamp": timestamp,
+                    "ts": ts,
+                    "activity_type": activity_type,
+                    "author_role": role,
+                    "author_name": name,
+                }
+
+    def last(self, family_id, kind, activity_type=None):
+        """Последнее событие вида или None; для активностей без типа — последняя любого типа"""
+        with self._lock:
+            events = self._last.get(family_id, {})
+            if kind == "activity" and activity_type is None:
+                entries = [e for k, e in events.items() if k[0] == "activity"]
+                return dict(max(entries, key=lambda e: e["ts"])) if entries else None
+            entry = events.get(self._key(kind, activity_type))
+            return dict(entry) if entry else None
+
+    def last_time(self, family_id, kind, activity_type=None):
+        """Время последнего события вида (строка ISO) или None"""
+        entry = self.last(family_id, kind, activity_type)
+        return entry["timestamp"] if entry else None
+
+    def last_ts(self, family_id, kind, activity_type=None):
+        """Время последнего события вида (секунды epoch) или None"""
+        entry = self.last(family_id, kind, activity_type)
+        return entry["ts"] if entry else None
+
+    def set_active_sleep(self, family_id, session):
+        """Запомнить начавшийся сон (словарь) или его окончание (None)"""
+        with self._lock:
+            if session is None:
+                self._sleep.pop(family_id, None)
+            else:
+                self._sleep[family_id] = dict(session)
+
+    def active_sleep(self, family_id):
+        """Активная сессия сна семьи или None"""
+        with self._lock:
+            session = self._sleep.get(family_id)
+            return dict(session) if session else None
+
+# Индекс по умолчанию для babybot.db
+default = LastEventIndex()
@@ -2,14 +2,19 @@ from telethon import TelegramClient, events, Button
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import asyncio
-import sqlite3
-import random
 import threading
 import time
 import http.server
 import socketserver
-import pytz
-import subprocess
+import clock
+import db
+import replication
+import migrations
+import last_events
+import reminders
+import notifications
+import tips
+import json
 
 # Конфигурация (загружается из переменных окружения)
 import os
@@ -42,38 +47,35 @@ except ValueError:
 
 print("✅ Все переменные окружения загружены успешно")
 
-# Функция для получения тайского времени
-def get_thai_time():
-    """Получить текущее время в тайском часовом поясе"""
-    thai_tz = pytz.timezone('Asia/Bangkok')
-    utc_now = datetime.now(pytz.UTC)
-    thai_now = utc_now.astimezone(thai_tz)
-    return thai_now
+# Время бота: часовой пояс семьи из настроек, по умолчанию тайский
+def get_thai_time(family_id=None):
+    """Получить текущее время в часовом поясе семьи (по умолчанию тайском)"""
+    return clock.default.now(family_id)
 
-def get_thai_date():
-    """Получить текущую дату в тайском часовом поясе"""
-    return get_thai_time().date()
+def to_epoch(moment):
+    """Время с часовым поясом -> секунды UTC epoch (так время хранится в базе)"""
+    return clock.to_epoch(moment)
+
+def from_epoch(ts, family_id=None):
+    """Секунды UTC epoch -> время в поясе семьи"""
+    return clock.default.from_epoch(ts, family_id)
+
+def day_bounds(date, family_id=None):
+    """Границы местных суток семьи в epoch: [начало, начало следующих суток)"""
+    return clock.default.day_bounds(date, family_id)
+
+def get_thai_date(family_id=None):
+    """Получить текущую дату в часовом поясе семьи (по умолчанию тайском)"""
+    return get_thai_time(family_id).date()
 
 def sync_to_render():
-    """Синхронизирует локальную базу данных с Render в фоновом режиме"""
-    def sync_worker():
-        try:
-            # Копируем базу данных
-            import shutil
-            shutil.copy2("babybot.db", "babybot_render.db")
-            
-            # Добавляем в Git и отправляем
-            subprocess.run(["git", "add", "babybot_render.db"], check=True, capture_output=True)
-            subprocess.run(["git", "commit", "-m", f"Auto-sync: {datetime.now().strftime('%H:%M:%S')}"], check=True, capture_output=True)
-            subprocess.run(["git", "push", "origin", "main"], check=True, capture_output=True)
-            
-            print("✅ Данные синхронизированы с Render")
-        except Exception as e:
-            print(f"⚠️ Ошибка синхронизации с Render: {e}")
-    
-    # Запускаем синхронизацию в отдельном потоке
-    thread = threading.Thread(target=sync_worker, daemon=True)
-    thread.start()
+    """Отмечает изменение базы; репликация в Render выполняется пакетно в фоне"""
+    replication.default.notify()
+
+def settings_changed(family_id, names=None):
+    """После фиксации записи настроек или состава семьи: напоминания и репликация"""
+    refresh_reminders(family_id, names)
+    sync_to_render()
 
 # Функция для внешнего keep-alive (для Render)
 def external_keep_alive():
@@ -107,313 +109,56 @@ def external_keep_alive():
         print(f"❌ External keep-alive critical error: {e}")
 
 client = TelegramClient('babybot', API_ID, API_HASH).start(bot_token=BOT_TOKEN)
+notifications.outbound.client = client
 
 # Инициализация базы данных
 def init_db():
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    # Создание таблиц (если их нет)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS families (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL
-        )
-    """)
-    
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS family_members (
-            family_id INTEGER,
-            user_id INTEGER,
-            role TEXT DEFAULT 'Родитель',
-            name TEXT DEFAULT 'Неизвестно',
-            FOREIGN KEY (family_id) REFERENCES families (id)
-        )
-    """)
-    
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS feedings (
-            id INTEGER PRIMARY KEY,
-            family_id INTEGER,
-            author_id INTEGER,
-            timestamp TEXT NOT NULL,
-            author_role TEXT DEFAULT 'Родитель',
-            author_name TEXT DEFAULT 'Неизвестно',
-            FOREIGN KEY (family_id) REFERENCES families (id)
-        )
-    """)
-    
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS diapers (
-            id INTEGER PRIMARY KEY,
-            family_id INTEGER,
-            author_id INTEGER,
-            timestamp TEXT NOT NULL,
-            author_role TEXT DEFAULT 'Родитель',
-            author_name TEXT DEFAULT 'Неизвестно',
-            FOREIGN KEY (family_id) REFERENCES families (id)
-        )
-    """)
-    
-    # Новая таблица для купания
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS baths (
-            id INTEGER PRIMARY KEY,
-            family_id INTEGER,
-            author_id INTEGER,
-            timestamp TEXT NOT NULL,
-            author_role TEXT DEFAULT 'Родитель',
-            author_name TEXT DEFAULT 'Неизвестно',
-            FOREIGN KEY (family_id) REFERENCES families (id)
-        )
-    """)
-    
-    # Новая таблица для игр и выкладывания на живот
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS activities (
-            id INTEGER PRIMARY KEY,
-            family_id INTEGER,
-            author_id INTEGER,
-            timestamp TEXT NOT NULL,
-            activity_type TEXT DEFAULT 'tummy_time',
-            author_role TEXT DEFAULT 'Родитель',
-            author_name TEXT DEFAULT 'Неизвестно',
-            FOREIGN KEY (family_id) REFERENCES families (id)
-        )
-    """)
-    
-    # Новая таблица для сна
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS sleep_sessions (
-            id INTEGER PRIMARY KEY,
-            family_id INTEGER,
-            author_id INTEGER,
-            start_time TEXT NOT NULL,
-            end_time TEXT,
-            is_active INTEGER DEFAULT 1,
-            author_role TEXT DEFAULT 'Родитель',
-            author_name TEXT DEFAULT 'Неизвестно',
-            FOREIGN KEY (family_id) REFERENCES families (id)
-        )
-    """)
-    
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS settings (
-            family_id INTEGER,
-            feed_interval INTEGER DEFAULT 3,
-            diaper_interval INTEGER DEFAULT 2,
-            tips_enabled INTEGER DEFAULT 1,
-            tips_time_hour INTEGER DEFAULT 9,
-            tips_time_minute INTEGER DEFAULT 0,
-            bath_reminder_enabled INTEGER DEFAULT 1,
-            bath_reminder_hour INTEGER DEFAULT 19,
-            bath_reminder_minute INTEGER DEFAULT 0,
-            bath_reminder_period INTEGER DEFAULT 1,
-            activity_reminder_enabled INTEGER DEFAULT 1,
-            activity_reminder_interval INTEGER DEFAULT 2,
-            sleep_monitoring_enabled INTEGER DEFAULT 1,
-            baby_age_months INTEGER DEFAULT 0,
-            birth_date TEXT,
-            FOREIGN KEY (family_id) REFERENCES families (id)
-        )
-    """)
-    
-    # Добавляем новые колонки к существующей таблице settings, если их нет
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN tips_time_hour INTEGER DEFAULT 9")
-        print("✅ Добавлена колонка tips_time_hour")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка tips_time_hour уже существует")
-    
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN tips_time_minute INTEGER DEFAULT 0")
-        print("✅ Добавлена колонка tips_time_minute")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка tips_time_minute уже существует")
-    
-    # Добавляем новые колонки для купания
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN bath_reminder_enabled INTEGER DEFAULT 1")
-        print("✅ Добавлена колонка bath_reminder_enabled")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка bath_reminder_enabled уже существует")
-    
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN bath_reminder_hour INTEGER DEFAULT 19")
-        print("✅ Добавлена колонка bath_reminder_hour")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка bath_reminder_hour уже существует")
-    
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN bath_reminder_minute INTEGER DEFAULT 0")
-        print("✅ Добавлена колонка bath_reminder_minute")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка bath_reminder_minute уже существует")
-    
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN bath_reminder_period INTEGER DEFAULT 1")
-        print("✅ Добавлена колонка bath_reminder_period")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка bath_reminder_period уже существует")
-    
-    # Добавляем колонки для игр
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN activity_reminder_enabled INTEGER DEFAULT 1")
-        print("✅ Добавлена колонка activity_reminder_enabled")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка activity_reminder_enabled уже существует")
-    
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN activity_reminder_interval INTEGER DEFAULT 2")
-        print("✅ Добавлена колонка activity_reminder_interval")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка activity_reminder_interval уже существует")
-    
-    # Добавляем колонки для сна
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN sleep_monitoring_enabled INTEGER DEFAULT 1")
-        print("✅ Добавлена колонка sleep_monitoring_enabled")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка sleep_monitoring_enabled уже существует")
-    
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN baby_age_months INTEGER DEFAULT 0")
-        print("✅ Добавлена колонка baby_age_months")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка baby_age_months уже существует")
-    
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN baby_birth_date TEXT")
-        print("✅ Добавлена колонка baby_birth_date")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка baby_birth_date уже существует")
-    
-    try:
-        cur.execute("ALTER TABLE settings ADD COLUMN birth_date TEXT")
-        print("✅ Добавлена колонка birth_date")
-    except sqlite3.OperationalError:
-        print("ℹ️ Колонка birth_date уже существует")
-    
-    # Обновляем существующие записи, устанавливая значения по умолчанию
-    cur.execute("UPDATE settings SET tips_time_hour = 9 WHERE tips_time_hour IS NULL")
-    cur.execute("UPDATE settings SET tips_time_minute = 0 WHERE tips_time_minute IS NULL")
-    cur.execute("UPDATE settings SET bath_reminder_enabled = 1 WHERE bath_reminder_enabled IS NULL")
-    cur.execute("UPDATE settings SET bath_reminder_hour = 19 WHERE bath_reminder_hour IS NULL")
-    cur.execute("UPDATE settings SET bath_reminder_minute = 0 WHERE bath_reminder_minute IS NULL")
-    cur.execute("UPDATE settings SET bath_reminder_period = 1 WHERE bath_reminder_period IS NULL")
-    cur.execute("UPDATE settings SET activity_reminder_enabled = 1 WHERE activity_reminder_enabled IS NULL")
-    cur.execute("UPDATE settings SET activity_reminder_interval = 2 WHERE activity_reminder_enabled IS NULL")
-    cur.execute("UPDATE settings SET sleep_monitoring_enabled = 1 WHERE sleep_monitoring_enabled IS NULL")
-    cur.execute("UPDATE settings SET baby_age_months = 0 WHERE baby_age_months IS NULL")
-    
-    # Миграция таблиц feedings и diapers
-    try:
-        # Проверяем, есть ли колонка family_id в таблице feedings
-        cur.execute("PRAGMA table_info(feedings)")
-        columns = [col[1] for col in cur.fetchall()]
-        
-        if 'family_id' not in columns:
-            print("🔄 Мигрируем таблицу feedings...")
-            # Создаем временную таблицу с новой структурой
-            cur.execute("""
-                CREATE TABLE feedings_new (
-                    id INTEGER PRIMARY KEY,
-                    family_id INTEGER,
-                    author_id INTEGER,
-                    timestamp TEXT NOT NULL,
-                    author_role TEXT DEFAULT 'Родитель',
-                    author_name TEXT DEFAULT 'Неизвестно',
-                    FOREIGN KEY (family_id) REFERENCES families (id)
-                )
-            """)
-            
-            # Копируем данные из старой таблицы
-            cur.execute("SELECT id, user_id, timestamp FROM feedings")
-            old_data = cur.fetchall()
-            
-            for row in old_data:
-                # Для каждой записи создаем временную семью
-                temp_family_id = create_family(f"Миграция {row[0]}", row[1])
-                cur.execute("INSERT INTO feedings_new (family_id, author_id, timestamp, author_role, author_name) VALUES (?, ?, ?, ?, ?)",
-                           (temp_family_id, row[1], row[2], 'Родитель', 'Неизвестно'))
-            
-            # Удаляем старую таблицу и переименовываем новую
-            cur.execute("DROP TABLE feedings")
-            cur.execute("ALTER TABLE feedings_new RENAME TO feedings")
-            print("✅ Таблица feedings мигрирована")
-        else:
-            print("ℹ️ Таблица feedings уже имеет правильную структуру")
-            
-    except sqlite3.OperationalError as e:
-        print(f"ℹ️ Миграция feedings: {e}")
-    
-    try:
-        # Проверяем, есть ли колонка family_id в таблице diapers
-        cur.execute("PRAGMA table_info(diapers)")
-        columns = [col[1] for col in cur.fetchall()]
-        
-        if 'family_id' not in columns:
-            print("🔄 Мигрируем таблицу diapers...")
-            # Создаем временную таблицу с новой структурой
-            cur.execute("""
-                CREATE TABLE diapers_new (
-                    id INTEGER PRIMARY KEY,
-                    family_id INTEGER,
-                    author_id INTEGER,
-                    timestamp TEXT NOT NULL,
-                    author_role TEXT DEFAULT 'Родитель',
-                    author_name TEXT DEFAULT 'Неизвестно',
-                    FOREIGN KEY (family_id) REFERENCES families (id)
-                )
-            """)
-            
-            # Копируем данные из старой таблицы
-            cur.execute("SELECT id, user_id, timestamp FROM diapers")
-            old_data = cur.fetchall()
-            
-            for row in old_data:
-                # Для каждой записи создаем временную семью
-                temp_family_id = create_family(f"Миграция {row[0]}", row[1])
-                cur.execute("INSERT INTO diapers_new (family_id, author_id, timestamp, author_role, author_name) VALUES (?, ?, ?, ?, ?)",
-                           (temp_family_id, row[1], row[2], 'Родитель', 'Неизвестно'))
-            
-            # Удаляем старую таблицу и переименовываем новую
-            cur.execute("DROP TABLE diapers")
-            cur.execute("ALTER TABLE diapers_new RENAME TO diapers")
-            print("✅ Таблица diapers мигрирована")
-        else:
-            print("ℹ️ Таблица diapers уже имеет правильную структуру")
-            
-    except sqlite3.OperationalError as e:
-        print(f"ℹ️ Миграция diapers: {e}")
-    
-    conn.commit()
-    conn.close()
+    """Создать или обновить схему базы (версионные миграции)"""
+    migrations.migrate(db.default)
     print("✅ База данных инициализирована/обновлена")
 
+def get_family_timezone(family_id):
+    """Имя часового пояса семьи из настроек (None — пояс по умолчанию)"""
+    with db.cursor() as cur:
+        cur.execute("SELECT timezone FROM settings WHERE family_id = ?", (family_id,))
+        result = cur.fetchone()
+    return result[0] if result else None
+
+def set_family_timezone(family_id, name):
+    """Установить часовой пояс семьи; False, если пояс неизвестен"""
+    if name and clock.get_zone(name) is None:
+        return False
+    with db.cursor() as cur:
+        cur.execute("UPDATE settings SET timezone = ? WHERE family_id = ?", (name or None, family_id))
+    clock.default.forget(family_id)
+    settings_changed(family_id)
+    return True
+
+clock.default.loader = get_family_timezone
+
 # Функции для работы с базой данных
 def get_family_id(user_id):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT family_id FROM family_members WHERE user_id = ?", (user_id,))
-    result = cur.fetchone()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("SELECT family_id FROM family_members WHERE user_id = ?", (user_id,))
+        result = cur.fetchone()
     family_id = result[0] if result else None
     print(f"DEBUG: get_family_id({user_id}) = {family_id}")
     return family_id
 
-def create_family(name, user_id):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
+def insert_family(cur, name, user_id):
+    """Создать семью, её первого члена и настройки в транзакции вызывающего"""
     cur.execute("INSERT INTO families (name) VALUES (?)", (name,))
     family_id = cur.lastrowid
-    
+
     cur.execute("INSERT INTO family_members (family_id, user_id) VALUES (?, ?)", (family_id, user_id))
     cur.execute("INSERT INTO settings (family_id) VALUES (?)", (family_id,))
-    
-    conn.commit()
-    conn.close()
+    return family_id
+
+def create_family(name, user_id):
+    with db.cursor() as cur:
+        family_id = insert_family(cur, name, user_id)
+    # Напоминания читают базу, поэтому пересчитываются только после фиксации
+    settings_changed(family_id)
     return family_id
 
 def get_birth_date(family_id):
@@ -428,29 +173,25 @@ def join_family_by_code(code, user_id):
     """Присоединить пользователя к семье по коду приглашения"""
     try:
         family_id = int(code)
-        conn = sqlite3.connect("babybot.db")
-        cur = conn.cursor()
-        
-        # Проверяем, существует ли семья
-        cur.execute("SELECT id, name FROM families WHERE id = ?", (family_id,))
-        family = cur.fetchone()
-        
-        if not family:
-            conn.close()
-            return None, "Семья не найдена"
-        
-        # Проверяем, не состоит ли пользователь уже в семье
-        cur.execute("SELECT family_id FROM family_members WHERE user_id = ?", (user_id,))
-        existing = cur.fetchone()
-        
-        if existing:
-            conn.close()
-            return None, "Вы уже состоите в семье"
-        
-        # Добавляем пользователя в семью
-        cur.execute("INSERT INTO family_members (family_id, user_id) VALUES (?, ?)", (family_id, user_id))
-        conn.commit()
-        conn.close()
+        with db.cursor() as cur:
+            # Проверяем, существует ли семья
+            cur.execute("SELECT id, name FROM families WHERE id = ?", (family_id,))
+            family = cur.fetchone()
+
+            if not family:
+                return None, "Семья не найдена"
+
+            # Проверяем, не состоит ли пользователь уже в семье
+            cur.execute("SELECT family_id FROM family_members WHERE user_id = ?", (user_id,))
+            existing = cur.fetchone()
+
+            if existing:
+                return None, "Вы уже состоите в семье"
+
+            # Добавляем пользователя в семью
+            cur.execute("INSERT INTO family_members (family_id, user_id) VALUES (?, ?)", (family_id, user_id))
+        load_reminder_contexts(family_id)
+        sync_to_render()
         
         return family_id, family[1]  # family_id, family_name
     except ValueError:
@@ -464,254 +205,222 @@ def invite_code_for(family_id):
 
 def get_family_name(family_id):
     """Получить название семьи по ID"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT name FROM families WHERE id = ?", (family_id,))
-    result = cur.fetchone()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("SELECT name FROM families WHERE id = ?", (family_id,))
+        result = cur.fetchone()
     return result[0] if result else "Неизвестная семья"
 
 def get_member_info(user_id):
     """Получить информацию о члене семьи"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT role, name FROM family_members WHERE user_id = ?", (user_id,))
-    result = cur.fetchone()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("SELECT role, name FROM family_members WHERE user_id = ?", (user_id,))
+        result = cur.fetchone()
     if result:
         return result[0], result[1]  # role, name
     return "Родитель", "Неизвестно"
 
 def set_member_role(user_id, role, name):
     """Установить роль и имя для члена семьи"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("UPDATE family_members SET role = ?, name = ? WHERE user_id = ?", (role, name, user_id))
-    conn.commit()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("UPDATE family_members SET role = ?, name = ? WHERE user_id = ?", (role, name, user_id))
+    sync_to_render()
 
 def get_family_members_with_roles(family_id):
     """Получить всех членов семьи с ролями"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT user_id, role, name FROM family_members WHERE family_id = ?", (family_id,))
-    members = cur.fetchall()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("SELECT user_id, role, name FROM family_members WHERE family_id = ?", (family_id,))
+        members = cur.fetchall()
     return members
 
-def add_feeding(user_id, minutes_ago=0):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    # Получаем family_id пользователя
-    family_id = get_family_id(user_id)
-    if not family_id:
-        # Если пользователь не в семье, создаем временную семью
-        family_id = create_family("Временная семья", user_id)
-    
-    # Получаем информацию об авторе
-    role, name = get_member_info(user_id)
-    
-    timestamp = get_thai_time() - timedelta(minutes=minutes_ago)
-    cur.execute("INSERT INTO feedings (family_id, author_id, timestamp, author_role, author_name) VALUES (?, ?, ?, ?, ?)", 
-                (family_id, user_id, timestamp.isoformat(), role, name))
-    conn.commit()
-    conn.close()
-    
-    # Синхронизируем с Render
+# Таблицы событий: вид события -> (таблица, колонка времени ISO, колонка epoch, дополнительные колонки)
+EVENT_TABLES = {
+    "feeding": ("feedings", "timestamp", "ts", ()),
+    "diaper": ("diapers", "timestamp", "ts", ()),
+    "bath": ("baths", "timestamp", "ts", ()),
+    "activity": ("activities", "timestamp", "ts", ("activity_type",)),
+    "sleep": ("sleep_sessions", "start_time", "start_ts", ()),
+}
+
+def record_event(kind, user_id, when=None, **attrs):
+    """Записать событие одной транзакцией: семья, автор и вставка за один проход"""
+    table, time_column, epoch_column, extra_columns = EVENT_TABLES[kind]
+    if when is None:
+        when = get_thai_time()
+    ts = to_epoch(when)
+
+    created = False
+    with db.cursor() as cur:
+        # Семья и данные автора одним запросом
+        cur.execute("SELECT family_id, role, name FROM family_members WHERE user_id = ?", (user_id,))
+        member = cur.fetchone()
+        if member:
+            family_id, role, name = member
+        else:
+            # Если пользователь не в семье, создаем временную семью (в той же транзакции)
+            family_id, role, name = insert_family(cur, "Временная семья", user_id), None, None
+            created = True
+        role = role or "Родитель"
+        name = name or "Неизвестно"
+        # Строка времени и местный день — в поясе семьи
+        when = clock.default.localize(when, family_id)
+
+        if kind == "sleep":
+            # Завершаем предыдущую активную сессию сна
+            cur.execute("UPDATE sleep_sessions SET is_active = 0, end_time = ?, end_ts = ? WHERE family_id = ? AND is_active = 1",
+                        (when.isoformat(), ts, family_id))
+            extra_columns = ("is_active",)
+            attrs = {"is_active": 1}
+
+        # Время хранится и строкой ISO (для отображения и Supabase), и в epoch с местным днём (для выборок)
+        columns = ("family_id", "author_id", time_column, epoch_column, "local_day") + extra_columns + ("author_role", "author_name")
+        values = ((family_id, user_id, when.isoformat(), ts, when.date().isoformat())
+                  + tuple(attrs.get(c) for c in extra_columns) + (role, name))
+        cur.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values)
+        row_id = cur.lastrowid
+
+    # Обновляем индекс последних событий после фиксации транзакции
+    if kind == "sleep":
+        last_events.default.set_active_sleep(family_id, {
+            "id": row_id,
+            "start_time": when.isoformat(),
+            "start_ts": ts,
+            "author_role": role,
+            "author_name": name
+        })
+    else:
+        last_events.default.record(family_id, kind, when.isoformat(), ts, role, name, attrs.get("activity_type"))
+    if created:
+        # Новой семьи ещё нет в контекстах напоминаний
+        refresh_reminders(family_id)
+    else:
+        reminders.default.reschedule(family_id)
+    # Все записи событий (и начало сна) реплицируются отсюда
     sync_to_render()
+    return family_id
+
+def add_feeding(user_id, minutes_ago=0):
+    record_event("feeding", user_id, get_thai_time() - timedelta(minutes=minutes_ago))
 
 def add_diaper_change(user_id, minutes_ago=0):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    # Получаем family_id пользователя
-    family_id = get_family_id(user_id)
-    if not family_id:
-        # Если пользователь не в семье, создаем временную семью
-        family_id = create_family("Временная семья", user_id)
-    
-    # Получаем информацию об авторе
-    role, name = get_member_info(user_id)
-    
-    timestamp = get_thai_time() - timedelta(minutes=minutes_ago)
-    cur.execute("INSERT INTO diapers (family_id, author_id, timestamp, author_role, author_name) VALUES (?, ?, ?, ?, ?)", 
-                (family_id, user_id, timestamp.isoformat(), role, name))
-    conn.commit()
-    conn.close()
-    
-    # Синхронизируем с Render
-    sync_to_render()
+    record_event("diaper", user_id, get_thai_time() - timedelta(minutes=minutes_ago))
 
 def get_last_feeding_time(user_id):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
     # Получаем family_id пользователя
     family_id = get_family_id(user_id)
     if not family_id:
         return None
-    
-    cur.execute("SELECT timestamp FROM feedings WHERE family_id = ? ORDER BY timestamp DESC LIMIT 1", (family_id,))
-    result = cur.fetchone()
-    conn.close()
-    if result:
-        return datetime.fromisoformat(result[0])
-    return None
+    return get_last_feeding_time_for_family(family_id)
 
 def get_last_diaper_change_for_family(family_id):
     """Получить время последней смены подгузника для семьи"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    cur.execute("SELECT timestamp FROM diapers WHERE family_id = ? ORDER BY timestamp DESC LIMIT 1", (family_id,))
-    result = cur.fetchone()
-    conn.close()
-    if result:
-        return datetime.fromisoformat(result[0])
+    ts = last_events.default.last_ts(family_id, "diaper")
+    if ts is not None:
+        return from_epoch(ts, family_id)
     return None
 
 def get_last_feeding_time_for_family(family_id):
     """Получить время последнего кормления для семьи"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    cur.execute("SELECT timestamp FROM feedings WHERE family_id = ? ORDER BY timestamp DESC LIMIT 1", (family_id,))
-    result = cur.fetchone()
-    conn.close()
-    if result:
-        return datetime.fromisoformat(result[0])
+    ts = last_events.default.last_ts(family_id, "feeding")
+    if ts is not None:
+        return from_epoch(ts, family_id)
     return None
 
 def get_last_diaper_change_time_for_family(family_id):
     """Получить время последней смены подгузника для семьи"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    cur.execute("SELECT timestamp FROM diapers WHERE family_id = ? ORDER BY timestamp DESC LIMIT 1", (family_id,))
-    result = cur.fetchone()
-    conn.close()
-    if result:
-        return datetime.fromisoformat(result[0])
+    ts = last_events.default.last_ts(family_id, "diaper")
+    if ts is not None:
+        return from_epoch(ts, family_id)
     return None
 
 def get_user_intervals(family_id):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT feed_interval, diaper_interval FROM settings WHERE family_id = ?", (family_id,))
-    result = cur.fetchone()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("SELECT feed_interval, diaper_interval FROM settings WHERE family_id = ?", (family_id,))
+        result = cur.fetchone()
     if result:
         return result[0], result[1]
     return 3, 2
 
 def set_user_interval(family_id, feed_interval=None, diaper_interval=None):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    if feed_interval is not None:
-        cur.execute("UPDATE settings SET feed_interval = ? WHERE family_id = ?", (feed_interval, family_id))
-    if diaper_interval is not None:
-        cur.execute("UPDATE settings SET diaper_interval = ? WHERE family_id = ?", (diaper_interval, family_id))
-    conn.commit()
-    conn.close()
+    with db.cursor() as cur:
+        if feed_interval is not None:
+            cur.execute("UPDATE settings SET feed_interval = ? WHERE family_id = ?", (feed_interval, family_id))
+        if diaper_interval is not None:
+            cur.execute("UPDATE settings SET diaper_interval = ? WHERE family_id = ?", (diaper_interval, family_id))
+    settings_changed(family_id)
 
 def is_tips_enabled(family_id):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT tips_enabled FROM settings WHERE family_id = ?", (family_id,))
-    result = cur.fetchone()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("SELECT tips_enabled FROM settings WHERE family_id = ?", (family_id,))
+        result = cur.fetchone()
     return result[0] if result else 1
 
 def toggle_tips(family_id):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("UPDATE settings SET tips_enabled = CASE WHEN tips_enabled = 1 THEN 0 ELSE 1 END WHERE family_id = ?", (family_id,))
-    conn.commit()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("UPDATE settings SET tips_enabled = CASE WHEN tips_enabled = 1 THEN 0 ELSE 1 END WHERE family_id = ?", (family_id,))
+    settings_changed(family_id)
 
 def set_tips_time(family_id, hour, minute):
     """Установить время рассылки советов"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("UPDATE settings SET tips_time_hour = ?, tips_time_minute = ? WHERE family_id = ?", (hour, minute, family_id))
-    conn.commit()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("UPDATE settings SET tips_time_hour = ?, tips_time_minute = ? WHERE family_id = ?", (hour, minute, family_id))
+    settings_changed(family_id, ["tips"])
 
 def get_tips_time(family_id):
     """Получить время рассылки советов"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT tips_time_hour, tips_time_minute FROM settings WHERE family_id = ?", (family_id,))
-    result = cur.fetchone()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("SELECT tips_time_hour, tips_time_minute FROM settings WHERE family_id = ?", (family_id,))
+        result = cur.fetchone()
     if result:
         return result[0], result[1]
     return 9, 0  # значения по умолчанию
 
 def get_feedings_by_day(user_id, date):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    # Получаем family_id пользователя
-    family_id = get_family_id(user_id)
-    if not family_id:
-        return []
-    
-    start_date = datetime.combine(date, datetime.min.time()).isoformat()
-    end_date = datetime.combine(date, datetime.max.time()).isoformat()
-    cur.execute("SELECT id, timestamp, author_role, author_name FROM feedings WHERE family_id = ? AND timestamp BETWEEN ? AND ? ORDER BY timestamp", 
-                (family_id, start_date, end_date))
-    result = cur.fetchall()
-    conn.close()
+    with db.cursor() as cur:
+        # Получаем family_id пользователя
+        family_id = get_family_id(user_id)
+        if not family_id:
+            return []
+
+        start_ts, end_ts = day_bounds(date, family_id)
+        cur.execute("SELECT id, ts, author_role, author_name FROM feedings WHERE family_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                    (family_id, start_ts, end_ts))
+        result = cur.fetchall()
     return result
 
 def get_diapers_by_day(user_id, date):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    # Получаем family_id пользователя
-    family_id = get_family_id(user_id)
-    if not family_id:
-        return []
-    
-    start_date = datetime.combine(date, datetime.min.time()).isoformat()
-    end_date = datetime.combine(date, datetime.max.time()).isoformat()
-    cur.execute("SELECT id, timestamp, author_role, author_name FROM diapers WHERE family_id = ? AND timestamp BETWEEN ? AND ? ORDER BY timestamp", 
-                (family_id, start_date, end_date))
-    result = cur.fetchall()
-    conn.close()
+    with db.cursor() as cur:
+        # Получаем family_id пользователя
+        family_id = get_family_id(user_id)
+        if not family_id:
+            return []
+
+        start_ts, end_ts = day_bounds(date, family_id)
+        cur.execute("SELECT id, ts, author_role, author_name FROM diapers WHERE family_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                    (family_id, start_ts, end_ts))
+        result = cur.fetchall()
     return result
 
 def delete_entry(table, entry_id):
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute(f"DELETE FROM {table} WHERE id = ?", (entry_id,))
-    conn.commit()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute(f"SELECT family_id FROM {table} WHERE id = ?", (entry_id,))
+        result = cur.fetchone()
+        cur.execute(f"DELETE FROM {table} WHERE id = ?", (entry_id,))
+
+    # Удалённая запись могла быть последней — перечитываем её вид
+    kind = {t: k for k, t in last_events.TABLES.items()}.get(table)
+    if result and kind:
+        last_events.default.refresh(result[0], kind)
+        reminders.default.reschedule(result[0])
+    sync_to_render()
 
 # Функция для получения случайного совета
-def get_random_tip():
-    try:
-        import csv
-        tips = []
-        
-        # Читаем советы из CSV файла
-        with open("data/advice2.csv", "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f, delimiter=';')
-            for row in reader:
-                if 'tip' in row and row['tip'].strip():
-                    tips.append(row['tip'].strip())
-        
-        if tips:
-            return random.choice(tips)
-        else:
-            return "Пока нет доступных советов."
-            
-    except Exception as e:
-        print(f"Ошибка при чтении советов: {e}")
-        # Возвращаем запасной совет в случае ошибки
-        return "Помните, что каждый ребенок уникален и развивается в своем темпе."
+def get_random_tip(family_id=None):
+    """Случайный совет из общего хранилища (без повторов для семьи)"""
+    tip = tips.default.random_tip(family_id)
+    if tip:
+        return tip
+    # Запасной совет, если файл с советами недоступен
+    return "Помните, что каждый ребенок уникален и развивается в своем темпе."
 
 def get_baby_age_in_months(family_id):
     """Получить возраст малыша в месяцах на основе даты рождения"""
@@ -746,215 +455,91 @@ def get_age_based_tip(family_id):
         
         if age_months is None:
             # Если возраст неизвестен, возвращаем общий совет
-            return get_random_tip()
+            return get_random_tip(family_id)
         
-        # Определяем возрастную группу
-        if age_months < 1:
-            age_group = "newborn"
-        elif age_months < 3:
-            age_group = "0-3_months"
-        elif age_months < 6:
-            age_group = "3-6_months"
-        elif age_months < 9:
-            age_group = "6-9_months"
-        elif age_months < 12:
-            age_group = "9-12_months"
-        else:
-            age_group = "12+_months"
-        
-        # Возрастные советы
-        age_tips = {
-            "newborn": [
-                "👶 Новорожденный: Держите малыша как можно чаще на руках - это успокаивает и укрепляет связь!",
-                "🍼 Новорожденный: Кормите по требованию, не по расписанию - малыш сам знает, когда голоден!",
-                "😴 Новорожденный: Сон новорожденного может быть беспокойным - это нормально!",
-                "🧷 Новорожденный: Меняйте подгузник каждые 2-3 часа или сразу после загрязнения.",
-                "🛁 Новорожденный: Купайте малыша в воде 36-37°C - это комфортная температура для него."
-            ],
-            "0-3_months": [
-                "👶 0-3 месяца: Малыш начинает улыбаться! Отвечайте на его улыбки - это важно для развития!",
-                "🍼 0-3 месяца: Интервалы между кормлениями постепенно увеличиваются до 3-4 часов.",
-                "😴 0-3 месяца: Помогайте малышу различать день и ночь - днем больше активности, ночью тишина.",
-                "🧷 0-3 месяца: Следите за чистотой кожи - используйте защитный крем при необходимости.",
-                "🎯 0-3 месяца: Выкладывайте малыша на живот на 2-3 минуты несколько раз в день."
-            ],
-            "3-6_months": [
-                "👶 3-6 месяцев: Малыш начинает переворачиваться! Обеспечьте безопасность!",
-                "🍼 3-6 месяцев: Можно начинать вводить прикорм, но только после консультации с врачом.",
-                "😴 3-6 месяцев: Сон становится более предсказуемым - устанавливается режим.",
-                "🧷 3-6 месяцев: Подгузники меняются реже - примерно каждые 4-6 часов.",
-                "🎯 3-6 месяцев: Играйте с малышом в простые игры - прятки, ладушки!"
-            ],
-            "6-9_months": [
-                "👶 6-9 месяцев: Малыш сидит и ползает! Создайте безопасное пространство для исследований!",
-                "🍼 6-9 месяцев: Прикорм становится важной частью рациона - разнообразьте меню!",
-                "😴 6-9 месяцев: Малыш может спать всю ночь - это нормально!",
-                "🧷 6-9 месяцев: Подгузники меняются реже, но следите за сухостью кожи.",
-                "🎯 6-9 месяцев: Читайте малышу книги - это развивает речь и воображение!"
-            ],
-            "9-12_months": [
-                "👶 9-12 месяцев: Малыш делает первые шаги! Поддерживайте и поощряйте!",
-                "🍼 9-12 месяцев: Малыш ест почти как взрослый - разнообразная пища важна!",
-                "😴 9-12 месяцев: Устанавливается четкий режим сна - 2 дневных сна.",
-                "🧷 9-12 месяцев: Можно начинать приучать к горшку, но не торопитесь!",
-                "🎯 9-12 месяцев: Играйте в развивающие игры - пирамидки, кубики, мячики!"
-            ],
-            "12+_months": [
-                "👶 12+ месяцев: Малыш активно ходит и говорит! Поощряйте его развитие!",
-                "🍼 12+ месяцев: Малыш ест за общим столом - приучайте к правильному питанию!",
-                "😴 12+ месяцев: Один дневной сон - это нормально для этого возраста.",
-                "🧷 12+ месяцев: Активно приучайте к горшку - терпение и похвала важны!",
-                "🎯 12+ месяцев: Читайте, играйте, общайтесь - малыш впитывает все как губка!"
-            ]
-        }
-        
-        # Получаем советы для возрастной группы
-        tips = age_tips.get(age_group, age_tips["12+_months"])
-        
-        # Возвращаем только совет без информации о возрасте
-        selected_tip = random.choice(tips)
-        return selected_tip
+        return tips.default.tip_for_age(age_months, family_id)
         
     except Exception as e:
         print(f"Ошибка при получении возрастного совета: {e}")
-        return get_random_tip()
+        return get_random_tip(family_id)
 
 # Новые функции для купания
 def add_bath(user_id, minutes_ago=0):
     """Добавить запись о купании"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    family_id = get_family_id(user_id)
-    if not family_id:
-        family_id = create_family("Временная семья", user_id)
-    
-    role, name = get_member_info(user_id)
-    timestamp = get_thai_time() - timedelta(minutes=minutes_ago)
-    
-    cur.execute("INSERT INTO baths (family_id, author_id, timestamp, author_role, author_name) VALUES (?, ?, ?, ?, ?)", 
-                (family_id, user_id, timestamp.isoformat(), role, name))
-    conn.commit()
-    conn.close()
-    
-    # Синхронизируем с Render
-    sync_to_render()
+    record_event("bath", user_id, get_thai_time() - timedelta(minutes=minutes_ago))
 
 def get_last_bath_time_for_family(family_id):
     """Получить время последнего купания для семьи"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    cur.execute("SELECT timestamp FROM baths WHERE family_id = ? ORDER BY timestamp DESC LIMIT 1", (family_id,))
-    result = cur.fetchone()
-    conn.close()
-    if result:
-        return datetime.fromisoformat(result[0])
+    ts = last_events.default.last_ts(family_id, "bath")
+    if ts is not None:
+        return from_epoch(ts, family_id)
     return None
 
 def get_bath_settings(family_id):
     """Получить настройки напоминаний о купании"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT bath_reminder_enabled, bath_reminder_hour, bath_reminder_minute, bath_reminder_period FROM settings WHERE family_id = ?", (family_id,))
-    result = cur.fetchone()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("SELECT bath_reminder_enabled, bath_reminder_hour, bath_reminder_minute, bath_reminder_period FROM settings WHERE family_id = ?", (family_id,))
+        result = cur.fetchone()
     if result:
         return result[0], result[1], result[2], result[3]
     return 1, 19, 0, 1  # значения по умолчанию
 
 def set_bath_settings(family_id, enabled=None, hour=None, minute=None, period=None):
     """Установить настройки напоминаний о купании"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    if enabled is not None:
-        cur.execute("UPDATE settings SET bath_reminder_enabled = ? WHERE family_id = ?", (enabled, family_id))
-    if hour is not None:
-        cur.execute("UPDATE settings SET bath_reminder_hour = ? WHERE family_id = ?", (hour, family_id))
-    if minute is not None:
-        cur.execute("UPDATE settings SET bath_reminder_minute = ? WHERE family_id = ?", (minute, family_id))
-    if period is not None:
-        cur.execute("UPDATE settings SET bath_reminder_period = ? WHERE family_id = ?", (period, family_id))
-    
-    conn.commit()
-    conn.close()
+    with db.cursor() as cur:
+        if enabled is not None:
+            cur.execute("UPDATE settings SET bath_reminder_enabled = ? WHERE family_id = ?", (enabled, family_id))
+        if hour is not None:
+            cur.execute("UPDATE settings SET bath_reminder_hour = ? WHERE family_id = ?", (hour, family_id))
+        if minute is not None:
+            cur.execute("UPDATE settings SET bath_reminder_minute = ? WHERE family_id = ?", (minute, family_id))
+        if period is not None:
+            cur.execute("UPDATE settings SET bath_reminder_period = ? WHERE family_id = ?", (period, family_id))
+    settings_changed(family_id, ["bath"])
 
 # Новые функции для игр и активностей
 def add_activity(user_id, activity_type="tummy_time", minutes_ago=0):
     """Добавить запись об активности"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    family_id = get_family_id(user_id)
-    if not family_id:
-        family_id = create_family("Временная семья", user_id)
-    
-    role, name = get_member_info(user_id)
-    timestamp = get_thai_time() - timedelta(minutes=minutes_ago)
-    
-    cur.execute("INSERT INTO activities (family_id, author_id, timestamp, activity_type, author_role, author_name) VALUES (?, ?, ?, ?, ?, ?)", 
-                (family_id, user_id, timestamp.isoformat(), activity_type, role, name))
-    conn.commit()
-    conn.close()
-    
-    # Синхронизируем с Render
-    sync_to_render()
+    record_event("activity", user_id, get_thai_time() - timedelta(minutes=minutes_ago), activity_type=activity_type)
 
 def get_last_activity_time_for_family(family_id, activity_type="tummy_time"):
     """Получить время последней активности для семьи"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    cur.execute("SELECT timestamp FROM activities WHERE family_id = ? AND activity_type = ? ORDER BY timestamp DESC LIMIT 1", 
-                (family_id, activity_type))
-    result = cur.fetchone()
-    conn.close()
-    if result:
-        return datetime.fromisoformat(result[0])
+    ts = last_events.default.last_ts(family_id, "activity", activity_type)
+    if ts is not None:
+        return from_epoch(ts, family_id)
     return None
 
 def get_activity_settings(family_id):
     """Получить настройки напоминаний об активностях"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT activity_reminder_enabled, activity_reminder_interval, baby_age_months FROM settings WHERE family_id = ?", (family_id,))
-    result = cur.fetchone()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("SELECT activity_reminder_enabled, activity_reminder_interval, baby_age_months FROM settings WHERE family_id = ?", (family_id,))
+        result = cur.fetchone()
     if result:
         return result[0], result[1], result[2]
     return 1, 2, 0  # значения по умолчанию
 
 def set_activity_settings(family_id, enabled=None, interval=None, age_months=None):
     """Установить настройки напоминаний об активностях"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    if enabled is not None:
-        cur.execute("UPDATE settings SET activity_reminder_enabled = ? WHERE family_id = ?", (enabled, family_id))
-    if interval is not None:
-        cur.execute("UPDATE settings SET activity_reminder_interval = ? WHERE family_id = ?", (interval, family_id))
-    if age_months is not None:
-        cur.execute("UPDATE settings SET baby_age_months = ? WHERE family_id = ?", (age_months, family_id))
-    
-    conn.commit()
-    conn.close()
+    with db.cursor() as cur:
+        if enabled is not None:
+            cur.execute("UPDATE settings SET activity_reminder_enabled = ? WHERE family_id = ?", (enabled, family_id))
+        if interval is not None:
+            cur.execute("UPDATE settings SET activity_reminder_interval = ? WHERE family_id = ?", (interval, family_id))
+        if age_months is not None:
+            cur.execute("UPDATE settings SET baby_age_months = ? WHERE family_id = ?", (age_months, family_id))
+    settings_changed(family_id, ["activity"])
 
 def set_baby_birth_date(family_id, birth_date):
     """Установить дату рождения малыша"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("UPDATE settings SET baby_birth_date = ? WHERE family_id = ?", (birth_date, family_id))
-    conn.commit()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("UPDATE settings SET baby_birth_date = ? WHERE family_id = ?", (birth_date, family_id))
+    sync_to_render()
 
 def get_baby_birth_date(family_id):
     """Получить дату рождения малыша"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT baby_birth_date FROM settings WHERE family_id = ?", (family_id,))
-    result = cur.fetchone()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("SELECT baby_birth_date FROM settings WHERE family_id = ?", (family_id,))
+        result = cur.fetchone()
     return result[0] if result else None
 
 def calculate_baby_age_months(birth_date_str):
@@ -1007,90 +592,55 @@ def get_age_appropriate_activities(age_months):
 # Новые функции для сна
 def start_sleep_session(user_id):
     """Начать сессию сна"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    family_id = get_family_id(user_id)
-    if not family_id:
-        family_id = create_family("Временная семья", user_id)
-    
-    role, name = get_member_info(user_id)
-    start_time = get_thai_time()
-    
-    # Завершаем предыдущую активную сессию сна
-    cur.execute("UPDATE sleep_sessions SET is_active = 0, end_time = ? WHERE family_id = ? AND is_active = 1", 
-                (start_time.isoformat(), family_id))
-    
-    # Создаем новую сессию
-    cur.execute("INSERT INTO sleep_sessions (family_id, author_id, start_time, is_active, author_role, author_name) VALUES (?, ?, ?, 1, ?, ?)", 
-                (family_id, user_id, start_time.isoformat(), role, name))
-    conn.commit()
-    conn.close()
+    record_event("sleep", user_id)
 
 def end_sleep_session(user_id):
     """Завершить сессию сна"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    family_id = get_family_id(user_id)
-    if not family_id:
-        return False
-    
-    end_time = get_thai_time()
-    
-    cur.execute("UPDATE sleep_sessions SET is_active = 0, end_time = ? WHERE family_id = ? AND is_active = 1", 
-                (end_time.isoformat(), family_id))
-    conn.commit()
-    conn.close()
-    
-    # Возвращаем длительность сна
-    cur.execute("SELECT start_time FROM sleep_sessions WHERE family_id = ? AND end_time = ? ORDER BY id DESC LIMIT 1", 
-                (family_id, end_time.isoformat()))
-    result = cur.fetchone()
-    conn.close()
-    
+    with db.cursor() as cur:
+        family_id = get_family_id(user_id)
+        if not family_id:
+            return False
+
+        end_time = get_thai_time(family_id)
+        end_ts = to_epoch(end_time)
+
+        # Последняя активная сессия — её длительность и вернём
+        cur.execute("SELECT start_ts FROM sleep_sessions WHERE family_id = ? AND is_active = 1 ORDER BY start_ts DESC LIMIT 1",
+                    (family_id,))
+        result = cur.fetchone()
+
+        cur.execute("UPDATE sleep_sessions SET is_active = 0, end_time = ?, end_ts = ? WHERE family_id = ? AND is_active = 1",
+                    (end_time.isoformat(), end_ts, family_id))
+    last_events.default.set_active_sleep(family_id, None)
+    reminders.default.reschedule(family_id, ["sleep"])
+    sync_to_render()
+
     if result:
-        start_time = datetime.fromisoformat(result[0])
-        duration = end_time - start_time
-        return duration
+        return timedelta(seconds=end_ts - result[0])
     return None
 
 def get_active_sleep_session(family_id):
     """Получить активную сессию сна для семьи"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    cur.execute("SELECT id, start_time, author_role, author_name FROM sleep_sessions WHERE family_id = ? AND is_active = 1 ORDER BY start_time DESC LIMIT 1", (family_id,))
-    result = cur.fetchone()
-    conn.close()
-    
-    if result:
-        return {
-            "id": result[0],
-            "start_time": datetime.fromisoformat(result[1]),
-            "author_role": result[2],
-            "author_name": result[3]
-        }
+    session = last_events.default.active_sleep(family_id)
+    if session:
+        session["start_time"] = from_epoch(session["start_ts"], family_id)
+        return session
     return None
 
 def get_sleep_settings(family_id):
     """Получить настройки мониторинга сна"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT sleep_monitoring_enabled FROM settings WHERE family_id = ?", (family_id,))
-    result = cur.fetchone()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("SELECT sleep_monitoring_enabled FROM settings WHERE family_id = ?", (family_id,))
+        result = cur.fetchone()
     if result:
         return result[0]
     return 1  # значение по умолчанию
 
 def set_sleep_settings(family_id, enabled):
     """Установить настройки мониторинга сна"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("UPDATE settings SET sleep_monitoring_enabled = ? WHERE family_id = ?", (enabled, family_id))
-    conn.commit()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute("UPDATE settings SET sleep_monitoring_enabled = ? WHERE family_id = ?", (enabled, family_id))
+    settings_changed(family_id, ["sleep"])
 
 def should_wake_for_feeding(sleep_start_time, feed_interval_hours):
     """Проверить, нужно ли разбудить для кормления"""
@@ -1128,7 +678,7 @@ async def show_bath_settings(event):
         [Button.inline("🔙 Назад к настройкам", b"back_to_settings")]
     ]
     
-    await event.edit(message, buttons=buttons)
+    await queued_edit(event, message, buttons=buttons)
 
 async def show_activity_settings(event):
     """Показать настройки игр"""
@@ -1169,7 +719,7 @@ async def show_activity_settings(event):
         [Button.inline("🔙 Назад к настройкам", b"back_to_settings")]
     ]
     
-    await event.edit(message, buttons=buttons)
+    await queued_edit(event, message, buttons=buttons)
 
 async def show_sleep_status(event):
     """Показать статус сна"""
@@ -1220,7 +770,7 @@ async def show_sleep_status(event):
         [Button.inline("🔙 Назад", b"back_to_sleep")]
     ]
     
-    await event.edit(message, buttons=buttons)
+    await queued_edit(event, message, buttons=buttons)
 
 async def show_sleep_history(event):
     """Показать историю сна"""
@@ -1231,26 +781,23 @@ async def show_sleep_history(event):
         await event.respond("😊 Привет! Сначала давайте создадим семью в настройках, чтобы я мог помочь вам следить за малышом! 💕")
         return
     
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    # Получаем последние 5 сессий сна
-    cur.execute("""
-        SELECT start_time, end_time, author_role, author_name 
-        FROM sleep_sessions 
-        WHERE family_id = ? AND end_time IS NOT NULL 
-        ORDER BY start_time DESC LIMIT 5
-    """, (fid,))
-    
-    sessions = cur.fetchall()
-    conn.close()
+    with db.cursor() as cur:
+        # Получаем последние 5 сессий сна
+        cur.execute("""
+            SELECT start_ts, end_ts, author_role, author_name
+            FROM sleep_sessions
+            WHERE family_id = ? AND end_ts IS NOT NULL
+            ORDER BY start_ts DESC LIMIT 5
+        """, (fid,))
+
+        sessions = cur.fetchall()
     
     if sessions:
         message = "😴 **История сна (последние 5 сессий):**\n\n"
         
         for i, session in enumerate(sessions, 1):
-            start_time = datetime.fromisoformat(session[0])
-            end_time = datetime.fromisoformat(session[1])
+            start_time = from_epoch(session[0], fid)
+            end_time = from_epoch(session[1], fid)
             duration = end_time - start_time
             hours = int(duration.total_seconds() // 3600)
             minutes = int((duration.total_seconds() % 3600) // 60)
@@ -1268,7 +815,7 @@ async def show_sleep_history(event):
         [Button.inline("🔙 Назад", b"back_to_sleep")]
     ]
     
-    await event.edit(message, buttons=buttons)
+    await queued_edit(event, message, buttons=buttons)
 
 
 
@@ -1276,6 +823,8 @@ async def show_sleep_history(event):
 
 # Инициализация
 init_db()
+last_events.default.warm()
+tips.default.load()
 scheduler = AsyncIOScheduler()
 
 # Добавляем задачу для поддержания активности (каждые 5 минут)
@@ -1318,6 +867,13 @@ bath_pending = {}
 activity_pending = {}
 sleep_pending = {}
 baby_birth_pending = {}
+timezone_pending = {}
+
+# Часовые пояса, которые предлагаются кнопками (любой другой можно ввести вручную)
+COMMON_TIMEZONES = [
+    "Asia/Bangkok", "Europe/Kaliningrad", "Europe/Moscow", "Europe/Samara",
+    "Asia/Yekaterinburg", "Asia/Novosibirsk", "Asia/Vladivostok", "Asia/Dubai",
+]
 
 @client.on(events.NewMessage(pattern='/start'))
 async def start(event):
@@ -1377,10 +933,7 @@ async def feeding_menu(event):
         return
     
     # Получаем интервал кормления
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT feed_interval FROM settings WHERE family_id = ?", (fid,))
-    interval_result = cur.fetchone()
+    interval_result = db.fetchone("SELECT feed_interval FROM settings WHERE family_id = ?", (fid,))
     feed_interval = interval_result[0] if interval_result else 3
     
     # Получаем время последнего кормления
@@ -1425,8 +978,6 @@ async def feeding_menu(event):
             f"💡 Запишите первое кормление!"
         )
     
-    conn.close()
-    
     # Добавляем кнопки для быстрых действий
     buttons = [
         [Button.inline("🍼 Кормить сейчас", b"feed_now")],
@@ -1448,10 +999,7 @@ async def diaper_menu(event):
         return
     
     # Получаем интервал смены подгузника
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    cur.execute("SELECT diaper_interval FROM settings WHERE family_id = ?", (fid,))
-    interval_result = cur.fetchone()
+    interval_result = db.fetchone("SELECT diaper_interval FROM settings WHERE family_id = ?", (fid,))
     diaper_interval = interval_result[0] if interval_result else 3
     
     # Получаем время последней смены подгузника
@@ -1496,8 +1044,6 @@ async def diaper_menu(event):
             f"💡 Запишите первую смену подгузника!"
         )
     
-    conn.close()
-    
     # Добавляем кнопки для быстрых действий
     buttons = [
         [Button.inline("🧷 Сменить сейчас", b"diaper_now")],
@@ -1512,7 +1058,7 @@ async def diaper_menu(event):
 async def last_feed(event):
     time = get_last_feeding_time(event.sender_id)
     if time:
-        delta = datetime.now() - time
+        delta = get_thai_time() - time
         h, m = divmod(int(delta.total_seconds() // 60), 60)
         await event.respond(f"🍼 Последнее кормление было {h}ч {m}м назад.")
     else:
@@ -1619,6 +1165,7 @@ async def settings_menu(event):
     # Получаем настройки игр
     activity_enabled, activity_interval, baby_age = get_activity_settings(fid)
     activity_label = "🔕 Отключить игры" if activity_enabled else "🔔 Включить игры"
+    timezone_name = get_family_timezone(fid) or clock.DEFAULT_TIMEZONE
     
     buttons = [
         [Button.inline(f"🍽 Интервал кормления: {feed_i}ч", b"set_feed")],
@@ -1629,6 +1176,7 @@ async def settings_menu(event):
         [Button.inline(f"🛁 Купание: {bath_hour:02d}:{bath_minute:02d} / {bath_period}д", b"bath_settings")],
         [Button.inline(activity_label, b"activity_toggle")],
         [Button.inline(f"🎮 Игры: {activity_interval}ч / {baby_age}мес", b"activity_settings")],
+        [Button.inline(f"🌍 Часовой пояс: {timezone_name}", b"set_timezone")],
         [Button.inline("👤 Моя роль", b"my_role")],
         [Button.inline("👨‍👩‍👧 Управление семьей", b"family_management")]
     ]
@@ -1697,12 +1245,8 @@ async def family_management_cmd(event):
 async def family_members_cmd(event):
     fid = get_family_id(event.sender_id)
     if fid:
-        conn = sqlite3.connect("babybot.db")
-        cur = conn.cursor()
         # Получаем user_id, role и name для всех членов семьи
-        cur.execute("SELECT user_id, role, name FROM family_members WHERE family_id = ?", (fid,))
-        members = cur.fetchall()
-        conn.close()
+        members = db.fetchall("SELECT user_id, role, name FROM family_members WHERE family_id = ?", (fid,))
         
         if members:
             text = "👥 **Члены семьи:**\n\n"
@@ -1723,7 +1267,7 @@ async def family_members_cmd(event):
 @client.on(events.NewMessage(pattern='📜 История'))
 async def history_menu(event):
     print(f"DEBUG: Обработка команды '📜 История' для пользователя {event.sender_id}")
-    today = get_thai_date()
+    today = get_thai_date(get_family_id(event.sender_id))
     buttons = [
         [Button.inline(f"📅 {today - timedelta(days=i)}", f"hist_{i}".encode())] for i in range(3)
     ]
@@ -1804,36 +1348,36 @@ async def callback_handler(event):
 
     if data == "feed_now":
         add_feeding(event.sender_id)
-        await event.edit("🍼 Отлично! Кормление записано! Малыш сыт и доволен! 😊")
+        await queued_edit(event, "🍼 Отлично! Кормление записано! Малыш сыт и доволен! 😊")
     elif data == "feed_15":
         add_feeding(event.sender_id, 15)
-        await event.edit("🍼 Замечательно! Кормление 15 минут назад записано! Малыш был сыт! 😊")
+        await queued_edit(event, "🍼 Замечательно! Кормление 15 минут назад записано! Малыш был сыт! 😊")
     elif data == "feed_30":
         add_feeding(event.sender_id, 30)
-        await event.edit("🍼 Прекрасно! Кормление 30 минут назад записано! Малыш был доволен! 😊")
+        await queued_edit(event, "🍼 Прекрасно! Кормление 30 минут назад записано! Малыш был доволен! 😊")
     elif data == "feed_manual":
         manual_feeding_pending[event.sender_id] = True
         await event.respond("🕒 Введите время кормления в формате ЧЧ:ММ (например, 14:30):")
 
     elif data == "diaper_now":
         add_diaper_change(event.sender_id)
-        await event.edit("🧷 Отлично! Смена подгузника записана! Малыш чистенький и довольный! 😊")
+        await queued_edit(event, "🧷 Отлично! Смена подгузника записана! Малыш чистенький и довольный! 😊")
     elif data == "diaper_15":
         add_diaper_change(event.sender_id, 15)
-        await event.edit("🧷 Замечательно! Смена подгузника 15 минут назад записана! Малыш был чистенький! 😊")
+        await queued_edit(event, "🧷 Замечательно! Смена подгузника 15 минут назад записана! Малыш был чистенький! 😊")
     elif data == "diaper_30":
         add_diaper_change(event.sender_id, 30)
-        await event.edit("🧷 Прекрасно! Смена подгузника 30 минут назад записана! Малыш был довольный! 😊")
+        await queued_edit(event, "🧷 Прекрасно! Смена подгузника 30 минут назад записана! Малыш был довольный! 😊")
     elif data == "diaper_manual":
         manual_feeding_pending[event.sender_id] = "diaper"
         await event.respond("🕒 Введите время смены подгузника в формате ЧЧ:ММ (например, 14:30):")
 
     elif data == "set_feed":
         buttons = [[Button.inline(f"{i} ч", f"feed_{i}".encode())] for i in range(1, 7)]
-        await event.edit("🍽 Выберите интервал кормления:", buttons=buttons)
+        await queued_edit(event, "🍽 Выберите интервал кормления:", buttons=buttons)
     elif data == "set_diaper":
         buttons = [[Button.inline(f"{i} ч", f"diaper_{i}".encode())] for i in range(1, 7)]
-        await event.edit("🧷 Выберите интервал смены подгузника:", buttons=buttons)
+        await queued_edit(event, "🧷 Выберите интервал смены подгузника:", buttons=buttons)
     elif data.startswith("feed_yesterday_"):
         minutes_ago = int(data.split("_")[-1])
         uid = event.sender_id
@@ -1844,11 +1388,11 @@ async def callback_handler(event):
         if uid in manual_feeding_pending and isinstance(manual_feeding_pending[uid], dict):
             time_str = manual_feeding_pending[uid]["time"]
             add_feeding(uid, minutes_ago=minutes_ago)
-            yesterday = (datetime.now() - timedelta(days=1)).strftime('%d.%m')
-            await event.edit(f"✅ Отлично! Кормление за вчера ({yesterday}) в {time_str} записано! Малыш был сыт! 😊")
+            yesterday = (get_thai_date(get_family_id(uid)) - timedelta(days=1)).strftime('%d.%m')
+            await queued_edit(event, f"✅ Отлично! Кормление за вчера ({yesterday}) в {time_str} записано! Малыш был сыт! 😊")
             del manual_feeding_pending[uid]
         else:
-            await event.edit("❌ Ошибка: данные о времени не найдены.")
+            await queued_edit(event, "❌ Ошибка: данные о времени не найдены.")
     
     elif data.startswith("diaper_yesterday_"):
         minutes_ago = int(data.split("_")[-1])
@@ -1860,11 +1404,11 @@ async def callback_handler(event):
         if uid in manual_feeding_pending and isinstance(manual_feeding_pending[uid], dict):
             time_str = manual_feeding_pending[uid]["time"]
             add_diaper_change(uid, minutes_ago=minutes_ago)
-            yesterday = (datetime.now() - timedelta(days=1)).strftime('%d.%m')
-            await event.edit(f"✅ Отлично! Смена подгузника за вчера ({yesterday}) в {time_str} записана! Малыш был чистенький! 😊")
+            yesterday = (get_thai_date(get_family_id(uid)) - timedelta(days=1)).strftime('%d.%m')
+            await queued_edit(event, f"✅ Отлично! Смена подгузника за вчера ({yesterday}) в {time_str} записана! Малыш был чистенький! 😊")
             del manual_feeding_pending[uid]
         else:
-            await event.edit("❌ Ошибка: данные о времени не найдены.")
+            await queued_edit(event, "❌ Ошибка: данные о времени не найдены.")
     
     # Обработчики для купания за вчера
     elif data.startswith("bath_yesterday_"):
@@ -1874,22 +1418,22 @@ async def callback_handler(event):
         if uid in bath_pending and isinstance(bath_pending[uid], dict):
             time_str = bath_pending[uid]["time"]
             add_bath(uid, minutes_ago=minutes_ago)
-            yesterday = (get_thai_date() - timedelta(days=1)).strftime('%d.%m')
-            await event.edit(f"✅ Отлично! Купание за вчера ({yesterday}) в {time_str} записано! Малыш был чистенький! 😊")
+            yesterday = (get_thai_date(get_family_id(uid)) - timedelta(days=1)).strftime('%d.%m')
+            await queued_edit(event, f"✅ Отлично! Купание за вчера ({yesterday}) в {time_str} записано! Малыш был чистенький! 😊")
             del bath_pending[uid]
         else:
-            await event.edit("❌ Ошибка: данные о времени не найдены.")
+            await queued_edit(event, "❌ Ошибка: данные о времени не найдены.")
     
     elif data.startswith("feed_"):
         hours = int(data.split("_")[1])
         fid = get_family_id(event.sender_id)
         set_user_interval(fid, feed_interval=hours)
-        await event.edit(f"✅ Интервал кормления установлен на {hours} ч.")
+        await queued_edit(event, f"✅ Интервал кормления установлен на {hours} ч.")
     elif data.startswith("diaper_"):
         hours = int(data.split("_")[1])
         fid = get_family_id(event.sender_id)
         set_user_interval(fid, diaper_interval=hours)
-        await event.edit(f"✅ Интервал смены подгузника установлен на {hours} ч.")
+        await queued_edit(event, f"✅ Интервал смены подгузника установлен на {hours} ч.")
     elif data == "toggle_tips":
         fid = get_family_id(event.sender_id)
         toggle_tips(fid)
@@ -1900,7 +1444,7 @@ async def callback_handler(event):
         enabled, hour, minute, period = get_bath_settings(fid)
         new_enabled = 0 if enabled else 1
         set_bath_settings(fid, enabled=new_enabled)
-        await event.edit(f"✅ Напоминания о купании {'включены' if new_enabled else 'отключены'}")
+        await queued_edit(event, f"✅ Напоминания о купании {'включены' if new_enabled else 'отключены'}")
         await asyncio.sleep(2)
         await settings_menu(event)
     
@@ -1920,10 +1464,10 @@ async def callback_handler(event):
             [Button.inline("🔙 Назад к настройкам", b"back_to_settings")]
         ]
         
-        await event.edit(message, buttons=buttons)
+        await queued_edit(event, message, buttons=buttons)
     
     elif data == "edit_role":
-        await event.edit("👤 Выберите вашу роль:")
+        await queued_edit(event, "👤 Выберите вашу роль:")
         buttons = [
             [Button.inline("👨‍👩‍👧 Родитель", b"role_parent")],
             [Button.inline("👨‍👩‍👧 Мама", b"role_mom")],
@@ -1933,7 +1477,7 @@ async def callback_handler(event):
             [Button.inline("👨‍👩‍👧 Няня", b"role_nanny")],
             [Button.inline("🔙 Назад к настройкам", b"back_to_settings")]
         ]
-        await event.edit("👤 Выберите вашу роль:", buttons=buttons )
+        await queued_edit(event, "👤 Выберите вашу роль:", buttons=buttons )
     
     elif data.startswith("role_"):
         role_map = {
@@ -1948,20 +1492,20 @@ async def callback_handler(event):
         uid = event.sender_id
         
         # Запрашиваем имя
-        await event.edit(f"👤 Роль установлена: {role}\n\n📝 Теперь введите ваше имя:")
+        await queued_edit(event, f"👤 Роль установлена: {role}\n\n📝 Теперь введите ваше имя:")
         edit_role_pending[uid] = {"role": role, "step": "waiting_name"}
     
     elif data == "back_to_main":
         await start(event)
     
     elif data == "set_tips_time":
-        await event.edit("🕐 Выберите время для рассылки советов:")
+        await queued_edit(event, "🕐 Выберите время для рассылки советов:")
         # Показываем кнопки для выбора часа
         buttons = []
         for hour in range(0, 24, 2):  # Каждые 2 часа
             buttons.append([Button.inline(f"{hour:02d}:00", f"tips_hour_{hour}".encode())])
         buttons.append([Button.inline("🔙 Назад", b"back_to_settings")])
-        await event.edit("🕐 Выберите час для рассылки советов:", buttons=buttons)
+        await queued_edit(event, "🕐 Выберите час для рассылки советов:", buttons=buttons)
 
     elif data.startswith("tips_hour_"):
         hour = int(data.split("_")[-1])
@@ -1970,7 +1514,7 @@ async def callback_handler(event):
         for minute in range(0, 60, 15):  # Каждые 15 минут
             buttons.append([Button.inline(f"{hour:02d}:{minute:02d}", f"tips_time_{hour}_{minute}".encode())])
         buttons.append([Button.inline("🔙 Назад", b"set_tips_time")])
-        await event.edit(f"🕐 Выберите минуту для времени {hour:02d}:XX:", buttons=buttons)
+        await queued_edit(event, f"🕐 Выберите минуту для времени {hour:02d}:XX:", buttons=buttons)
     
     elif data.startswith("tips_time_"):
         parts = data.split("_")
@@ -1978,17 +1522,39 @@ async def callback_handler(event):
         minute = int(parts[-1])
         fid = get_family_id(event.sender_id)
         set_tips_time(fid, hour, minute)
-        await event.edit(f"✅ Время рассылки советов установлено на {hour:02d}:{minute:02d}")
+        await queued_edit(event, f"✅ Время рассылки советов установлено на {hour:02d}:{minute:02d}")
         # Возвращаемся к настройкам через 2 секунды
         await asyncio.sleep(2)
         await settings_menu(event)
+
+    elif data == "set_timezone":
+        # Все ежедневные напоминания семьи (советы, купание) идут по её местному времени
+        buttons = [[Button.inline(name, f"tz_{name}".encode())] for name in COMMON_TIMEZONES]
+        buttons.append([Button.inline("✏️ Ввести вручную", b"tz_manual")])
+        buttons.append([Button.inline("🔙 Назад", b"back_to_settings")])
+        await queued_edit(event, "🌍 Выберите часовой пояс семьи:", buttons=buttons)
+
+    elif data == "tz_manual":
+        timezone_pending[event.sender_id] = True
+        await queued_edit(event, "✏️ Введите часовой пояс в формате IANA, например: Europe/Moscow")
+
+    elif data.startswith("tz_"):
+        name = data[len("tz_"):]
+        fid = get_family_id(event.sender_id)
+        if fid and set_family_timezone(fid, name):
+            await queued_edit(event, f"✅ Часовой пояс семьи: {name}\n🕐 Сейчас у вас {get_thai_time(fid).strftime('%H:%M')}")
+        else:
+            await queued_edit(event, "❌ Не удалось установить часовой пояс.")
+        await asyncio.sleep(2)
+        await settings_menu(event)
     
     
     elif data.startswith("hist_"):
         print(f"DEBUG: Обработка истории для пользователя {event.sender_id}, data: {data}")
         try:
             index = int(data.split("_")[1])
-            target_date = get_thai_date() - timedelta(days=index)
+            fid = get_family_id(event.sender_id)
+            target_date = get_thai_date(fid) - timedelta(days=index)
             print(f"DEBUG: Целевая дата: {target_date}")
             
             feedings = get_feedings_by_day(event.sender_id, target_date)
@@ -2015,7 +1581,7 @@ async def callback_handler(event):
         if feedings:
             text += "🍼 Кормления:\n"
             for f in feedings:
-                time_str = datetime.fromisoformat(f[1]).strftime("%H:%M")
+                time_str = from_epoch(f[1], fid).strftime("%H:%M")
                 # Проверяем, есть ли информация об авторе (индексы 2 и 3)
                 if len(f) >= 4 and f[2] and f[3]:  # author_role и author_name
                     author_info = f"{f[2]} {f[3]}"
@@ -2028,7 +1594,7 @@ async def callback_handler(event):
         if diapers:
             text += "\n🧷 Подгузники:\n"
             for d in diapers:
-                time_str = datetime.fromisoformat(d[1]).strftime("%H:%M")
+                time_str = from_epoch(d[1], fid).strftime("%H:%M")
                 # Проверяем, есть ли информация об авторе (индексы 2 и 3)
                 if len(d) >= 4 and d[2] and d[3]:  # author_role и author_name
                     author_info = f"{d[2]} {d[3]}"
@@ -2049,10 +1615,10 @@ async def callback_handler(event):
 
         # Проверяем, есть ли кнопки
         if buttons:
-            await event.edit(text, buttons=buttons)
+            await queued_edit(event, text, buttons=buttons)
         else:
             # Если кнопок нет, просто обновляем текст
-            await event.edit(text)
+            await queued_edit(event, text)
         return
 
     elif data.startswith("del_feed_"):
@@ -2087,7 +1653,7 @@ async def callback_handler(event):
     
     elif data == "set_baby_birth":
         baby_birth_pending[event.sender_id] = True
-        await event.edit("👶 Введите дату рождения малыша в формате ГГГГ-ММ-ДД (например: 2024-01-15):")
+        await queued_edit(event, "👶 Введите дату рождения малыша в формате ГГГГ-ММ-ДД (например: 2024-01-15):")
     
     elif data == "family_members":
         await family_members_cmd(event)
@@ -2102,24 +1668,24 @@ async def callback_handler(event):
         uid = event.sender_id
         if uid in manual_feeding_pending:
             del manual_feeding_pending[uid]
-        await event.edit("❌ Запись кормления отменена.")
+        await queued_edit(event, "❌ Запись кормления отменена.")
     
     elif data == "diaper_cancel":
         uid = event.sender_id
         if uid in manual_feeding_pending:
             del manual_feeding_pending[uid]
-        await event.edit("❌ Запись смены подгузника отменена.")
+        await queued_edit(event, "❌ Запись смены подгузника отменена.")
     
     # Обработчики для купания
     elif data == "bath_now":
         add_bath(event.sender_id)
-        await event.edit("🛁 Отлично! Купание записано! Малыш чистенький и довольный! 😊")
+        await queued_edit(event, "🛁 Отлично! Купание записано! Малыш чистенький и довольный! 😊")
     elif data == "bath_15":
         add_bath(event.sender_id, 15)
-        await event.edit("🛁 Замечательно! Купание 15 минут назад записано! Малыш был чистенький! 😊")
+        await queued_edit(event, "🛁 Замечательно! Купание 15 минут назад записано! Малыш был чистенький! 😊")
     elif data == "bath_30":
         add_bath(event.sender_id, 30)
-        await event.edit("🛁 Прекрасно! Купание 30 минут назад записано! Малыш был довольный! 😊")
+        await queued_edit(event, "🛁 Прекрасно! Купание 30 минут назад записано! Малыш был довольный! 😊")
     elif data == "bath_manual":
         bath_pending[event.sender_id] = True
         await event.respond("🕒 Введите время купания в формате ЧЧ:ММ (например, 14:30):")
@@ -2129,28 +1695,28 @@ async def callback_handler(event):
     # Обработчики для игр
     elif data == "activity_tummy":
         add_activity(event.sender_id, "tummy_time")
-        await event.edit("🦵 Отлично! Выкладывание на живот записано! Малыш тренирует мышцы! 😊")
+        await queued_edit(event, "🦵 Отлично! Выкладывание на живот записано! Малыш тренирует мышцы! 😊")
     elif data == "activity_play":
         add_activity(event.sender_id, "play")
-        await event.edit("🎯 Отлично! Игра записана! Малыш весело провел время! 😊")
+        await queued_edit(event, "🎯 Отлично! Игра записана! Малыш весело провел время! 😊")
     elif data == "activity_massage":
         add_activity(event.sender_id, "massage")
-        await event.edit("💆 Отлично! Массаж записан! Малыш расслабился и доволен! 😊")
+        await queued_edit(event, "💆 Отлично! Массаж записан! Малыш расслабился и доволен! 😊")
     elif data == "activity_settings":
         await show_activity_settings(event)
     
     # Обработчики для сна
     elif data == "sleep_start":
         start_sleep_session(event.sender_id)
-        await event.edit("🌙 Малыш заснул. Отслеживаем сон...")
+        await queued_edit(event, "🌙 Малыш заснул. Отслеживаем сон...")
     elif data == "sleep_end":
         duration = end_sleep_session(event.sender_id)
         if duration:
             hours = int(duration.total_seconds() // 3600)
             minutes = int((duration.total_seconds() % 3600) // 60)
-            await event.edit(f"🌅 Малыш проснулся! Спал {hours}ч {minutes}м.")
+            await queued_edit(event, f"🌅 Малыш проснулся! Спал {hours}ч {minutes}м.")
         else:
-            await event.edit("🌅 Малыш проснулся!")
+            await queued_edit(event, "🌅 Малыш проснулся!")
     elif data == "sleep_status":
         await show_sleep_status(event)
     elif data == "sleep_history":
@@ -2163,7 +1729,7 @@ async def callback_handler(event):
         period = int(data.split("_")[-1])
         fid = get_family_id(event.sender_id)
         set_bath_settings(fid, period=period)
-        await event.edit(f"✅ Период напоминаний о купании установлен на {period} день(ей)")
+        await queued_edit(event, f"✅ Период напоминаний о купании установлен на {period} день(ей)")
         await asyncio.sleep(2)
         await settings_menu(event)
     
@@ -2173,7 +1739,7 @@ async def callback_handler(event):
         minute = int(time_parts[-1])
         fid = get_family_id(event.sender_id)
         set_bath_settings(fid, hour=hour, minute=minute)
-        await event.edit(f"✅ Время напоминаний о купании установлено на {hour:02d}:{minute:02d}")
+        await queued_edit(event, f"✅ Время напоминаний о купании установлено на {hour:02d}:{minute:02d}")
         await asyncio.sleep(2)
         await settings_menu(event)
     
@@ -2182,7 +1748,7 @@ async def callback_handler(event):
         interval = int(data.split("_")[-1])
         fid = get_family_id(event.sender_id)
         set_activity_settings(fid, interval=interval)
-        await event.edit(f"✅ Интервал напоминаний об играх установлен на {interval} ч.")
+        await queued_edit(event, f"✅ Интервал напоминаний об играх установлен на {interval} ч.")
         await asyncio.sleep(2)
         await settings_menu(event)
     
@@ -2197,40 +1763,40 @@ async def callback_handler(event):
         uid = event.sender_id
         if uid in bath_pending:
             del bath_pending[uid]
-        await event.edit("❌ Запись купания отменена.")
+        await queued_edit(event, "❌ Запись купания отменена.")
     
     # Обработчики для настроек купания
     elif data == "bath_change_time":
-        await event.edit("🕐 Выберите время для напоминаний о купании:")
+        await queued_edit(event, "🕐 Выберите время для напоминаний о купании:")
         buttons = []
         for hour in range(18, 22):  # Вечерние часы для купания
             for minute in [0, 15, 30, 45]:
                 buttons.append([Button.inline(f"{hour:02d}:{minute:02d}", f"bath_time_{hour}_{minute}".encode())])
         buttons.append([Button.inline("🔙 Назад", b"bath_settings")])
-        await event.edit("🕐 Выберите время для напоминаний о купании:", buttons=buttons)
+        await queued_edit(event, "🕐 Выберите время для напоминаний о купании:", buttons=buttons)
     
     elif data == "bath_change_period":
-        await event.edit("📅 Выберите период напоминаний о купании:")
+        await queued_edit(event, "📅 Выберите период напоминаний о купании:")
         buttons = [
             [Button.inline("1 день", b"bath_period_1")],
             [Button.inline("2 дня", b"bath_period_2")],
             [Button.inline("3 дня", b"bath_period_3")],
             [Button.inline("🔙 Назад", b"bath_settings")]
         ]
-        await event.edit("📅 Выберите период напоминаний о купании:", buttons=buttons)
+        await queued_edit(event, "📅 Выберите период напоминаний о купании:", buttons=buttons)
     
     elif data == "bath_toggle":
         fid = get_family_id(event.sender_id)
         enabled, hour, minute, period = get_bath_settings(fid)
         new_enabled = 0 if enabled else 1
         set_bath_settings(fid, enabled=new_enabled)
-        await event.edit(f"✅ Напоминания о купании {'включены' if new_enabled else 'отключены'}")
+        await queued_edit(event, f"✅ Напоминания о купании {'включены' if new_enabled else 'отключены'}")
         await asyncio.sleep(2)
         await show_bath_settings(event)
     
     # Обработчики для настроек игр
     elif data == "activity_change_interval":
-        await event.edit("⏰ Выберите интервал напоминаний об играх:")
+        await queued_edit(event, "⏰ Выберите интервал напоминаний об играх:")
         buttons = [
             [Button.inline("1 час", b"activity_interval_1")],
             [Button.inline("2 часа", b"activity_interval_2")],
@@ -2238,7 +1804,7 @@ async def callback_handler(event):
             [Button.inline("4 часа", b"activity_interval_4")],
             [Button.inline("🔙 Назад", b"activity_settings")]
         ]
-        await event.edit("⏰ Выберите интервал напоминаний об играх:", buttons=buttons)
+        await queued_edit(event, "⏰ Выберите интервал напоминаний об играх:", buttons=buttons)
     
 
     
@@ -2247,7 +1813,7 @@ async def callback_handler(event):
         enabled, interval, age_months = get_activity_settings(fid)
         new_enabled = 0 if enabled else 1
         set_activity_settings(fid, enabled=new_enabled)
-        await event.edit(f"✅ Напоминания об играх {'включены' if new_enabled else 'отключены'}")
+        await queued_edit(event, f"✅ Напоминания об играх {'включены' if new_enabled else 'отключены'}")
         await asyncio.sleep(2)
         await settings_menu(event)
 
@@ -2278,17 +1844,16 @@ async def handle_text(event):
             t = datetime.strptime(user_input, "%H:%M")
             print(f"DEBUG: Парсинг времени успешен: {t}")
             
-            # Создаем datetime объект для сегодняшнего дня с введенным временем (в тайском времени)
-            today = get_thai_date()
-            # Создаем datetime объект с тайским часовым поясом
-            thai_tz = pytz.timezone('Asia/Bangkok')
-            dt = thai_tz.localize(datetime.combine(today, t.time()))
-            now = get_thai_time()
+            # Создаем datetime объект для сегодняшнего дня с введенным временем (в поясе семьи)
+            fid = get_family_id(uid)
+            now = get_thai_time(fid)
+            today = now.date()
+            dt = clock.default.localize(datetime.combine(today, t.time()), fid)
             
-            print(f"DEBUG: Сегодня (Таиланд): {today}")
+            print(f"DEBUG: Сегодня (пояс семьи): {today}")
             print(f"DEBUG: Введенное время: {dt}")
-            print(f"DEBUG: Текущее время (Таиланд): {now}")
-            print(f"DEBUG: UTC время: {datetime.now(pytz.UTC)}")
+            print(f"DEBUG: Текущее время (пояс семьи): {now}")
+            print(f"DEBUG: UTC время: {clock.default.utcnow()}")
             
             # Вычисляем разницу в минутах
             diff = int((now - dt).total_seconds() // 60)
@@ -2299,7 +1864,7 @@ async def handle_text(event):
                 print(f"DEBUG: Время в будущем, разница: {diff}")
                 # Предлагаем сделать запись за прошлый день
                 yesterday = today - timedelta(days=1)
-                yesterday_dt = thai_tz.localize(datetime.combine(yesterday, t.time()))
+                yesterday_dt = clock.default.localize(datetime.combine(yesterday, t.time()), fid)
                 yesterday_diff = int((now - yesterday_dt).total_seconds() // 60)
                 
                 if yesterday_diff >= 0 and yesterday_diff <= 1440:
@@ -2323,7 +1888,7 @@ async def handle_text(event):
                 print(f"DEBUG: Время слишком далеко в прошлом, разница: {diff}")
                 # Проверяем, может ли это быть время за вчера
                 yesterday = today - timedelta(days=1)
-                yesterday_dt = thai_tz.localize(datetime.combine(yesterday, t.time()))
+                yesterday_dt = clock.default.localize(datetime.combine(yesterday, t.time()), fid)
                 yesterday_diff = int((now - yesterday_dt).total_seconds() // 60)
                 
                 if yesterday_diff >= 0 and yesterday_diff <= 1440:
@@ -2406,6 +1971,19 @@ async def handle_text(event):
         return
     
     # Обработка ввода даты рождения малыша
+    if uid in timezone_pending:
+        name = event.raw_text.strip()
+        fid = get_family_id(uid)
+        if not fid:
+            await event.respond("❌ Сначала создайте семью или присоединитесь к существующей.")
+        elif set_family_timezone(fid, name):
+            await event.respond(f"✅ Часовой пояс семьи: {name}\n🕐 Сейчас у вас {get_thai_time(fid).strftime('%H:%M')}")
+        else:
+            await event.respond("❌ Неизвестный часовой пояс. Пример: Europe/Moscow, Asia/Bangkok")
+            return
+        del timezone_pending[uid]
+        return
+
     if uid in baby_birth_pending:
         user_input = event.raw_text.strip()
         
@@ -2457,11 +2035,11 @@ async def handle_text(event):
             # Парсим введенное время
             t = datetime.strptime(user_input, "%H:%M")
             
-            # Создаем datetime объект для сегодняшнего дня с введенным временем
-            today = get_thai_date()
-            thai_tz = pytz.timezone('Asia/Bangkok')
-            dt = thai_tz.localize(datetime.combine(today, t.time()))
-            now = get_thai_time()
+            # Создаем datetime объект для сегодняшнего дня с введенным временем (в поясе семьи)
+            fid = get_family_id(uid)
+            now = get_thai_time(fid)
+            today = now.date()
+            dt = clock.default.localize(datetime.combine(today, t.time()), fid)
             
             # Вычисляем разницу в минутах
             diff = int((now - dt).total_seconds() // 60)
@@ -2470,7 +2048,7 @@ async def handle_text(event):
             if diff < 0:
                 # Предлагаем сделать запись за прошлый день
                 yesterday = today - timedelta(days=1)
-                yesterday_dt = thai_tz.localize(datetime.combine(yesterday, t.time()))
+                yesterday_dt = clock.default.localize(datetime.combine(yesterday, t.time()), fid)
                 yesterday_diff = int((now - yesterday_dt).total_seconds() // 60)
                 
                 if yesterday_diff >= 0 and yesterday_diff <= 1440:
@@ -2491,7 +2069,7 @@ async def handle_text(event):
             elif diff > 1440:  # больше 24 часов
                 # Проверяем, может ли это быть время за вчера
                 yesterday = today - timedelta(days=1)
-                yesterday_dt = thai_tz.localize(datetime.combine(yesterday, t.time()))
+                yesterday_dt = clock.default.localize(datetime.combine(yesterday, t.time()), fid)
                 yesterday_diff = int((now - yesterday_dt).total_seconds() // 60)
                 
                 if yesterday_diff >= 0 and yesterday_diff <= 1440:
@@ -2537,11 +2115,11 @@ async def handle_text(event):
             # Парсим введенное время
             t = datetime.strptime(user_input, "%H:%M")
             
-            # Создаем datetime объект для сегодняшнего дня с введенным временем
-            today = get_thai_date()
-            thai_tz = pytz.timezone('Asia/Bangkok')
-            dt = thai_tz.localize(datetime.combine(today, t.time()))
-            now = get_thai_time()
+            # Создаем datetime объект для сегодняшнего дня с введенным временем (в поясе семьи)
+            fid = get_family_id(uid)
+            now = get_thai_time(fid)
+            today = now.date()
+            dt = clock.default.localize(datetime.combine(today, t.time()), fid)
             
             # Вычисляем разницу в минутах
             diff = int((now - dt).total_seconds() // 60)
@@ -2568,627 +2146,379 @@ async def handle_text(event):
 
 
 
-def get_last_feeding_time_for_family(family_id):
-    """Получить время последнего кормления для семьи"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    # Получаем всех членов семьи
-    cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-    members = cur.fetchall()
-    
-    if not members:
-        conn.close()
-        return None
-    
-    # Получаем последнее кормление среди всех членов семьи
-    member_ids = [str(member[0]) for member in members]
-    placeholders = ','.join(['?' for _ in member_ids])
-    
-    cur.execute(f"""
-        SELECT timestamp FROM feedings 
-        WHERE family_id = ? 
-        ORDER BY timestamp DESC 
-        LIMIT 1
-    """, (family_id,))
-    
-    result = cur.fetchone()
-    conn.close()
-    
-    if result:
-        return datetime.fromisoformat(result[0])
-    return None
+# Единый движок напоминаний: для каждой семьи хранится ближайший срок
+# каждого вида напоминаний, вместо опроса всех семей по расписанию
+REMINDER_REPEAT = timedelta(minutes=15)
+
+# Начало окон, которые открыты «всегда» (первые события)
+REMINDERS_EPOCH = datetime.fromtimestamp(0, clock.UTC)
+
+# Ежедневные напоминания считаются по местному времени семьи, а внутри минуты
+# семьи с одинаковым временем разводятся постоянным сдвигом до этого числа секунд
+DAILY_REMINDER_SPREAD = int(os.getenv('DAILY_REMINDER_SPREAD', '300'))
+
+REMINDER_SETTINGS_COLUMNS = (
+    "tips_enabled", "tips_time_hour", "tips_time_minute",
+    "feed_interval", "diaper_interval",
+    "bath_reminder_enabled", "bath_reminder_hour", "bath_reminder_minute", "bath_reminder_period",
+    "activity_reminder_enabled", "activity_reminder_interval", "baby_age_months",
+    "sleep_monitoring_enabled",
+)
+
+# Настройки и члены семей для напоминаний: family_id -> словарь
+# (последние события берутся из индекса last_events)
+reminder_contexts = {}
+
+def load_reminder_contexts(family_id=None):
+    """Загрузить настройки и членов семей одним запросом (всех семей или одной)"""
+    where = "WHERE s.family_id = ?" if family_id is not None else ""
+    rows = db.fetchall(f"""
+        SELECT s.family_id, {', '.join('s.' + c for c in REMINDER_SETTINGS_COLUMNS)},
+               GROUP_CONCAT(fm.user_id)
+        FROM settings s
+        LEFT JOIN family_members fm ON fm.family_id = s.family_id
+        {where}
+        GROUP BY s.family_id
+    """, (family_id,) if family_id is not None else ())
+
+    if family_id is not None:
+        reminder_contexts.pop(family_id, None)
+    for row in rows:
+        context = dict(zip(REMINDER_SETTINGS_COLUMNS, row[1:-1]))
+        context["members"] = [int(user_id) for user_id in row[-1].split(",")] if row[-1] else []
+        reminder_contexts[row[0]] = context
+    return reminder_contexts
+
+def refresh_reminders(family_id, names=None):
+    """Перечитать настройки и членов семьи и пересчитать её напоминания"""
+    load_reminder_contexts(family_id)
+    reminders.default.reschedule(family_id, names)
+
+def get_reminder_settings(family_id):
+    """Получить настройки напоминаний семьи (из памяти, без запроса к базе)"""
+    if family_id not in reminder_contexts:
+        load_reminder_contexts(family_id)
+    return reminder_contexts.get(family_id)
+
+async def send_to_family(family_id, message, buttons=None, label="напоминание", priority=notifications.NORMAL):
+    """Отправить сообщение всем членам семьи (параллельно, через очередь с лимитами)"""
+    members = (get_reminder_settings(family_id) or {}).get("members", [])
+    return await notifications.default.dispatch(members, message, buttons, label, priority)
+
+async def queued_edit(event, *args, **kwargs):
+    """event.edit через очередь исходящих сообщений (в приоритете ответов пользователю)"""
+    return await notifications.outbound.call(event.chat_id, lambda: event.edit(*args, **kwargs), notifications.INTERACTIVE)
+
+def interval_reminder_windows(last_time, interval):
+    """Окна напоминаний по интервалу: заранее, вовремя и срочно"""
+    due = last_time + timedelta(hours=interval)
+    return [
+        (due - timedelta(minutes=15), due, "soon", REMINDER_REPEAT),  # За 15 минут до интервала
+        (due, due + timedelta(minutes=30), "due", REMINDER_REPEAT),  # В пределах 30 минут после интервала
+        (due + timedelta(hours=1), None, "urgent", REMINDER_REPEAT),  # Через час после интервала
+    ]
 
-def should_send_feeding_reminder(family_id):
-    """Проверить, нужно ли отправить напоминание о кормлении"""
-    conn = sqlite3.connect("babybot.db")
-    cur = conn.cursor()
-    
-    # Получаем интервал кормления для семьи
-    cur.execute("SELECT feed_interval FROM settings WHERE family_id = ?", (family_id,))
-    result = cur.fetchone()
-    
-    if not result:
-        conn.close()
-        return False
-    
-    feed_interval = result[0]  # в часах
+def feeding_reminder_windows(family_id):
+    settings = get_reminder_settings(family_id)
+    if not settings or not settings["tips_enabled"]:
+        return []
     last_feeding = get_last_feeding_time_for_family(family_id)
-    
     if not last_feeding:
-        # Если кормлений еще не было, напоминаем через 2 часа после создания семьи
-        return True
-    
-    # Вычисляем, сколько времени прошло с последнего кормления
-    time_since_last = datetime.now() - last_feeding
+        # Кормлений еще не было — напоминаем каждые 30 минут
+        return [(REMINDERS_EPOCH, None, "first", timedelta(minutes=30))]
+    return interval_reminder_windows(last_feeding, settings["feed_interval"] or 3)
+
+async def send_feeding_reminder(family_id, stage):
+    """Отправить напоминание о кормлении"""
+    feed_interval = (get_reminder_settings(family_id) or {}).get("feed_interval") or 3
+    last_feeding = get_last_feeding_time_for_family(family_id)
+
+    if stage == "first" or not last_feeding:
+        message = (
+            f"🍼 **Первое кормление!**\n\n"
+            f"👶 Пора начать отслеживать кормления\n"
+            f"🔄 Рекомендуемый интервал: {feed_interval} ч.\n\n"
+            f"💡 Запишите первое кормление!"
+        )
+        await send_to_family(family_id, message, label="напоминание о кормлении")
+        return
+
+    # Используем тайское время для точности
+    time_since_last = get_thai_time() - last_feeding
     hours_since_last = time_since_last.total_seconds() / 3600
-    
-    # Если прошло больше интервала + 30 минут (буфер), отправляем напоминание
-    return hours_since_last >= (feed_interval + 0.5)
-    
-    conn.close()
+    minutes_since_last = time_since_last.total_seconds() / 60
 
-@scheduler.scheduled_job('interval', minutes=30)
-async def check_feeding_reminders():
-    """Проверять каждые 30 минут, нужно ли отправить напоминания о кормлении"""
-    try:
-        conn = sqlite3.connect("babybot.db")
-        cur = conn.cursor()
-        
-        # Получаем все семьи с включенными уведомлениями
-        cur.execute("SELECT family_id FROM settings WHERE tips_enabled = 1")
-        families = cur.fetchall()
-        
-        for (family_id,) in families:
-            if should_send_feeding_reminder(family_id):
-                # Получаем всех членов семьи
-                cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                members = cur.fetchall()
-                
-                # Получаем интервал кормления
-                cur.execute("SELECT feed_interval FROM settings WHERE family_id = ?", (family_id,))
-                interval_result = cur.fetchone()
-                feed_interval = interval_result[0] if interval_result else 3
-                
-                # Получаем время последнего кормления
-                last_feeding = get_last_feeding_time_for_family(family_id)
-                
-                if last_feeding:
-                    time_since_last = datetime.now() - last_feeding
-                    hours_since_last = time_since_last.total_seconds() / 3600
-                    message = (
-                        f"🍼 **Напоминание о кормлении!**\n\n"
-                        f"⏰ Прошло: {hours_since_last:.1f} ч. с последнего кормления\n"
-                        f"📅 Последнее кормление: {last_feeding.strftime('%H:%M')}\n"
-                        f"🔄 Рекомендуемый интервал: {feed_interval} ч.\n\n"
-                        f"💡 Не забудьте покормить малыша!"
-                    )
-                else:
-                    message = (
-                        f"🍼 **Первое кормление!**\n\n"
-                        f"👶 Пора начать отслеживать кормления\n"
-                        f"🔄 Рекомендуемый интервал: {feed_interval} ч.\n\n"
-                        f"💡 Запишите первое кормление!"
-                    )
-                
-                # Отправляем уведомление всем членам семьи
-                for (user_id,) in members:
-                    try:
-                        await client.send_message(user_id, message)
-                        print(f"✅ Отправлено напоминание о кормлении пользователю {user_id}")
-                    except Exception as e:
-                        print(f"❌ Ошибка отправки напоминания пользователю {user_id}: {e}")
-        
-        conn.close()
-    except Exception as e:
-        print(f"❌ Ошибка в check_feeding_reminders: {e}")
+    if stage == "due":
+        # Создаем сообщение с кнопками для быстрых действий
+        message = (
+            f"🍼 **Время кормления!**\n\n"
+            f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последнего кормления\n"
+            f"📅 Последнее кормление: {last_feeding.strftime('%H:%M')}\n"
+            f"🔄 Интервал: {feed_interval} ч.\n\n"
+            f"💡 Пора покормить малыша!\n\n"
+            f"🔄 Нажмите кнопку ниже, чтобы зафиксировать кормление:"
+        )
+        buttons = [
+            [Button.inline("🍼 Кормить сейчас", b"feed_now")],
+            [Button.inline("15 мин назад", b"feed_15")],
+            [Button.inline("30 мин назад", b"feed_30")]
+        ]
+        await send_to_family(family_id, message, buttons, "уведомление о кормлении")
+    elif stage == "urgent":
+        urgent_message = (
+            f"🚨 **СРОЧНО! Долго не кормили!**\n\n"
+            f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последнего кормления\n"
+            f"📅 Последнее кормление: {last_feeding.strftime('%H:%M')}\n"
+            f"🔄 Интервал: {feed_interval} ч.\n\n"
+            f"⚠️ Малыш может быть голоден! Немедленно покормите!"
+        )
+        await send_to_family(family_id, urgent_message, label="срочное уведомление о кормлении", priority=notifications.URGENT)
+    else:
+        pre_message = (
+            f"⏰ **Скоро время кормления**\n\n"
+            f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последнего кормления\n"
+            f"📅 Последнее кормление: {last_feeding.strftime('%H:%M')}\n"
+            f"🔄 Интервал: {feed_interval} ч.\n\n"
+            f"💡 Через {feed_interval - hours_since_last:.1f} ч. пора будет кормить малыша"
+        )
+        await send_to_family(family_id, pre_message, label="предварительное уведомление о кормлении")
 
-@scheduler.scheduled_job('interval', minutes=1)
-async def send_scheduled_tips():
-    """Отправлять советы по расписанию для каждой семьи"""
-    try:
-        current_time = datetime.now()
-        current_hour = current_time.hour
-        current_minute = current_time.minute
-        
-        conn = sqlite3.connect("babybot.db")
-        cur = conn.cursor()
-        
-        # Получаем все семьи с включенными советами
-        cur.execute("SELECT family_id, tips_time_hour, tips_time_minute FROM settings WHERE tips_enabled = 1")
-        families = cur.fetchall()
-        
-        for (family_id, tips_hour, tips_minute) in families:
-            # Проверяем, пора ли отправлять советы для этой семьи
-            if current_hour == tips_hour and current_minute == tips_minute:
-                # Получаем возрастной совет для семьи
-                tip = get_age_based_tip(family_id)
-                
-                # Получаем всех членов семьи
-                cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                members = cur.fetchall()
-                
-                # Отправляем совет всем членам семьи
-                for (user_id,) in members:
-                    try:
-                        await client.send_message(user_id, tip)
-                        print(f"✅ Отправлен возрастной совет пользователю {user_id} в {current_hour:02d}:{current_minute:02d}")
-                    except Exception as e:
-                        print(f"❌ Ошибка отправки совета пользователю {user_id}: {e}")
-        
-        conn.close()
-    except Exception as e:
-        print(f"❌ Ошибка в send_scheduled_tips: {e}")
+def diaper_reminder_windows(family_id):
+    settings = get_reminder_settings(family_id)
+    if not settings or not settings["tips_enabled"]:
+        return []
+    last_diaper = get_last_diaper_change_for_family(family_id)
+    if not last_diaper:
+        return []
+    return interval_reminder_windows(last_diaper, settings["diaper_interval"] or 2)
 
-@scheduler.scheduled_job('interval', minutes=15)
-async def send_scheduled_feeding_reminders():
-    """Отправлять регулярные напоминания о кормлении по расписанию"""
-    try:
-        conn = sqlite3.connect("babybot.db")
-        cur = conn.cursor()
-        
-        # Получаем все семьи с включенными уведомлениями
-        cur.execute("SELECT family_id FROM settings WHERE tips_enabled = 1")
-        families = cur.fetchall()
-        
-        for (family_id,) in families:
-            # Получаем интервал кормления
-            cur.execute("SELECT feed_interval FROM settings WHERE family_id = ?", (family_id,))
-            interval_result = cur.fetchone()
-            feed_interval = interval_result[0] if interval_result else 3
-            
-            # Получаем время последнего кормления
-            last_feeding = get_last_feeding_time_for_family(family_id)
-            
-            if last_feeding:
-                # Используем тайское время для точности
-                current_time = get_thai_time()
-                time_since_last = current_time - last_feeding
-                hours_since_last = time_since_last.total_seconds() / 3600
-                minutes_since_last = time_since_last.total_seconds() / 60
-                
-                # Определяем статус и отправляем уведомления
-                if hours_since_last >= feed_interval:
-                    # Пора кормить!
-                    if hours_since_last < (feed_interval + 0.5):  # В пределах 30 минут после интервала
-                        # Получаем всех членов семьи
-                        cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                        members = cur.fetchall()
-                        
-                        # Создаем сообщение с кнопками для быстрых действий
-                        message = (
-                            f"🍼 **Время кормления!**\n\n"
-                            f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последнего кормления\n"
-                            f"📅 Последнее кормление: {last_feeding.strftime('%H:%M')}\n"
-                            f"🔄 Интервал: {feed_interval} ч.\n\n"
-                            f"💡 Пора покормить малыша!\n\n"
-                            f"🔄 Нажмите кнопку ниже, чтобы зафиксировать кормление:"
-                        )
-                        
-                        # Создаем кнопки для быстрых действий
-                        buttons = [
-                            [Button.inline("🍼 Кормить сейчас", b"feed_now")],
-                            [Button.inline("15 мин назад", b"feed_15")],
-                            [Button.inline("30 мин назад", b"feed_30")]
-                        ]
-                        
-                        # Отправляем уведомление всем членам семьи
-                        for (user_id,) in members:
-                            try:
-                                await client.send_message(user_id, message, buttons=buttons)
-                                print(f"✅ Отправлено уведомление о кормлении пользователю {user_id}")
-                            except Exception as e:
-                                print(f"❌ Ошибка отправки уведомления о кормлении пользователю {user_id}: {e}")
-                    
-                    elif hours_since_last >= (feed_interval + 1):  # Через час после интервала - срочное уведомление
-                        # Получаем всех членов семьи
-                        cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                        members = cur.fetchall()
-                        
-                        # Срочное уведомление
-                        urgent_message = (
-                            f"🚨 **СРОЧНО! Долго не кормили!**\n\n"
-                            f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последнего кормления\n"
-                            f"📅 Последнее кормление: {last_feeding.strftime('%H:%M')}\n"
-                            f"🔄 Интервал: {feed_interval} ч.\n\n"
-                            f"⚠️ Малыш может быть голоден! Немедленно покормите!"
-                        )
-                        
-                        # Отправляем срочное уведомление всем членам семьи
-                        for (user_id,) in members:
-                            try:
-                                await client.send_message(user_id, urgent_message)
-                                print(f"🚨 Отправлено срочное уведомление о кормлении пользователю {user_id}")
-                            except Exception as e:
-                                print(f"❌ Ошибка отправки срочного уведомления пользователю {user_id}: {e}")
-                
-                elif hours_since_last >= (feed_interval - 0.25):  # За 15 минут до интервала - предварительное уведомление
-                    # Получаем всех членов семьи
-                    cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                    members = cur.fetchall()
-                    
-                    # Предварительное уведомление
-                    pre_message = (
-                        f"⏰ **Скоро время кормления**\n\n"
-                        f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последнего кормления\n"
-                        f"📅 Последнее кормление: {last_feeding.strftime('%H:%M')}\n"
-                        f"🔄 Интервал: {feed_interval} ч.\n\n"
-                        f"💡 Через {feed_interval - hours_since_last:.1f} ч. пора будет кормить малыша"
-                    )
-                    
-                    # Отправляем предварительное уведомление всем членам семьи
-                    for (user_id,) in members:
-                        try:
-                            await client.send_message(user_id, pre_message)
-                            print(f"⏰ Отправлено предварительное уведомление о кормлении пользователю {user_id}")
-                        except Exception as e:
-                            print(f"❌ Ошибка отправки предварительного уведомления пользователю {user_id}: {e}")
-        
-        conn.close()
-    except Exception as e:
-        print(f"❌ Ошибка в send_scheduled_feeding_reminders: {e}")
+async def send_diaper_reminder(family_id, stage):
+    """Отправить напоминание о смене подгузника"""
+    diaper_interval = (get_reminder_settings(family_id) or {}).get("diaper_interval") or 2
+    last_diaper = get_last_diaper_change_for_family(family_id)
+    if not last_diaper:
+        return
 
-@scheduler.scheduled_job('interval', minutes=15)
-async def send_scheduled_diaper_reminders():
-    """Отправлять регулярные напоминания о смене подгузника по расписанию"""
-    try:
-        conn = sqlite3.connect("babybot.db")
-        cur = conn.cursor()
-        
-        # Получаем все семьи с включенными уведомлениями
-        cur.execute("SELECT family_id FROM settings WHERE tips_enabled = 1")
-        families = cur.fetchall()
-        
-        for (family_id,) in families:
-            # Получаем интервал смены подгузника
-            cur.execute("SELECT diaper_interval FROM settings WHERE family_id = ?", (family_id,))
-            interval_result = cur.fetchone()
-            diaper_interval = interval_result[0] if interval_result else 2
-            
-            # Получаем время последней смены подгузника
-            last_diaper = get_last_diaper_change_for_family(family_id)
-            
-            if last_diaper:
-                # Используем тайское время для точности
-                current_time = get_thai_time()
-                time_since_last = current_time - last_diaper
-                hours_since_last = time_since_last.total_seconds() / 3600
-                minutes_since_last = time_since_last.total_seconds() / 60
-                
-                # Определяем статус и отправляем уведомления
-                if hours_since_last >= diaper_interval:
-                    # Пора менять подгузник!
-                    if hours_since_last < (diaper_interval + 0.5):  # В пределах 30 минут после интервала
-                        # Получаем всех членов семьи
-                        cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                        members = cur.fetchall()
-                        
-                        # Создаем сообщение с кнопками для быстрых действий
-                        message = (
-                            f"🧷 **Время сменить подгузник!**\n\n"
-                            f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последней смены\n"
-                            f"📅 Последняя смена: {last_diaper.strftime('%H:%M')}\n"
-                            f"🔄 Интервал: {diaper_interval} ч.\n\n"
-                            f"💡 Пора сменить подгузник малышу!\n\n"
-                            f"🔄 Нажмите кнопку ниже, чтобы зафиксировать смену:"
-                        )
-                        
-                        # Создаем кнопки для быстрых действий
-                        buttons = [
-                            [Button.inline("🧷 Сменить сейчас", b"diaper_now")],
-                            [Button.inline("15 мин назад", b"diaper_15")],
-                            [Button.inline("30 мин назад", b"diaper_30")]
-                        ]
-                        
-                        # Отправляем уведомление всем членам семьи
-                        for (user_id,) in members:
-                            try:
-                                await client.send_message(user_id, message, buttons=buttons)
-                                print(f"✅ Отправлено уведомление о смене подгузника пользователю {user_id}")
-                            except Exception as e:
-                                print(f"❌ Ошибка отправки уведомления о смене подгузника пользователю {user_id}: {e}")
-                    
-                    elif hours_since_last >= (diaper_interval + 1):  # Через час после интервала - срочное уведомление
-                        # Получаем всех членов семьи
-                        cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                        members = cur.fetchall()
-                        
-                        # Срочное уведомление
-                        urgent_message = (
-                            f"🚨 **СРОЧНО! Долго не меняли подгузник!**\n\n"
-                            f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последней смены\n"
-                            f"📅 Последняя смена: {last_diaper.strftime('%H:%M')}\n"
-                            f"🔄 Интервал: {diaper_interval} ч.\n\n"
-                            f"⚠️ Малыш может испытывать дискомфорт! Немедленно смените подгузник!"
-                        )
-                        
-                        # Отправляем срочное уведомление всем членам семьи
-                        for (user_id,) in members:
-                            try:
-                                await client.send_message(user_id, urgent_message)
-                                print(f"🚨 Отправлено срочное уведомление о смене подгузника пользователю {user_id}")
-                            except Exception as e:
-                                print(f"❌ Ошибка отправки срочного уведомления о смене подгузника пользователю {user_id}: {e}")
-                
-                elif hours_since_last >= (diaper_interval - 0.25):  # За 15 минут до интервала - предварительное уведомление
-                    # Получаем всех членов семьи
-                    cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                    members = cur.fetchall()
-                    
-                    # Предварительное уведомление
-                    pre_message = (
-                        f"⏰ **Скоро время сменить подгузник**\n\n"
-                        f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последней смены\n"
-                        f"📅 Последняя смена: {last_diaper.strftime('%H:%M')}\n"
-                        f"🔄 Интервал: {diaper_interval} ч.\n\n"
-                        f"💡 Через {diaper_interval - hours_since_last:.1f} ч. пора будет менять подгузник"
-                    )
-                    
-                    # Отправляем предварительное уведомление всем членам семьи
-                    for (user_id,) in members:
-                        try:
-                            await client.send_message(user_id, pre_message)
-                            print(f"⏰ Отправлено предварительное уведомление о смене подгузника пользователю {user_id}")
-                        except Exception as e:
-                            print(f"❌ Ошибка отправки предварительного уведомления о смене подгузника пользователю {user_id}: {e}")
-        
-        conn.close()
-    except Exception as e:
-        print(f"❌ Ошибка в send_scheduled_diaper_reminders: {e}")
+    # Используем тайское время для точности
+    time_since_last = get_thai_time() - last_diaper
+    hours_since_last = time_since_last.total_seconds() / 3600
+    minutes_since_last = time_since_last.total_seconds() / 60
 
-# Новые планировщики для купания, игр и сна
-@scheduler.scheduled_job('interval', minutes=30)
-async def send_bath_reminders():
-    """Отправлять напоминания о купании по расписанию"""
-    try:
-        current_time = get_thai_time()
-        current_hour = current_time.hour
-        current_minute = current_time.minute
-        
-        conn = sqlite3.connect("babybot.db")
-        cur = conn.cursor()
-        
-        # Получаем все семьи с включенными напоминаниями о купании
-        cur.execute("SELECT family_id, bath_reminder_hour, bath_reminder_minute, bath_reminder_period FROM settings WHERE bath_reminder_enabled = 1")
-        families = cur.fetchall()
-        
-        for (family_id, reminder_hour, reminder_minute, period) in families:
-            # Проверяем, пора ли отправлять напоминание о купании
-            if current_hour == reminder_hour and current_minute == reminder_minute:
-                # Получаем время последнего купания
-                last_bath = get_last_bath_time_for_family(family_id)
-                
-                if last_bath:
-                    # Проверяем, прошло ли достаточно времени
-                    days_since_last = (current_time - last_bath).days
-                    
-                    if days_since_last >= period:
-                        # Получаем всех членов семьи
-                        cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                        members = cur.fetchall()
-                        
-                        # Создаем сообщение с кнопкой переноса
-                        message = (
-                            f"🛁 **Время купания!**\n\n"
-                            f"⏰ Прошло: {days_since_last} дней с последнего купания\n"
-                            f"📅 Последнее купание: {last_bath.strftime('%d.%m в %H:%M')}\n"
-                            f"🔄 Период: {period} день(ей)\n\n"
-                            f"💡 Пора искупать малыша!\n\n"
-                            f"🔄 Нажмите кнопку ниже, чтобы зафиксировать купание:"
-                        )
-                        
-                        # Создаем кнопки
-                        buttons = [
-                            [Button.inline("🛁 Купать сейчас", b"bath_now")],
-                            [Button.inline("15 мин назад", b"bath_15")],
-                            [Button.inline("30 мин назад", b"bath_30")]
-                        ]
-                        
-                        # Отправляем уведомление всем членам семьи
-                        for (user_id,) in members:
-                            try:
-                                await client.send_message(user_id, message, buttons=buttons)
-                                print(f"✅ Отправлено напоминание о купании пользователю {user_id}")
-                            except Exception as e:
-                                print(f"❌ Ошибка отправки напоминания о купании пользователю {user_id}: {e}")
-                else:
-                    # Первое купание
-                    cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                    members = cur.fetchall()
-                    
-                    message = (
-                        f"🛁 **Первое купание!**\n\n"
-                        f"👶 Пора начать купать малыша\n"
-                        f"🔄 Период: {period} день(ей)\n\n"
-                        f"💡 Запишите первое купание!"
-                    )
-                    
-                    buttons = [
-                        [Button.inline("🛁 Купать сейчас", b"bath_now")]
-                    ]
-                    
-                    for (user_id,) in members:
-                        try:
-                            await client.send_message(user_id, message, buttons=buttons)
-                            print(f"✅ Отправлено напоминание о первом купании пользователю {user_id}")
-                        except Exception as e:
-                            print(f"❌ Ошибка отправки напоминания о первом купании пользователю {user_id}: {e}")
-        
-        conn.close()
-    except Exception as e:
-        print(f"❌ Ошибка в send_bath_reminders: {e}")
+    if stage == "due":
+        # Создаем сообщение с кнопками для быстрых действий
+        message = (
+            f"🧷 **Время сменить подгузник!**\n\n"
+            f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последней смены\n"
+            f"📅 Последняя смена: {last_diaper.strftime('%H:%M')}\n"
+            f"🔄 Интервал: {diaper_interval} ч.\n\n"
+            f"💡 Пора сменить подгузник малышу!\n\n"
+            f"🔄 Нажмите кнопку ниже, чтобы зафиксировать смену:"
+        )
+        buttons = [
+            [Button.inline("🧷 Сменить сейчас", b"diaper_now")],
+            [Button.inline("15 мин назад", b"diaper_15")],
+            [Button.inline("30 мин назад", b"diaper_30")]
+        ]
+        await send_to_family(family_id, message, buttons, "уведомление о смене подгузника")
+    elif stage == "urgent":
+        urgent_message = (
+            f"🚨 **СРОЧНО! Долго не меняли подгузник!**\n\n"
+            f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последней смены\n"
+            f"📅 Последняя смена: {last_diaper.strftime('%H:%M')}\n"
+            f"🔄 Интервал: {diaper_interval} ч.\n\n"
+            f"⚠️ Малыш может испытывать дискомфорт! Немедленно смените подгузник!"
+        )
+        await send_to_family(family_id, urgent_message, label="срочное уведомление о смене подгузника", priority=notifications.URGENT)
+    else:
+        pre_message = (
+            f"⏰ **Скоро время сменить подгузник**\n\n"
+            f"⏰ Прошло: {hours_since_last:.1f} ч. ({minutes_since_last:.0f} мин.) с последней смены\n"
+            f"📅 Последняя смена: {last_diaper.strftime('%H:%M')}\n"
+            f"🔄 Интервал: {diaper_interval} ч.\n\n"
+            f"💡 Через {diaper_interval - hours_since_last:.1f} ч. пора будет менять подгузник"
+        )
+        await send_to_family(family_id, pre_message, label="предварительное уведомление о смене подгузника")
 
-@scheduler.scheduled_job('interval', minutes=15)
-async def send_smart_activity_reminders():
-    """Отправлять умные напоминания об играх - не раньше чем за 20 минут до еды"""
-    try:
-        conn = sqlite3.connect("babybot.db")
-        cur = conn.cursor()
-        
-        # Получаем все семьи с включенными напоминаниями об играх
-        cur.execute("SELECT family_id, activity_reminder_interval, baby_age_months FROM settings WHERE activity_reminder_enabled = 1")
-        families = cur.fetchall()
-        
-        for (family_id, interval, age_months) in families:
-            # Получаем время последней активности
-            last_activity = get_last_activity_time_for_family(family_id, "tummy_time")
-            
-            # Получаем интервал кормления для этой семьи
-            cur.execute("SELECT feed_interval FROM settings WHERE family_id = ?", (family_id,))
-            feed_interval_result = cur.fetchone()
-            feed_interval = feed_interval_result[0] if feed_interval_result else 3
-            
-            # Получаем время последнего кормления
-            last_feeding = get_last_feeding_time_for_family(family_id)
-            
-            if last_activity and last_feeding:
-                # Используем тайское время для точности
-                current_time = get_thai_time()
-                time_since_last_activity = current_time - last_activity
-                time_since_last_feeding = current_time - last_feeding
-                
-                hours_since_last_activity = time_since_last_activity.total_seconds() / 3600
-                hours_since_last_feeding = time_since_last_feeding.total_seconds() / 3600
-                
-                # Проверяем, пора ли играть (по интервалу активности)
-                if hours_since_last_activity >= interval:
-                    # Проверяем, не слишком ли близко к кормлению (не раньше чем за 20 минут)
-                    minutes_until_feeding = (feed_interval - hours_since_last_feeding) * 60
-                    
-                    if minutes_until_feeding >= 20:  # Не раньше чем за 20 минут до еды
-                        # Получаем всех членов семьи
-                        cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                        members = cur.fetchall()
-                        
-                        # Получаем рекомендации по возрасту
-                        activities = get_age_appropriate_activities(age_months)
-                        
-                        # Создаем сообщение с рекомендациями
-                        message = (
-                            f"🎮 **Время игр и активностей!**\n\n"
-                            f"⏰ Прошло: {hours_since_last_activity:.1f} ч. с последней активности\n"
-                            f"📅 Последняя активность: {last_activity.strftime('%H:%M')}\n"
-                            f"🔄 Интервал: {interval} ч.\n"
-                            f"👶 Возраст: {age_months} мес.\n"
-                            f"🍼 До следующего кормления: {minutes_until_feeding:.0f} мин.\n\n"
-                            f"💡 **Рекомендации для вашего возраста:**\n"
-                            f"🦵 Выкладывание на живот: {activities['tummy_time']}\n"
-                            f"🎯 Игры: {activities['play']}\n"
-                            f"💆 Массаж: {activities['massage']}\n\n"
-                            f"🔄 Нажмите кнопку ниже, чтобы зафиксировать активность:"
-                        )
-                        
-                        # Создаем кнопки для быстрых действий
-                        buttons = [
-                            [Button.inline("🦵 Выкладывание на живот", b"activity_tummy")],
-                            [Button.inline("🎯 Играть сейчас", b"activity_play")],
-                            [Button.inline("💆 Массаж", b"activity_massage")]
-                        ]
-                        
-                        # Отправляем уведомление всем членам семьи
-                        for (user_id,) in members:
-                            try:
-                                await client.send_message(user_id, message, buttons=buttons)
-                                print(f"✅ Отправлено умное напоминание об играх пользователю {user_id}")
-                            except Exception as e:
-                                print(f"❌ Ошибка отправки умного напоминания об играх пользователю {user_id}: {e}")
-            elif not last_activity and last_feeding:
-                # Первая активность - проверяем время до кормления
-                current_time = get_thai_time()
-                time_since_last_feeding = current_time - last_feeding
-                hours_since_last_feeding = time_since_last_feeding.total_seconds() / 3600
-                minutes_until_feeding = (feed_interval - hours_since_last_feeding) * 60
-                
-                if minutes_until_feeding >= 20:  # Не раньше чем за 20 минут до еды
-                    cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                    members = cur.fetchall()
-                    
-                    activities = get_age_appropriate_activities(age_months)
-                    
-                    message = (
-                        f"🎮 **Первая активность!**\n\n"
-                        f"👶 Пора начать играть с малышом\n"
-                        f"🔄 Рекомендуемый интервал: {interval} ч.\n"
-                        f"👶 Возраст: {age_months} мес.\n"
-                        f"🍼 До следующего кормления: {minutes_until_feeding:.0f} мин.\n\n"
-                        f"💡 **Рекомендации для вашего возраста:**\n"
-                        f"🦵 Выкладывание на живот: {activities['tummy_time']}\n"
-                        f"🎯 Игры: {activities['play']}\n"
-                        f"💆 Массаж: {activities['massage']}\n\n"
-                        f"🔄 Начните с выкладывания на живот!"
-                    )
-                    
-                    buttons = [
-                        [Button.inline("🦵 Выкладывание на живот", b"activity_tummy")],
-                        [Button.inline("🎯 Играть сейчас", b"activity_play")],
-                        [Button.inline("💆 Массаж", b"activity_massage")]
-                    ]
-                    
-                    for (user_id,) in members:
-                        try:
-                            await client.send_message(user_id, message, buttons=buttons)
-                            print(f"✅ Отправлено умное напоминание о первой активности пользователю {user_id}")
-                        except Exception as e:
-                            print(f"❌ Ошибка отправки умного напоминания о первой активности пользователю {user_id}: {e}")
-        
-        conn.close()
-    except Exception as e:
-        print(f"❌ Ошибка в send_smart_activity_reminders: {e}")
+def daily_windows(family_id, hour, minute, stage, days=(0, 1)):
+    """Окна ежедневного напоминания в местное время семьи (по одной минуте)
 
-@scheduler.scheduled_job('interval', minutes=15)
-async def monitor_sleep_and_feeding():
-    """Мониторить сон и предупреждать о кормлении"""
-    try:
-        conn = sqlite3.connect("babybot.db")
-        cur = conn.cursor()
-        
-        # Получаем все семьи с включенным мониторингом сна
-        cur.execute("SELECT family_id FROM settings WHERE sleep_monitoring_enabled = 1")
-        families = cur.fetchall()
-        
-        for (family_id,) in families:
-            # Получаем активную сессию сна
-            active_sleep = get_active_sleep_session(family_id)
-            
-            if active_sleep:
-                # Получаем интервал кормления
-                cur.execute("SELECT feed_interval FROM settings WHERE family_id = ?", (family_id,))
-                interval_result = cur.fetchone()
-                feed_interval = interval_result[0] if interval_result else 3
-                
-                # Проверяем, нужно ли разбудить для кормления
-                should_wake = should_wake_for_feeding(active_sleep["start_time"], feed_interval)
-                
-                if should_wake:
-                    # Получаем всех членов семьи
-                    cur.execute("SELECT user_id FROM family_members WHERE family_id = ?", (family_id,))
-                    members = cur.fetchall()
-                    
-                    sleep_duration = get_thai_time() - active_sleep["start_time"]
-                    hours = int(sleep_duration.total_seconds() // 3600)
-                    minutes = int((sleep_duration.total_seconds() % 3600) // 60)
-                    
-                    # Предупреждение о кормлении
-                    warning_message = (
-                        f"⚠️ **ВНИМАНИЕ! Малыш спит дольше интервала кормления!**\n\n"
-                        f"😴 Малыш спит уже: {hours}ч {minutes}м\n"
-                        f"⏰ Начало сна: {active_sleep['start_time'].strftime('%H:%M')}\n"
-                        f"🔄 Интервал кормления: {feed_interval} ч.\n\n"
-                        f"🍼 **Рекомендуется разбудить для кормления!**\n\n"
-                        f"💡 Малыш может проснуться голодным, если сон выпадает на кормление"
-                    )
-                    
-                    # Отправляем предупреждение всем членам семьи
-                    for (user_id,) in members:
-                        try:
-                            await client.send_message(user_id, warning_message)
-                            print(f"⚠️ Отправлено предупреждение о сне и кормлении пользователю {user_id}")
-                        except Exception as e:
-                            print(f"❌ Ошибка отправки предупреждения о сне и кормлении пользователю {user_id}: {e}")
-        
-        conn.close()
-    except Exception as e:
-        print(f"❌ Ошибка в monitor_sleep_and_feeding: {e}")
+    Сдвиг семьи в пределах DAILY_REMINDER_SPREAD постоянен, поэтому
+    напоминание приходит каждый день в одно и то же время.
+    """
+    today = get_thai_time(family_id).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return reminders.daily_windows(today, stage, days, reminders.spread_offset(family_id, DAILY_REMINDER_SPREAD))
+
+def tips_reminder_windows(family_id):
+    settings = get_reminder_settings(family_id)
+    if not settings or not settings["tips_enabled"]:
+        return []
+    return daily_windows(family_id, settings["tips_time_hour"] or 0, settings["tips_time_minute"] or 0, "tip")
+
+async def send_tip_reminder(family_id, stage):
+    """Отправить возрастной совет по расписанию"""
+    tip = get_age_based_tip(family_id)
+    await send_to_family(family_id, tip, label="возрастной совет", priority=notifications.LOW)
+
+def bath_reminder_windows(family_id):
+    settings = get_reminder_settings(family_id)
+    if not settings or not settings["bath_reminder_enabled"]:
+        return []
+    period = settings["bath_reminder_period"] or 1
+    last_bath = get_last_bath_time_for_family(family_id)
+
+    # Ближайшие дни, в которые с последнего купания прошло не меньше периода
+    stage = "first" if last_bath is None else "bath"
+    candidates = daily_windows(family_id, settings["bath_reminder_hour"] or 0, settings["bath_reminder_minute"] or 0,
+                               stage, range(period + 2))
+    return reminders.every_n_days(candidates, last_bath, period)
+
+async def send_bath_reminder(family_id, stage):
+    """Отправить напоминание о купании"""
+    settings = get_reminder_settings(family_id) or {}
+    period = settings.get("bath_reminder_period") or 1
+    last_bath = get_last_bath_time_for_family(family_id)
+
+    if stage == "first" or not last_bath:
+        message = (
+            f"🛁 **Первое купание!**\n\n"
+            f"👶 Пора начать купать малыша\n"
+            f"🔄 Период: {period} день(ей)\n\n"
+            f"💡 Запишите первое купание!"
+        )
+        buttons = [
+            [Button.inline("🛁 Купать сейчас", b"bath_now")]
+        ]
+        await send_to_family(family_id, message, buttons, "напоминание о первом купании")
+        return
+
+    days_since_last = (get_thai_time() - last_bath).days
+    # Создаем сообщение с кнопкой переноса
+    message = (
+        f"🛁 **Время купания!**\n\n"
+        f"⏰ Прошло: {days_since_last} дней с последнего купания\n"
+        f"📅 Последнее купание: {last_bath.strftime('%d.%m в %H:%M')}\n"
+        f"🔄 Период: {period} день(ей)\n\n"
+        f"💡 Пора искупать малыша!\n\n"
+        f"🔄 Нажмите кнопку ниже, чтобы зафиксировать купание:"
+    )
+    buttons = [
+        [Button.inline("🛁 Купать сейчас", b"bath_now")],
+        [Button.inline("15 мин назад", b"bath_15")],
+        [Button.inline("30 мин назад", b"bath_30")]
+    ]
+    await send_to_family(family_id, message, buttons, "напоминание о купании")
+
+def activity_reminder_windows(family_id):
+    """Игры — не раньше чем за 20 минут до еды"""
+    settings = get_reminder_settings(family_id)
+    if not settings or not settings["activity_reminder_enabled"]:
+        return []
+    last_feeding = get_last_feeding_time_for_family(family_id)
+    if not last_feeding:
+        return []
+    last_activity = get_last_activity_time_for_family(family_id, "tummy_time")
+
+    end = last_feeding + timedelta(hours=settings["feed_interval"] or 3, minutes=-20)
+    if last_activity:
+        start = last_activity + timedelta(hours=settings["activity_reminder_interval"] or 2)
+        return [(start, end, "activity", REMINDER_REPEAT)]
+    return [(last_feeding, end, "first", REMINDER_REPEAT)]
+
+async def send_activity_reminder(family_id, stage):
+    """Отправить умное напоминание об играх"""
+    settings = get_reminder_settings(family_id) or {}
+    interval = settings.get("activity_reminder_interval") or 2
+    age_months = settings.get("baby_age_months") or 0
+    feed_interval = settings.get("feed_interval") or 3
+    last_feeding = get_last_feeding_time_for_family(family_id)
+    last_activity = get_last_activity_time_for_family(family_id, "tummy_time")
+    if not last_feeding:
+        return
+
+    # Используем тайское время для точности
+    current_time = get_thai_time()
+    hours_since_last_feeding = (current_time - last_feeding).total_seconds() / 3600
+    minutes_until_feeding = (feed_interval - hours_since_last_feeding) * 60
+
+    # Получаем рекомендации по возрасту
+    activities = get_age_appropriate_activities(age_months)
+    buttons = [
+        [Button.inline("🦵 Выкладывание на живот", b"activity_tummy")],
+        [Button.inline("🎯 Играть сейчас", b"activity_play")],
+        [Button.inline("💆 Массаж", b"activity_massage")]
+    ]
+
+    if stage == "first" or not last_activity:
+        message = (
+            f"🎮 **Первая активность!**\n\n"
+            f"👶 Пора начать играть с малышом\n"
+            f"🔄 Рекомендуемый интервал: {interval} ч.\n"
+            f"👶 Возраст: {age_months} мес.\n"
+            f"🍼 До следующего кормления: {minutes_until_feeding:.0f} мин.\n\n"
+            f"💡 **Рекомендации для вашего возраста:**\n"
+            f"🦵 Выкладывание на живот: {activities['tummy_time']}\n"
+            f"🎯 Игры: {activities['play']}\n"
+            f"💆 Массаж: {activities['massage']}\n\n"
+            f"🔄 Начните с выкладывания на живот!"
+        )
+        await send_to_family(family_id, message, buttons, "умное напоминание о первой активности")
+        return
+
+    hours_since_last_activity = (current_time - last_activity).total_seconds() / 3600
+    message = (
+        f"🎮 **Время игр и активностей!**\n\n"
+        f"⏰ Прошло: {hours_since_last_activity:.1f} ч. с последней активности\n"
+        f"📅 Последняя активность: {last_activity.strftime('%H:%M')}\n"
+        f"🔄 Интервал: {interval} ч.\n"
+        f"👶 Возраст: {age_months} мес.\n"
+        f"🍼 До следующего кормления: {minutes_until_feeding:.0f} мин.\n\n"
+        f"💡 **Рекомендации для вашего возраста:**\n"
+        f"🦵 Выкладывание на живот: {activities['tummy_time']}\n"
+        f"🎯 Игры: {activities['play']}\n"
+        f"💆 Массаж: {activities['massage']}\n\n"
+        f"🔄 Нажмите кнопку ниже, чтобы зафиксировать активность:"
+    )
+    await send_to_family(family_id, message, buttons, "умное напоминание об играх")
+
+def sleep_reminder_windows(family_id):
+    """Сон дольше интервала кормления — предупреждаем"""
+    settings = get_reminder_settings(family_id)
+    if not settings or not settings["sleep_monitoring_enabled"]:
+        return []
+    active_sleep = get_active_sleep_session(family_id)
+    if not active_sleep:
+        return []
+    start = active_sleep["start_time"] + timedelta(hours=settings["feed_interval"] or 3)
+    return [(start, None, "wake", REMINDER_REPEAT)]
+
+async def send_sleep_reminder(family_id, stage):
+    """Предупредить, что малыш спит дольше интервала кормления"""
+    feed_interval = (get_reminder_settings(family_id) or {}).get("feed_interval") or 3
+    active_sleep = get_active_sleep_session(family_id)
+    if not active_sleep:
+        return
+
+    sleep_duration = get_thai_time() - active_sleep["start_time"]
+    hours = int(sleep_duration.total_seconds() // 3600)
+    minutes = int((sleep_duration.total_seconds() % 3600) // 60)
+
+    # Предупреждение о кормлении
+    warning_message = (
+        f"⚠️ **ВНИМАНИЕ! Малыш спит дольше интервала кормления!**\n\n"
+        f"😴 Малыш спит уже: {hours}ч {minutes}м\n"
+        f"⏰ Начало сна: {active_sleep['start_time'].strftime('%H:%M')}\n"
+        f"🔄 Интервал кормления: {feed_interval} ч.\n\n"
+        f"🍼 **Рекомендуется разбудить для кормления!**\n\n"
+        f"💡 Малыш может проснуться голодным, если сон выпадает на кормление"
+    )
+    await send_to_family(family_id, warning_message, label="предупреждение о сне и кормлении", priority=notifications.URGENT)
+
+reminders.default.register("feeding", feeding_reminder_windows, send_feeding_reminder)
+reminders.default.register("diaper", diaper_reminder_windows, send_diaper_reminder)
+reminders.default.register("tips", tips_reminder_windows, send_tip_reminder)
+reminders.default.register("bath", bath_reminder_windows, send_bath_reminder)
+reminders.default.register("activity", activity_reminder_windows, send_activity_reminder)
+reminders.default.register("sleep", sleep_reminder_windows, send_sleep_reminder)
 
 class HealthCheckHandler(http.server.BaseHTTPRequestHandler):
     def do_GET(self):
@@ -3230,7 +2560,7 @@ class HealthCheckHandler(http.server.BaseHTTPRequestHandler):
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            response = f'{{"status": "healthy", "bot": "running", "timestamp": "{current_time}", "health": "ok", "render_keepalive": "active"}}'
+            response = f'{{"status": "healthy", "bot": "running", "timestamp": "{current_time}", "health": "ok", "render_keepalive": "active", "notifications": {json.dumps(notifications.default.metrics())}, "outbound": {json.dumps(notifications.outbound.metrics())}}}'
             self.wfile.write(response.encode())
         elif self.path == '/render-ping':
             # Специальный endpoint для Render
@@ -3274,6 +2604,10 @@ async def start_bot():
         print("🌐 Health check server started")
         
         scheduler.start()
+        
+        # Рассчитываем расписание напоминаний и запускаем движок
+        reminders.default.warm(list(load_reminder_contexts()))
+        client.loop.create_task(reminders.default.run())
         print("✅ Бот запущен!")
         
         # Запускаем бота
@@ -3300,3 +2634,6 @@ if __name__ == "__main__":
         print("🔍 Проверьте логи для диагностики")
         import traceback
         traceback.print_exc()
+    finally:
+        # Отправляем накопленные изменения, не дожидаясь окна синхронизации
+        replication.default.flush()
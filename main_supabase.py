@@ -2,15 +2,19 @@ from telethon import TelegramClient, events, Button
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import asyncio
+import functools
 import random
 import threading
 import time
 import http.server
 import socketserver
-import pytz
 import subprocess
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+import cache
+import clock
+import postgrest
 
 # Конфигурация (загружается из переменных окружения)
 import os
@@ -47,61 +51,119 @@ except ValueError:
 
 print("✅ Все переменные окружения загружены успешно")
 
-# Функция для получения тайского времени
-def get_thai_time():
-    """Получить текущее время в тайском часовом поясе"""
-    thai_tz = pytz.timezone('Asia/Bangkok')
-    utc_now = datetime.now(pytz.UTC)
-    thai_now = utc_now.astimezone(thai_tz)
-    return thai_now
+# Время бота: часовой пояс семьи из настроек, по умолчанию тайский
+def get_thai_time(family_id=None):
+    """Получить текущее время в часовом поясе семьи (по умолчанию тайском)"""
+    return clock.default.now(family_id)
 
-def get_thai_date():
-    """Получить текущую дату в тайском часовом поясе"""
-    return get_thai_time().date()
+def get_thai_date(family_id=None):
+    """Получить текущую дату в часовом поясе семьи (по умолчанию тайском)"""
+    return get_thai_time(family_id).date()
+
+# Сколько секунд помнить семью, роль и часовой пояс семьи пользователя
+IDENTITY_CACHE_TTL = float(os.getenv('IDENTITY_CACHE_TTL', '60'))
 
 # Класс для работы с Supabase
 class SupabaseClient:
     def __init__(self, url, key):
         self.url = url
         self.key = key
-        self.headers = {
-            'apikey': key,
-            'Authorization': f'Bearer {key}',
-            'Content-Type': 'application/json'
+        # Пул соединений, таймауты, повторы и метрики — в postgrest.Client
+        self.http = postgrest.Client(url, key)
+        # Сбрасывается, если в базе нет функции family_last_events
+        self.last_events_rpc = True
+        # user_id -> член семьи с семьёй и её часовым поясом (см. get_identity)
+        self.identities = cache.ResponseCache(max_entries=10000, ttl=IDENTITY_CACHE_TTL)
+        # family_id -> часовой пояс из последней загруженной личности (loader часов)
+        self.family_timezones = {}
+    
+    def _make_request(self, method, endpoint, data=None, params=None):
+        """Выполняет HTTP запрос к Supabase
+
+        Для GET и DELETE data — параметры запроса, для POST и PATCH — тело
+        (фильтры PATCH передаются в params). POST и PATCH возвращают
+        записанные строки.
+        """
+        headers = None
+        if method in ('GET', 'DELETE'):
+            params, data = data, None
+        elif method in ('POST', 'PATCH'):
+            headers = {'Prefer': 'return=representation'}
+        else:
+            raise ValueError(f"Unsupported method: {method}")
+        
+        try:
+            return self.http.json(method, endpoint, params=params, json=data, headers=headers)
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Ошибка Supabase запроса: {e}")
+            return None
+    
+    def metrics(self):
+        """Время ответа и ошибки по эндпоинтам Supabase"""
+        return self.http.metrics()
+    
+    def _load_identity(self, user_id):
+        # Член семьи со вложенными семьёй и её часовым поясом — один запрос PostgREST;
+        # выбираются только колонки, которые читают обработчики
+        members = self.http.select('family_members', {
+            'user_id': f'eq.{user_id}',
+            'select': 'family_id,role,name,families(id,name,settings(timezone))',
+            'limit': '1'
+        })
+        if not members:
+            return None
+        member = members[0]
+        family = member.get('families') or {}
+        settings = family.pop('settings', None)
+        if isinstance(settings, list):
+            # Без UNIQUE(family_id) PostgREST отдаёт настройки массивом
+            settings = settings[0] if settings else None
+        timezone = (settings or {}).get('timezone')
+        self.remember_timezone(member['family_id'], timezone)
+        return {
+            'family_id': member['family_id'],
+            'role': member['role'],
+            'name': member['name'],
+            'family': family or None,
+            'timezone': timezone
         }
     
-    def _make_request(self, method, endpoint, data=None):
-        """Выполняет HTTP запрос к Supabase"""
-        url = f"{self.url}/rest/v1/{endpoint}"
-        
+    def remember_timezone(self, family_id, timezone):
+        """Запомнить пояс семьи; часы увидят новый пояс сразу, а не после FAMILY_TZ_TTL"""
+        if family_id in self.family_timezones and self.family_timezones[family_id] == timezone:
+            return
+        self.family_timezones[family_id] = timezone
+        clock.default.forget(family_id)
+    
+    def family_timezone(self, family_id):
+        """Пояс семьи без запроса к Supabase (None — пояс по умолчанию)
+
+        Loader часов вызывается и из обработчиков в цикле событий, поэтому
+        пояс берётся только из личностей, уже загруженных get_identity
+        в пуле потоков: обработчик всегда начинает с get_family_by_user.
+        """
+        return self.family_timezones.get(family_id)
+    
+    def get_identity(self, user_id):
+        """Семья, роль, имя и часовой пояс семьи пользователя (None, если он не в семье)
+
+        Ответ запоминается на IDENTITY_CACHE_TTL секунд, поэтому все обращения
+        одного обработчика стоят не больше одного запроса.
+        """
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=self.headers, params=data)
-            elif method == 'POST':
-                response = requests.post(url, headers=self.headers, json=data)
-            elif method == 'PATCH':
-                response = requests.patch(url, headers=self.headers, json=data)
-            elif method == 'DELETE':
-                response = requests.delete(url, headers=self.headers)
-            else:
-                raise ValueError(f"Unsupported method: {method}")
-            
-            response.raise_for_status()
-            return response.json() if response.content else None
+            return self.identities.get_or_load(user_id, 0, lambda: self._load_identity(user_id))
         except requests.exceptions.RequestException as e:
             print(f"❌ Ошибка Supabase запроса: {e}")
             return None
     
+    def forget_identity(self, user_id):
+        """Сбросить запомненную семью пользователя (вступил в семью, сменил роль)"""
+        self.identities.forget(user_id)
+    
     def get_family_by_user(self, user_id):
         """Получить семью пользователя"""
-        # Сначала ищем пользователя в family_members
-        members = self._make_request('GET', 'family_members', {'user_id': f'eq.{user_id}'})
-        if members and len(members) > 0:
-            family_id = members[0]['family_id']
-            # Получаем информацию о семье
-            family = self._make_request('GET', 'families', {'id': f'eq.{family_id}'})
-            return family[0] if family else None
-        return None
+        identity = self.get_identity(user_id)
+        return identity['family'] if identity else None
     
     def create_family(self, name):
         """Создать новую семью"""
@@ -117,14 +179,16 @@ class SupabaseClient:
             'role': role,
             'name': name
         }
-        return self._make_request('POST', 'family_members', data)
+        result = self._make_request('POST', 'family_members', data)
+        self.forget_identity(user_id)
+        return result
     
     def add_feeding(self, family_id, author_id, author_role, author_name):
         """Добавить кормление"""
         data = {
             'family_id': family_id,
             'author_id': author_id,
-            'timestamp': get_thai_time().isoformat(),
+            'timestamp': get_thai_time(family_id).isoformat(),
             'author_role': author_role,
             'author_name': author_name
         }
@@ -135,7 +199,7 @@ class SupabaseClient:
         data = {
             'family_id': family_id,
             'author_id': author_id,
-            'timestamp': get_thai_time().isoformat(),
+            'timestamp': get_thai_time(family_id).isoformat(),
             'author_role': author_role,
             'author_name': author_name
         }
@@ -146,7 +210,7 @@ class SupabaseClient:
         data = {
             'family_id': family_id,
             'author_id': author_id,
-            'timestamp': get_thai_time().isoformat(),
+            'timestamp': get_thai_time(family_id).isoformat(),
             'author_role': author_role,
             'author_name': author_name
         }
@@ -157,7 +221,7 @@ class SupabaseClient:
         data = {
             'family_id': family_id,
             'author_id': author_id,
-            'timestamp': get_thai_time().isoformat(),
+            'timestamp': get_thai_time(family_id).isoformat(),
             'activity_type': activity_type,
             'author_role': author_role,
             'author_name': author_name
@@ -175,7 +239,7 @@ class SupabaseClient:
         data = {
             'family_id': family_id,
             'author_id': author_id,
-            'start_time': get_thai_time().isoformat(),
+            'start_time': get_thai_time(family_id).isoformat(),
             'is_active': True,
             'author_role': author_role,
             'author_name': author_name
@@ -185,14 +249,35 @@ class SupabaseClient:
     def end_sleep(self, family_id, author_id, author_role, author_name):
         """Завершить сессию сна"""
         data = {
-            'end_time': get_thai_time().isoformat(),
+            'end_time': get_thai_time(family_id).isoformat(),
             'is_active': False
         }
         return self._make_request('PATCH', 'sleep_sessions', data, 
                                  {'family_id': f'eq.{family_id}', 'is_active': f'eq.true'})
     
+    # Виды событий в ответе get_last_events
+    LAST_EVENT_KINDS = ('feeding', 'diaper', 'bath', 'activity', 'sleep')
+    
     def get_last_events(self, family_id):
-        """Получить последние события"""
+        """Получить последние события одним вызовом SQL-функции family_last_events"""
+        if self.last_events_rpc:
+            try:
+                events = self.http.rpc('family_last_events', {'family_id': family_id})
+                return {kind: (events or {}).get(kind) for kind in self.LAST_EVENT_KINDS}
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    print(f"❌ Ошибка Supabase запроса: {e}")
+                    return dict.fromkeys(self.LAST_EVENT_KINDS)
+                # Функции нет в базе (схема не обновлена) — дальше читаем таблицы по очереди
+                print("⚠️ В Supabase нет функции family_last_events, выполните supabase_schema.sql")
+                self.last_events_rpc = False
+            except requests.exceptions.RequestException as e:
+                print(f"❌ Ошибка Supabase запроса: {e}")
+                return dict.fromkeys(self.LAST_EVENT_KINDS)
+        return self._get_last_events_by_table(family_id)
+    
+    def _get_last_events_by_table(self, family_id):
+        """Последние события отдельными запросами к каждой таблице"""
         # Получаем последние события из всех таблиц
         feedings = self._make_request('GET', 'feedings', 
                                     {'family_id': f'eq.{family_id}', 
@@ -226,29 +311,63 @@ class SupabaseClient:
 
 # Создаем клиент Supabase
 supabase = SupabaseClient(SUPABASE_URL, SUPABASE_KEY)
+clock.default.loader = supabase.family_timezone
+
+# Запросы к Supabase блокирующие: обработчики выполняют их в пуле потоков, чтобы
+# цикл событий Telethon обслуживал других пользователей, пока идёт HTTP-запрос
+SUPABASE_WORKERS = int(os.getenv('SUPABASE_WORKERS', str(postgrest.SUPABASE_POOL_SIZE)))
+supabase_executor = ThreadPoolExecutor(max_workers=SUPABASE_WORKERS, thread_name_prefix="supabase")
+
+async def run_blocking(func, *args, **kwargs):
+    """Выполнить блокирующую функцию в пуле потоков Supabase"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(supabase_executor, functools.partial(func, *args, **kwargs))
+
+class AsyncSupabase:
+    """Асинхронные обёртки методов SupabaseClient: await supabase_async.add_feeding(...)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            return await run_blocking(method, *args, **kwargs)
+        return call
+
+supabase_async = AsyncSupabase(supabase)
 
 client = TelegramClient('babybot', API_ID, API_HASH).start(bot_token=BOT_TOKEN)
 
 # Словарь для хранения состояний пользователей
 user_states = {}
 
+def get_member(user_id, family_id):
+    """Роль и имя пользователя в семье (из запомненной личности пользователя)"""
+    identity = supabase.get_identity(user_id)
+    if identity and identity['family_id'] == family_id:
+        return identity['role'], identity['name']
+    members = supabase._make_request('GET', 'family_members', 
+                                   {'family_id': f'eq.{family_id}', 'user_id': f'eq.{user_id}',
+                                    'select': 'role,name'})
+    if members and len(members) > 0:
+        return members[0]['role'], members[0]['name']
+    return 'Родитель', 'Неизвестно'
+
 # Функция для получения роли пользователя
 def get_user_role(user_id, family_id):
     """Получить роль пользователя в семье"""
-    members = supabase._make_request('GET', 'family_members', 
-                                   {'family_id': f'eq.{family_id}', 'user_id': f'eq.{user_id}'})
-    if members and len(members) > 0:
-        return members[0]['role']
-    return 'Родитель'
+    return get_member(user_id, family_id)[0]
 
 # Функция для получения имени пользователя
 def get_user_name(user_id, family_id):
     """Получить имя пользователя в семье"""
-    members = supabase._make_request('GET', 'family_members', 
-                                   {'family_id': f'eq.{family_id}', 'user_id': f'eq.{user_id}'})
-    if members and len(members) > 0:
-        return members[0]['name']
-    return 'Неизвестно'
+    return get_member(user_id, family_id)[1]
+
+async def family_identity(user_id, family_id):
+    """Роль и имя пользователя в семье"""
+    return await run_blocking(get_member, user_id, family_id)
 
 # Функция для форматирования времени
 def format_time_ago(timestamp):
@@ -279,13 +398,12 @@ async def start_handler(event):
     user_name = user_info.first_name or "Пользователь"
     
     # Проверяем, есть ли у пользователя семья
-    family = supabase.get_family_by_user(user_id)
+    family = await supabase_async.get_family_by_user(user_id)
     
     if family:
         # Пользователь уже в семье
         family_name = family['name']
-        role = get_user_role(user_id, family['id'])
-        name = get_user_name(user_id, family['id'])
+        role, name = await family_identity(user_id, family['id'])
         
         message = f"👋 Привет, {name}!\n\n"
         message += f"🏠 Вы в семье: {family_name}\n"
@@ -342,12 +460,12 @@ async def text_handler(event):
     if user_id in user_states:
         if user_states[user_id] == 'waiting_family_name':
             # Создаем семью
-            family = supabase.create_family(text)
+            family = await supabase_async.create_family(text)
             if family:
                 family_id = family['id']
                 # Добавляем создателя как администратора
-                supabase.add_family_member(family_id, user_id, "Администратор", 
-                                         event.sender.first_name or "Пользователь")
+                await supabase_async.add_family_member(family_id, user_id, "Администратор", 
+                                                       event.sender.first_name or "Пользователь")
                 
                 message = f"✅ Семья '{text}' создана успешно!\n\n"
                 message += f"🆔 ID семьи: {family_id}\n"
@@ -374,11 +492,11 @@ async def text_handler(event):
             try:
                 family_id = int(text)
                 # Проверяем существование семьи
-                family = supabase._make_request('GET', 'families', {'id': f'eq.{family_id}'})
+                family = await supabase_async._make_request('GET', 'families', {'id': f'eq.{family_id}'})
                 if family and len(family) > 0:
                     # Добавляем пользователя в семью
-                    result = supabase.add_family_member(family_id, user_id, "Родитель", 
-                                                      event.sender.first_name or "Пользователь")
+                    result = await supabase_async.add_family_member(family_id, user_id, "Родитель", 
+                                                                    event.sender.first_name or "Пользователь")
                     if result:
                         message = f"✅ Вы успешно присоединились к семье!\n\n"
                         message += f"🏠 Семья: {family[0]['name']}\n"
@@ -408,23 +526,22 @@ async def text_handler(event):
 @client.on(events.CallbackQuery(data=b'feeding'))
 async def feeding_handler(event):
     user_id = event.sender_id
-    family = supabase.get_family_by_user(user_id)
+    family = await supabase_async.get_family_by_user(user_id)
     
     if not family:
         await event.answer("❌ Вы не в семье!")
         return
     
     # Добавляем кормление
-    result = supabase.add_feeding(family['id'], user_id, 
-                                 get_user_role(user_id, family['id']),
-                                 get_user_name(user_id, family['id']))
+    role, name = await family_identity(user_id, family['id'])
+    result = await supabase_async.add_feeding(family['id'], user_id, role, name)
     
     if result:
-        current_time = get_thai_time().strftime("%H:%M")
+        current_time = get_thai_time(family['id']).strftime("%H:%M")
         await event.answer(f"✅ Кормление записано в {current_time}")
         
         # Показываем последние события
-        events = supabase.get_last_events(family['id'])
+        events = await supabase_async.get_last_events(family['id'])
         message = "🍼 Кормление записано!\n\n"
         message += "📊 Последние события:\n"
         
@@ -456,23 +573,22 @@ async def feeding_handler(event):
 @client.on(events.CallbackQuery(data=b'diaper'))
 async def diaper_handler(event):
     user_id = event.sender_id
-    family = supabase.get_family_by_user(user_id)
+    family = await supabase_async.get_family_by_user(user_id)
     
     if not family:
         await event.answer("❌ Вы не в семье!")
         return
     
     # Добавляем смену подгузника
-    result = supabase.add_diaper(family['id'], user_id, 
-                                get_user_role(user_id, family['id']),
-                                get_user_name(user_id, family['id']))
+    role, name = await family_identity(user_id, family['id'])
+    result = await supabase_async.add_diaper(family['id'], user_id, role, name)
     
     if result:
-        current_time = get_thai_time().strftime("%H:%M")
+        current_time = get_thai_time(family['id']).strftime("%H:%M")
         await event.answer(f"✅ Смена подгузника записана в {current_time}")
         
         # Показываем последние события
-        events = supabase.get_last_events(family['id'])
+        events = await supabase_async.get_last_events(family['id'])
         message = "👶 Смена подгузника записана!\n\n"
         message += "📊 Последние события:\n"
         
@@ -504,23 +620,22 @@ async def diaper_handler(event):
 @client.on(events.CallbackQuery(data=b'bath'))
 async def bath_handler(event):
     user_id = event.sender_id
-    family = supabase.get_family_by_user(user_id)
+    family = await supabase_async.get_family_by_user(user_id)
     
     if not family:
         await event.answer("❌ Вы не в семье!")
         return
     
     # Добавляем купание
-    result = supabase.add_bath(family['id'], user_id, 
-                              get_user_role(user_id, family['id']),
-                              get_user_name(user_id, family['id']))
+    role, name = await family_identity(user_id, family['id'])
+    result = await supabase_async.add_bath(family['id'], user_id, role, name)
     
     if result:
-        current_time = get_thai_time().strftime("%H:%M")
+        current_time = get_thai_time(family['id']).strftime("%H:%M")
         await event.answer(f"✅ Купание записано в {current_time}")
         
         # Показываем последние события
-        events = supabase.get_last_events(family['id'])
+        events = await supabase_async.get_last_events(family['id'])
         message = "🛁 Купание записано!\n\n"
         message += "📊 Последние события:\n"
         
@@ -552,23 +667,22 @@ async def bath_handler(event):
 @client.on(events.CallbackQuery(data=b'activity'))
 async def activity_handler(event):
     user_id = event.sender_id
-    family = supabase.get_family_by_user(user_id)
+    family = await supabase_async.get_family_by_user(user_id)
     
     if not family:
         await event.answer("❌ Вы не в семье!")
         return
     
     # Добавляем активность
-    result = supabase.add_activity(family['id'], user_id, "tummy_time",
-                                  get_user_role(user_id, family['id']),
-                                  get_user_name(user_id, family['id']))
+    role, name = await family_identity(user_id, family['id'])
+    result = await supabase_async.add_activity(family['id'], user_id, "tummy_time", role, name)
     
     if result:
-        current_time = get_thai_time().strftime("%H:%M")
+        current_time = get_thai_time(family['id']).strftime("%H:%M")
         await event.answer(f"✅ Активность записана в {current_time}")
         
         # Показываем последние события
-        events = supabase.get_last_events(family['id'])
+        events = await supabase_async.get_last_events(family['id'])
         message = "🎮 Активность записана!\n\n"
         message += "📊 Последние события:\n"
         
@@ -600,23 +714,22 @@ async def activity_handler(event):
 @client.on(events.CallbackQuery(data=b'sleep'))
 async def sleep_handler(event):
     user_id = event.sender_id
-    family = supabase.get_family_by_user(user_id)
+    family = await supabase_async.get_family_by_user(user_id)
     
     if not family:
         await event.answer("❌ Вы не в семье!")
         return
     
     # Проверяем, есть ли активная сессия сна
-    events = supabase.get_last_events(family['id'])
+    events = await supabase_async.get_last_events(family['id'])
     
     if events['sleep']:
         # Завершаем сон
-        result = supabase.end_sleep(family['id'], user_id,
-                                   get_user_role(user_id, family['id']),
-                                   get_user_name(user_id, family['id']))
+        role, name = await family_identity(user_id, family['id'])
+        result = await supabase_async.end_sleep(family['id'], user_id, role, name)
         
         if result:
-            current_time = get_thai_time().strftime("%H:%M")
+            current_time = get_thai_time(family['id']).strftime("%H:%M")
             await event.answer(f"✅ Сон завершен в {current_time}")
             message = "😴 Сон завершен!\n\n"
         else:
@@ -624,12 +737,11 @@ async def sleep_handler(event):
             return
     else:
         # Начинаем сон
-        result = supabase.start_sleep(family['id'], user_id,
-                                     get_user_role(user_id, family['id']),
-                                     get_user_name(user_id, family['id']))
+        role, name = await family_identity(user_id, family['id'])
+        result = await supabase_async.start_sleep(family['id'], user_id, role, name)
         
         if result:
-            current_time = get_thai_time().strftime("%H:%M")
+            current_time = get_thai_time(family['id']).strftime("%H:%M")
             await event.answer(f"✅ Сон начат в {current_time}")
             message = "😴 Сон начат!\n\n"
         else:
@@ -637,7 +749,7 @@ async def sleep_handler(event):
             return
     
     # Показываем последние события
-    events = supabase.get_last_events(family['id'])
+    events = await supabase_async.get_last_events(family['id'])
     message += "📊 Последние события:\n"
     
     if events['feeding']:
@@ -666,7 +778,7 @@ async def sleep_handler(event):
 @client.on(events.CallbackQuery(data=b'dashboard'))
 async def dashboard_handler(event):
     user_id = event.sender_id
-    family = supabase.get_family_by_user(user_id)
+    family = await supabase_async.get_family_by_user(user_id)
     
     if not family:
         await event.answer("❌ Вы не в семье!")
@@ -721,12 +833,11 @@ async def info_handler(event):
 @client.on(events.CallbackQuery(data=b'main_menu'))
 async def main_menu_handler(event):
     user_id = event.sender_id
-    family = supabase.get_family_by_user(user_id)
+    family = await supabase_async.get_family_by_user(user_id)
     
     if family:
         family_name = family['name']
-        role = get_user_role(user_id, family['id'])
-        name = get_user_name(user_id, family['id'])
+        role, name = await family_identity(user_id, family['id'])
         
         message = f"👋 Привет, {name}!\n\n"
         message += f"🏠 Вы в семье: {family_name}\n"
@@ -786,11 +897,18 @@ def external_keep_alive():
     except Exception as e:
         print(f"❌ External keep-alive critical error: {e}")
 
+def log_supabase_metrics():
+    """Вывести в лог время ответа Supabase по эндпоинтам"""
+    for name, stats in supabase.metrics().items():
+        print(f"📊 Supabase {name}: запросов {stats['requests']}, ошибок {stats['errors']}, "
+              f"повторов {stats['retries']}, среднее {stats['avg_ms']} мс, p95 {stats['p95_ms']} мс")
+
 # Планировщик для keep-alive
 scheduler = AsyncIOScheduler()
 
 # Добавляем задачу keep-alive каждые 10 минут
 scheduler.add_job(external_keep_alive, 'interval', minutes=10)
+scheduler.add_job(log_supabase_metrics, 'interval', minutes=10)
 
 # Запускаем планировщик
 scheduler.start()
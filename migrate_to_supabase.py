@@ -1,384 +1,185 @@
 #!/usr/bin/env python3
 """
 Скрипт для миграции данных из SQLite в Supabase
+
+Строки читаются из SQLite порциями по MIGRATE_BATCH_SIZE и отправляются
+в Supabase массивами: один upsert-запрос на порцию вместо запроса на строку.
+Одновременно в работе до MIGRATE_CONCURRENCY порций одной таблицы; таблицы
+идут по очереди (семьи раньше событий из-за внешних ключей). Идентификаторы
+строк сохраняются, поэтому повторный запуск обновляет уже перенесённые
+строки, а не дублирует их. После загрузки счётчики id в Supabase
+выравниваются функцией sync_id_sequences (см. supabase_schema.sql).
 """
 import sqlite3
 import requests
-import json
 import os
-from datetime import datetime
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
 load_dotenv()
 
+import replication
+
 # Настройки Supabase
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
+# Строк в одном запросе и число запросов, выполняемых одновременно
+MIGRATE_BATCH_SIZE = int(os.getenv('MIGRATE_BATCH_SIZE', '500'))
+MIGRATE_CONCURRENCY = int(os.getenv('MIGRATE_CONCURRENCY', '4'))
+
 if not SUPABASE_URL or not SUPABASE_KEY:
     print("❌ ОШИБКА: Не установлены переменные SUPABASE_URL и SUPABASE_KEY")
     exit(1)
 
-# Заголовки для запросов к Supabase
-headers = {
-    'apikey': SUPABASE_KEY,
-    'Authorization': f'Bearer {SUPABASE_KEY}',
-    'Content-Type': 'application/json'
-}
-
-def make_supabase_request(method, endpoint, data=None, params=None):
-    """Выполняет HTTP запрос к Supabase"""
-    url = f"{SUPABASE_URL}/rest/v1/{endpoint}"
-    
-    try:
-        if method == 'GET':
-            response = requests.get(url, headers=headers, params=params)
-        elif method == 'POST':
-            response = requests.post(url, headers=headers, json=data)
-        elif method == 'PATCH':
-            response = requests.patch(url, headers=headers, json=data, params=params)
-        elif method == 'DELETE':
-            response = requests.delete(url, headers=headers, params=params)
-        else:
-            raise ValueError(f"Unsupported method: {method}")
-        
-        if response.status_code == 409:
-            print(f"   ⚠️ Запись уже существует (409 Conflict)")
-            return None
-        
-        response.raise_for_status()
-        if response.content:
-            return response.json()
-        else:
-            # Для POST запросов возвращаем True если статус 201
-            return True if response.status_code == 201 else None
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Ошибка Supabase запроса: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"   Детали: {e.response.text}")
-        return None
+def print_request_error(e):
+    print(f"❌ Ошибка Supabase запроса: {e}")
+    if getattr(e, 'response', None) is not None:
+        print(f"   Детали: {e.response.text}")
 
-def clear_supabase_data():
+def clear_supabase_data(client):
     """Очищает данные в Supabase (в порядке зависимостей)"""
     print("🧹 Очистка существующих данных в Supabase...")
-    
+
     # Удаляем в порядке зависимостей (от дочерних к родительским)
     tables = [
         'feedings', 'diapers', 'baths', 'activities', 'sleep_sessions',
         'family_members', 'settings', 'families'
     ]
-    
+
     for table in tables:
         try:
-            result = make_supabase_request('DELETE', table)
+            client.delete(table, None)
             print(f"   ✅ Очищена таблица: {table}")
-        except Exception as e:
+        except requests.exceptions.RequestException as e:
             print(f"   ⚠️ Ошибка очистки {table}: {e}")
 
-def migrate_families(sqlite_conn):
-    """Мигрирует семьи"""
-    print("🏠 Миграция семей...")
-    
+def read_batches(sqlite_conn, table, batch_size=MIGRATE_BATCH_SIZE):
+    """Строки таблицы SQLite порциями; вся таблица в память не загружается"""
     cursor = sqlite_conn.cursor()
-    cursor.execute("SELECT id, name FROM families")
-    families = cursor.fetchall()
-    
-    migrated_count = 0
-    for family_id, name in families:
-        # Проверяем, существует ли семья с таким именем
-        existing = make_supabase_request('GET', 'families', params={'name': f'eq.{name}'})
-        
-        if existing and len(existing) > 0:
-            print(f"   ⚠️ Семья '{name}' уже существует, пропускаем")
-            migrated_count += 1
-        else:
-            data = {'name': name}
-            result = make_supabase_request('POST', 'families', data)
-            if result:
-                # Получаем ID созданной семьи
-                families = make_supabase_request('GET', 'families', params={'name': f'eq.{name}'})
-                if families and len(families) > 0:
-                    supabase_id = families[-1]['id']
-                    print(f"   ✅ Семья '{name}' (ID: {family_id}) -> Supabase ID: {supabase_id}")
-                else:
-                    print(f"   ✅ Семья '{name}' создана")
-                migrated_count += 1
-            else:
-                print(f"   ❌ Ошибка миграции семьи '{name}'")
-    
-    print(f"📊 Мигрировано семей: {migrated_count}/{len(families)}")
-    return migrated_count
-
-def migrate_family_members(sqlite_conn):
+    cursor.execute(f"SELECT * FROM {table}")
+    columns = [description[0] for description in cursor.description]
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield [dict(zip(columns, row)) for row in rows]
+
+def migrate_table(sqlite_conn, target, executor, table, icon="📦", title=None,
+                  batch_size=MIGRATE_BATCH_SIZE, concurrency=MIGRATE_CONCURRENCY):
+    """Переносит таблицу порциями; возвращает (перенесено, ошибок)"""
+    title = title or table
+    print(f"{icon} Миграция {title}...")
+    on_conflict = target.ON_CONFLICT.get(table)
+    started = time.perf_counter()
+    pending = {}
+    migrated = failed = 0
+
+    def collect(done):
+        nonlocal migrated, failed
+        for future in done:
+            count = pending.pop(future)
+            try:
+                future.result()
+                migrated += count
+            except requests.exceptions.RequestException as e:
+                failed += count
+                print_request_error(e)
+
+    for batch in read_batches(sqlite_conn, table, batch_size):
+        rows = [target._to_supabase(table, row) for row in batch]
+        if on_conflict:
+            # Один запрос не может дважды обновить строку: из повторов ключа берём последний
+            keys = on_conflict.split(",")
+            rows = list({tuple(row[key] for key in keys): row for row in rows}.values())
+        future = executor.submit(target.http.upsert, table, rows, on_conflict)
+        pending[future] = len(rows)
+        # Не читаем дальше, пока в работе слишком много порций
+        if len(pending) >= concurrency:
+            collect(wait(pending, return_when=FIRST_COMPLETED).done)
+    collect(wait(pending).done if pending else ())
+
+    elapsed = time.perf_counter() - started
+    rate = migrated / elapsed if elapsed > 0 else 0
+    errors = f", ошибок: {failed}" if failed else ""
+    print(f"📊 Мигрировано {title}: {migrated}/{migrated + failed}{errors} "
+          f"за {elapsed:.1f} с ({rate:.0f} строк/с)")
+    return migrated, failed
+
+def migrate_families(sqlite_conn, target, executor):
+    """Мигрирует семьи"""
+    return migrate_table(sqlite_conn, target, executor, 'families', "🏠", "семей")
+
+def migrate_family_members(sqlite_conn, target, executor):
     """Мигрирует членов семьи"""
-    print("👥 Миграция членов семьи...")
-    
-    # Получаем mapping SQLite family_id -> Supabase family_id
-    family_mapping = {}
-    cursor = sqlite_conn.cursor()
-    cursor.execute("SELECT id, name FROM families")
-    sqlite_families = cursor.fetchall()
-    
-    for sqlite_id, name in sqlite_families:
-        # Находим соответствующую семью в Supabase
-        supabase_families = make_supabase_request('GET', 'families', params={'name': f'eq.{name}'})
-        if supabase_families and len(supabase_families) > 0:
-            family_mapping[sqlite_id] = supabase_families[-1]['id']
-            print(f"   📋 Mapping: SQLite family {sqlite_id} -> Supabase family {supabase_families[-1]['id']}")
-    
-    cursor.execute("SELECT family_id, user_id, role, name FROM family_members")
-    members = cursor.fetchall()
-    
-    migrated_count = 0
-    for family_id, user_id, role, name in members:
-        # Получаем Supabase family_id
-        supabase_family_id = family_mapping.get(family_id)
-        if not supabase_family_id:
-            print(f"   ❌ Не найден Supabase ID для семьи {family_id}")
-            continue
-            
-        # Проверяем, существует ли член семьи
-        existing = make_supabase_request('GET', 'family_members', 
-                                       params={'family_id': f'eq.{supabase_family_id}', 'user_id': f'eq.{user_id}'})
-        
-        if existing and len(existing) > 0:
-            print(f"   ⚠️ Член семьи '{name}' уже существует, пропускаем")
-            migrated_count += 1
-        else:
-            data = {
-                'family_id': supabase_family_id,
-                'user_id': user_id,
-                'role': role,
-                'name': name
-            }
-            result = make_supabase_request('POST', 'family_members', data)
-            if result:
-                print(f"   ✅ Член семьи '{name}' (роль: {role})")
-                migrated_count += 1
-            else:
-                print(f"   ❌ Ошибка миграции члена семьи '{name}'")
-    
-    print(f"📊 Мигрировано членов семьи: {migrated_count}/{len(members)}")
-    return migrated_count
-
-def migrate_feedings(sqlite_conn):
+    return migrate_table(sqlite_conn, target, executor, 'family_members', "👥", "членов семьи")
+
+def migrate_feedings(sqlite_conn, target, executor):
     """Мигрирует кормления"""
-    print("🍼 Миграция кормлений...")
-    
-    cursor = sqlite_conn.cursor()
-    cursor.execute("SELECT family_id, author_id, timestamp, author_role, author_name FROM feedings")
-    feedings = cursor.fetchall()
-    
-    migrated_count = 0
-    for family_id, author_id, timestamp, author_role, author_name in feedings:
-        data = {
-            'family_id': family_id,
-            'author_id': author_id,
-            'timestamp': timestamp,
-            'author_role': author_role,
-            'author_name': author_name
-        }
-        result = make_supabase_request('POST', 'feedings', data)
-        if result:
-            migrated_count += 1
-        else:
-            print(f"   ❌ Ошибка миграции кормления от {author_name}")
-    
-    print(f"📊 Мигрировано кормлений: {migrated_count}/{len(feedings)}")
-    return migrated_count
+    return migrate_table(sqlite_conn, target, executor, 'feedings', "🍼", "кормлений")
 
-def migrate_diapers(sqlite_conn):
+def migrate_diapers(sqlite_conn, target, executor):
     """Мигрирует смены подгузников"""
-    print("👶 Миграция смен подгузников...")
-    
-    cursor = sqlite_conn.cursor()
-    cursor.execute("SELECT family_id, author_id, timestamp, author_role, author_name FROM diapers")
-    diapers = cursor.fetchall()
-    
-    migrated_count = 0
-    for family_id, author_id, timestamp, author_role, author_name in diapers:
-        data = {
-            'family_id': family_id,
-            'author_id': author_id,
-            'timestamp': timestamp,
-            'author_role': author_role,
-            'author_name': author_name
-        }
-        result = make_supabase_request('POST', 'diapers', data)
-        if result:
-            migrated_count += 1
-        else:
-            print(f"   ❌ Ошибка миграции смены подгузника от {author_name}")
-    
-    print(f"📊 Мигрировано смен подгузников: {migrated_count}/{len(diapers)}")
-    return migrated_count
+    return migrate_table(sqlite_conn, target, executor, 'diapers', "👶", "смен подгузников")
 
-def migrate_baths(sqlite_conn):
+def migrate_baths(sqlite_conn, target, executor):
     """Мигрирует купания"""
-    print("🛁 Миграция купаний...")
-    
-    cursor = sqlite_conn.cursor()
-    cursor.execute("SELECT family_id, author_id, timestamp, author_role, author_name FROM baths")
-    baths = cursor.fetchall()
-    
-    migrated_count = 0
-    for family_id, author_id, timestamp, author_role, author_name in baths:
-        data = {
-            'family_id': family_id,
-            'author_id': author_id,
-            'timestamp': timestamp,
-            'author_role': author_role,
-            'author_name': author_name
-        }
-        result = make_supabase_request('POST', 'baths', data)
-        if result:
-            migrated_count += 1
-        else:
-            print(f"   ❌ Ошибка миграции купания от {author_name}")
-    
-    print(f"📊 Мигрировано купаний: {migrated_count}/{len(baths)}")
-    return migrated_count
+    return migrate_table(sqlite_conn, target, executor, 'baths', "🛁", "купаний")
 
-def migrate_activities(sqlite_conn):
+def migrate_activities(sqlite_conn, target, executor):
     """Мигрирует активности"""
-    print("🎮 Миграция активностей...")
-    
-    cursor = sqlite_conn.cursor()
-    cursor.execute("SELECT family_id, author_id, timestamp, activity_type, author_role, author_name FROM activities")
-    activities = cursor.fetchall()
-    
-    migrated_count = 0
-    for family_id, author_id, timestamp, activity_type, author_role, author_name in activities:
-        data = {
-            'family_id': family_id,
-            'author_id': author_id,
-            'timestamp': timestamp,
-            'activity_type': activity_type,
-            'author_role': author_role,
-            'author_name': author_name
-        }
-        result = make_supabase_request('POST', 'activities', data)
-        if result:
-            migrated_count += 1
-        else:
-            print(f"   ❌ Ошибка миграции активности от {author_name}")
-    
-    print(f"📊 Мигрировано активностей: {migrated_count}/{len(activities)}")
-    return migrated_count
+    return migrate_table(sqlite_conn, target, executor, 'activities', "🎮", "активностей")
 
-def migrate_sleep_sessions(sqlite_conn):
+def migrate_sleep_sessions(sqlite_conn, target, executor):
     """Мигрирует сессии сна"""
-    print("😴 Миграция сессий сна...")
-    
-    cursor = sqlite_conn.cursor()
-    cursor.execute("SELECT family_id, author_id, start_time, end_time, is_active, author_role, author_name FROM sleep_sessions")
-    sessions = cursor.fetchall()
-    
-    migrated_count = 0
-    for family_id, author_id, start_time, end_time, is_active, author_role, author_name in sessions:
-        data = {
-            'family_id': family_id,
-            'author_id': author_id,
-            'start_time': start_time,
-            'end_time': end_time,
-            'is_active': bool(is_active),
-            'author_role': author_role,
-            'author_name': author_name
-        }
-        result = make_supabase_request('POST', 'sleep_sessions', data)
-        if result:
-            migrated_count += 1
-        else:
-            print(f"   ❌ Ошибка миграции сессии сна от {author_name}")
-    
-    print(f"📊 Мигрировано сессий сна: {migrated_count}/{len(sessions)}")
-    return migrated_count
+    return migrate_table(sqlite_conn, target, executor, 'sleep_sessions', "😴", "сессий сна")
 
-def migrate_settings(sqlite_conn):
+def migrate_settings(sqlite_conn, target, executor):
     """Мигрирует настройки"""
-    print("⚙️ Миграция настроек...")
-    
-    cursor = sqlite_conn.cursor()
-    cursor.execute("""
-        SELECT family_id, feed_interval, diaper_interval, tips_enabled, 
-               tips_time_hour, tips_time_minute, bath_reminder_enabled,
-               bath_reminder_hour, bath_reminder_minute, bath_reminder_period,
-               activity_reminder_enabled, activity_reminder_interval,
-               sleep_monitoring_enabled, baby_age_months, birth_date
-        FROM settings
-    """)
-    settings = cursor.fetchall()
-    
-    migrated_count = 0
-    for (family_id, feed_interval, diaper_interval, tips_enabled, 
-         tips_time_hour, tips_time_minute, bath_reminder_enabled,
-         bath_reminder_hour, bath_reminder_minute, bath_reminder_period,
-         activity_reminder_enabled, activity_reminder_interval,
-         sleep_monitoring_enabled, baby_age_months, birth_date) in settings:
-        
-        # Проверяем, существуют ли настройки для семьи
-        existing = make_supabase_request('GET', 'settings', 
-                                       params={'family_id': f'eq.{family_id}'})
-        
-        if existing and len(existing) > 0:
-            print(f"   ⚠️ Настройки для семьи {family_id} уже существуют, пропускаем")
-            migrated_count += 1
-        else:
-            data = {
-                'family_id': family_id,
-                'feed_interval': feed_interval,
-                'diaper_interval': diaper_interval,
-                'tips_enabled': bool(tips_enabled),
-                'tips_time_hour': tips_time_hour,
-                'tips_time_minute': tips_time_minute,
-                'bath_reminder_enabled': bool(bath_reminder_enabled),
-                'bath_reminder_hour': bath_reminder_hour,
-                'bath_reminder_minute': bath_reminder_minute,
-                'bath_reminder_period': bath_reminder_period,
-                'activity_reminder_enabled': bool(activity_reminder_enabled),
-                'activity_reminder_interval': activity_reminder_interval,
-                'sleep_monitoring_enabled': bool(sleep_monitoring_enabled),
-                'baby_age_months': baby_age_months,
-                'baby_birth_date': birth_date
-            }
-            result = make_supabase_request('POST', 'settings', data)
-            if result:
-                print(f"   ✅ Настройки для семьи {family_id}")
-                migrated_count += 1
-            else:
-                print(f"   ❌ Ошибка миграции настроек для семьи {family_id}")
-    
-    print(f"📊 Мигрировано настроек: {migrated_count}/{len(settings)}")
-    return migrated_count
+    return migrate_table(sqlite_conn, target, executor, 'settings', "⚙️", "настроек")
+
+def sync_id_sequences(client):
+    """Сдвигает счётчики id в Supabase за перенесённые строки"""
+    try:
+        client.rpc('sync_id_sequences')
+        print("✅ Счётчики id в Supabase обновлены")
+    except requests.exceptions.RequestException as e:
+        print_request_error(e)
+        print("⚠️ Выполните supabase_schema.sql и вызовите SELECT sync_id_sequences();")
 
 def main():
     """Основная функция миграции"""
     print("🚀 Начинаем миграцию данных из SQLite в Supabase")
     print("=" * 50)
-    
+
+    target = replication.SupabaseTarget(url=SUPABASE_URL, key=SUPABASE_KEY, prune=False)
+    client = target.http
+
     # Спрашиваем, нужно ли очистить существующие данные
     clear_data = input("🧹 Очистить существующие данные в Supabase? (y/N): ").lower().strip()
     if clear_data in ['y', 'yes', 'да', 'д']:
-        clear_supabase_data()
+        clear_supabase_data(client)
         print()
-    
+
     # Проверяем наличие базы данных
     db_files = ['babybot.db', 'babybot_render.db']
     db_file = None
-    
+
     for file in db_files:
         if os.path.exists(file):
             db_file = file
             break
-    
+
     if not db_file:
         print("❌ ОШИБКА: Не найдена база данных SQLite!")
         print("📝 Убедитесь, что файл babybot.db или babybot_render.db существует")
         return
-    
+
     print(f"📁 Используем базу данных: {db_file}")
-    
+    print(f"📦 Порции по {MIGRATE_BATCH_SIZE} строк, одновременно {MIGRATE_CONCURRENCY} запроса")
+
     # Подключаемся к SQLite
     try:
         sqlite_conn = sqlite3.connect(db_file)
@@ -386,37 +187,58 @@ def main():
     except Exception as e:
         print(f"❌ Ошибка подключения к SQLite: {e}")
         return
-    
+
+    # checkpoint репликации хранится в той же базе
+    target.source_path = db_file
+
     # Проверяем подключение к Supabase
     print("🔍 Проверяем подключение к Supabase...")
-    health_check = make_supabase_request('GET', 'families', {'limit': '1'})
-    if health_check is None:
+    try:
+        client.select('families', {'limit': '1'})
+    except requests.exceptions.RequestException as e:
+        print_request_error(e)
         print("❌ Ошибка подключения к Supabase!")
+        sqlite_conn.close()
         return
     print("✅ Подключение к Supabase успешно")
-    
+
+    # Журнал изменений запоминаем до чтения таблиц: изменения, сделанные во
+    # время миграции, репликация применит ещё раз, upsert это допускает
+    seq = replication.max_change_seq(sqlite_conn)
+
     # Выполняем миграцию
-    total_migrated = 0
-    
+    total_migrated = total_failed = 0
+    started = time.perf_counter()
+
     try:
-        total_migrated += migrate_families(sqlite_conn)
-        total_migrated += migrate_family_members(sqlite_conn)
-        total_migrated += migrate_feedings(sqlite_conn)
-        total_migrated += migrate_diapers(sqlite_conn)
-        total_migrated += migrate_baths(sqlite_conn)
-        total_migrated += migrate_activities(sqlite_conn)
-        total_migrated += migrate_sleep_sessions(sqlite_conn)
-        total_migrated += migrate_settings(sqlite_conn)
-        
+        with ThreadPoolExecutor(max_workers=MIGRATE_CONCURRENCY) as executor:
+            for migrate in (migrate_families, migrate_family_members, migrate_feedings,
+                            migrate_diapers, migrate_baths, migrate_activities,
+                            migrate_sleep_sessions, migrate_settings):
+                migrated, failed = migrate(sqlite_conn, target, executor)
+                total_migrated += migrated
+                total_failed += failed
+        sync_id_sequences(client)
+
+        elapsed = time.perf_counter() - started
         print("=" * 50)
-        print(f"✅ Миграция завершена!")
-        print(f"📊 Всего записей мигрировано: {total_migrated}")
-        print("🎉 Данные успешно перенесены в Supabase!")
-        
+        print(f"✅ Миграция завершена за {elapsed:.1f} с!")
+        print(f"📊 Всего записей мигрировано: {total_migrated} "
+              f"({total_migrated / elapsed if elapsed > 0 else 0:.0f} строк/с)")
+        if total_failed:
+            print(f"⚠️ Не перенесено записей: {total_failed}; запустите миграцию ещё раз")
+        else:
+            # Репликация продолжит с изменений, сделанных после начала миграции
+            target._set_checkpoint(seq)
+            print("🎉 Данные успешно перенесены в Supabase!")
+        for name, stats in client.metrics().items():
+            print(f"📊 {name}: {stats}")
+
     except Exception as e:
         print(f"❌ Критическая ошибка миграции: {e}")
     finally:
         sqlite_conn.close()
+        client.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,320 @@
+"""
+Версионные миграции схемы SQLite
+
+Каждая миграция — функция, получающая курсор; выполняется в своей
+транзакции вместе с записью номера версии в PRAGMA user_version.
+При запуске применяются только миграции новее текущей версии, поэтому
+повторный старт на актуальной базе стоит одного PRAGMA. Все миграции
+написаны так, чтобы их можно было применить и к базе, созданной до
+появления версий (версия 0, но часть схемы уже есть).
+"""
+import sqlite3
+from datetime import datetime
+
+import cache
+import clock
+import daily_stats
+import db
+import replication
+
+def create_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS families (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL
+        )
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS family_members (
+            family_id INTEGER,
+            user_id INTEGER,
+            role TEXT DEFAULT 'Родитель',
+            name TEXT DEFAULT 'Неизвестно',
+            FOREIGN KEY (family_id) REFERENCES families (id)
+        )
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS feedings (
+            id INTEGER PRIMARY KEY,
+            family_id INTEGER,
+            author_id INTEGER,
+            timestamp TEXT NOT NULL,
+            author_role TEXT DEFAULT 'Родитель',
+            author_name TEXT DEFAULT 'Неизвестно',
+            FOREIGN KEY (family_id) REFERENCES families (id)
+        )
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS diapers (
+            id INTEGER PRIMARY KEY,
+            family_id INTEGER,
+            author_id INTEGER,
+            timestamp TEXT NOT NULL,
+            author_role TEXT DEFAULT 'Родитель',
+            author_name TEXT DEFAULT 'Неизвестно',
+            FOREIGN KEY (family_id) REFERENCES families (id)
+        )
+    """)
+    
+    # Новая таблица для купания
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS baths (
+            id INTEGER PRIMARY KEY,
+            family_id INTEGER,
+            author_id INTEGER,
+            timestamp TEXT NOT NULL,
+            author_role TEXT DEFAULT 'Родитель',
+            author_name TEXT DEFAULT 'Неизвестно',
+            FOREIGN KEY (family_id) REFERENCES families (id)
+        )
+    """)
+    
+    # Новая таблица для игр и выкладывания на живот
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS activities (
+            id INTEGER PRIMARY KEY,
+            family_id INTEGER,
+            author_id INTEGER,
+            timestamp TEXT NOT NULL,
+            activity_type TEXT DEFAULT 'tummy_time',
+            author_role TEXT DEFAULT 'Родитель',
+            author_name TEXT DEFAULT 'Неизвестно',
+            FOREIGN KEY (family_id) REFERENCES families (id)
+        )
+    """)
+    
+    # Новая таблица для сна
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sleep_sessions (
+            id INTEGER PRIMARY KEY,
+            family_id INTEGER,
+            author_id INTEGER,
+            start_time TEXT NOT NULL,
+            end_time TEXT,
+            is_active INTEGER DEFAULT 1,
+            author_role TEXT DEFAULT 'Родитель',
+            author_name TEXT DEFAULT 'Неизвестно',
+            FOREIGN KEY (family_id) REFERENCES families (id)
+        )
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            family_id INTEGER,
+            feed_interval INTEGER DEFAULT 3,
+            diaper_interval INTEGER DEFAULT 2,
+            tips_enabled INTEGER DEFAULT 1,
+            tips_time_hour INTEGER DEFAULT 9,
+            tips_time_minute INTEGER DEFAULT 0,
+            bath_reminder_enabled INTEGER DEFAULT 1,
+            bath_reminder_hour INTEGER DEFAULT 19,
+            bath_reminder_minute INTEGER DEFAULT 0,
+            bath_reminder_period INTEGER DEFAULT 1,
+            activity_reminder_enabled INTEGER DEFAULT 1,
+            activity_reminder_interval INTEGER DEFAULT 2,
+            sleep_monitoring_enabled INTEGER DEFAULT 1,
+            baby_age_months INTEGER DEFAULT 0,
+            birth_date TEXT,
+            FOREIGN KEY (family_id) REFERENCES families (id)
+        )
+    """)
+
+# Колонки settings, добавленные после первой версии схемы: (имя, тип, значение по умолчанию)
+SETTINGS_COLUMNS = [
+    ("tips_time_hour", "INTEGER", 9),
+    ("tips_time_minute", "INTEGER", 0),
+    ("bath_reminder_enabled", "INTEGER", 1),
+    ("bath_reminder_hour", "INTEGER", 19),
+    ("bath_reminder_minute", "INTEGER", 0),
+    ("bath_reminder_period", "INTEGER", 1),
+    ("activity_reminder_enabled", "INTEGER", 1),
+    ("activity_reminder_interval", "INTEGER", 2),
+    ("sleep_monitoring_enabled", "INTEGER", 1),
+    ("baby_age_months", "INTEGER", 0),
+    ("baby_birth_date", "TEXT", None),
+    ("birth_date", "TEXT", None),
+]
+
+def table_columns(cur, table):
+    cur.execute(f"PRAGMA table_info({table})")
+    return [col[1] for col in cur.fetchall()]
+
+def add_settings_columns(cur):
+    existing = table_columns(cur, "settings")
+    for name, column_type, default in SETTINGS_COLUMNS:
+        if name not in existing:
+            default_sql = f" DEFAULT {default}" if default is not None else ""
+            cur.execute(f"ALTER TABLE settings ADD COLUMN {name} {column_type}{default_sql}")
+            print(f"✅ Добавлена колонка {name}")
+        if default is not None:
+            # Обновляем существующие записи, устанавливая значения по умолчанию
+            cur.execute(f"UPDATE settings SET {name} = ? WHERE {name} IS NULL", (default,))
+
+def add_settings_timezone(cur):
+    # Имя пояса IANA; NULL — пояс по умолчанию (clock.DEFAULT_TIMEZONE)
+    if "timezone" not in table_columns(cur, "settings"):
+        cur.execute("ALTER TABLE settings ADD COLUMN timezone TEXT")
+        print("✅ Добавлена колонка timezone")
+
+def add_family_to_events(cur):
+    # Старые таблицы feedings и diapers хранили user_id вместо family_id
+    for table in ("feedings", "diapers"):
+        if "family_id" in table_columns(cur, table):
+            continue
+        print(f"🔄 Мигрируем таблицу {table}...")
+        cur.execute(f"""
+            CREATE TABLE {table}_new (
+                id INTEGER PRIMARY KEY,
+                family_id INTEGER,
+                author_id INTEGER,
+                timestamp TEXT NOT NULL,
+                author_role TEXT DEFAULT 'Родитель',
+                author_name TEXT DEFAULT 'Неизвестно',
+                FOREIGN KEY (family_id) REFERENCES families (id)
+            )
+        """)
+        cur.execute(f"SELECT id, user_id, timestamp FROM {table}")
+        for row_id, user_id, timestamp in cur.fetchall():
+            # Для каждой записи создаем временную семью
+            cur.execute("INSERT INTO families (name) VALUES (?)", (f"Миграция {row_id}",))
+            family_id = cur.lastrowid
+            cur.execute("INSERT INTO family_members (family_id, user_id) VALUES (?, ?)", (family_id, user_id))
+            cur.execute("INSERT INTO settings (family_id) VALUES (?)", (family_id,))
+            cur.execute(f"INSERT INTO {table}_new (family_id, author_id, timestamp, author_role, author_name) VALUES (?, ?, ?, ?, ?)",
+                        (family_id, user_id, timestamp, 'Родитель', 'Неизвестно'))
+        # Удаляем старую таблицу и переименовываем новую
+        cur.execute(f"DROP TABLE {table}")
+        cur.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        print(f"✅ Таблица {table} мигрирована")
+
+def create_indexes(cur):
+    # Выборки событий семьи по времени: дашборд, история, последние события
+    for table in ("feedings", "diapers", "baths", "activities"):
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_family_time ON {table} (family_id, timestamp)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sleep_sessions_family_start ON sleep_sessions (family_id, start_time)")
+    # Активных снов единицы — частичный индекс по ним почти ничего не стоит
+    cur.execute("DROP INDEX IF EXISTS idx_sleep_sessions_family_active")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sleep_sessions_active
+        ON sleep_sessions (family_id, start_time) WHERE is_active = 1
+    """)
+    # get_family_id выполняется при каждом действии пользователя
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_family_members_user ON family_members (user_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_family_members_family ON family_members (family_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_settings_family ON settings (family_id)")
+
+def create_daily_stats(cur):
+    # При первом создании заполняем по накопленным событиям; local_day появится
+    # только в миграции 8, поэтому день пока берётся из строки времени
+    if daily_stats.install_daily_stats(cur, daily_stats.ISO_DAY):
+        print(f"✅ Статистика по дням заполнена: {daily_stats.backfill(cur, daily_stats.ISO_DAY)} строк")
+
+def daily_stats_by_local_day(cur):
+    # Строка времени может быть записана не в поясе семьи; день берём из local_day
+    daily_stats.drop_triggers(cur)
+    daily_stats.install_daily_stats(cur)
+    print(f"✅ Статистика по местным дням пересчитана: {daily_stats.backfill(cur)} строк")
+
+# Часовой пояс, в котором записаны старые строки времени без смещения
+LEGACY_TZ = clock.get_zone('Asia/Bangkok')
+
+# Таблица -> [(колонка ISO-времени, колонка UTC epoch)], колонка, от которой берётся местный день
+EPOCH_COLUMNS = {
+    "feedings": ([("timestamp", "ts")], "timestamp"),
+    "diapers": ([("timestamp", "ts")], "timestamp"),
+    "baths": ([("timestamp", "ts")], "timestamp"),
+    "activities": ([("timestamp", "ts")], "timestamp"),
+    "sleep_sessions": ([("start_time", "start_ts"), ("end_time", "end_ts")], "start_time"),
+}
+
+def parse_epoch(value):
+    """Строка ISO (со смещением или без) -> секунды UTC epoch"""
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=LEGACY_TZ)
+    return int(moment.timestamp())
+
+def add_epoch_columns(cur):
+    for table, (pairs, day_column) in EPOCH_COLUMNS.items():
+        existing = table_columns(cur, table)
+        for _, epoch_column in pairs:
+            if epoch_column not in existing:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {epoch_column} INTEGER")
+        if "local_day" not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN local_day TEXT")
+
+        # Заполняем по строкам ISO: местный день — дата из самой строки
+        iso_columns = [iso for iso, _ in pairs]
+        cur.execute(f"SELECT id, {', '.join(iso_columns)} FROM {table}")
+        updates = []
+        for row in cur.fetchall():
+            values = dict(zip(iso_columns, row[1:]))
+            updates.append(tuple(parse_epoch(values[iso]) for iso in iso_columns)
+                           + ((values[day_column] or "")[:10] or None, row[0]))
+        assignments = ", ".join(f"{epoch} = ?" for _, epoch in pairs)
+        cur.executemany(f"UPDATE {table} SET {assignments}, local_day = ? WHERE id = ?", updates)
+        print(f"✅ {table}: время в epoch для {len(updates)} строк")
+
+    # Индексы по строкам времени больше не нужны — выборки идут по epoch
+    for table in ("feedings", "diapers", "baths", "activities"):
+        cur.execute(f"DROP INDEX IF EXISTS idx_{table}_family_time")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_family_ts ON {table} (family_id, ts)")
+    cur.execute("DROP INDEX IF EXISTS idx_sleep_sessions_family_start")
+    cur.execute("DROP INDEX IF EXISTS idx_sleep_sessions_active")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sleep_sessions_family_ts ON sleep_sessions (family_id, start_ts)")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sleep_sessions_active_ts
+        ON sleep_sessions (family_id, start_ts) WHERE is_active = 1
+    """)
+
+# (версия, описание, функция); новые миграции добавляются только в конец
+MIGRATIONS = [
+    (1, "базовые таблицы", create_tables),
+    (2, "новые колонки settings", add_settings_columns),
+    (3, "family_id в feedings и diapers", add_family_to_events),
+    (4, "индексы", create_indexes),
+    (5, "журнал изменений для репликации", replication.install_change_log),
+    (6, "версии данных семей", cache.install_family_versions),
+    (7, "суточная статистика", create_daily_stats),
+    (8, "время событий в UTC epoch и местный день", add_epoch_columns),
+    (9, "часовой пояс семьи в settings", add_settings_timezone),
+    (10, "суточная статистика по local_day", daily_stats_by_local_day),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(manager):
+    """Текущая версия схемы базы"""
+    return manager.fetchone("PRAGMA user_version")[0]
+
+def migrate(manager=None):
+    """Применить недостающие миграции; возвращает итоговую версию схемы"""
+    manager = manager or db.default
+    version = schema_version(manager)
+    if version >= LATEST_VERSION:
+        print(f"✅ Схема базы актуальна (версия {version})")
+        return version
+
+    for number, description, migration in MIGRATIONS:
+        if number <= version:
+            continue
+        conn = manager.connection()
+        try:
+            with manager.cursor() as cur:
+                # DDL в sqlite3 не открывает транзакцию сам — открываем явно,
+                # чтобы миграция и номер версии применились вместе
+                if not conn.in_transaction:
+                    cur.execute("BEGIN")
+                migration(cur)
+                cur.execute(f"PRAGMA user_version = {number}")
+        except sqlite3.Error as e:
+            print(f"❌ Миграция {number} ({description}) не применена: {e}")
+            raise
+        print(f"✅ Миграция {number}: {description}")
+        version = number
+    return version
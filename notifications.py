@@ -0,0 +1,247 @@
+"""
+Исходящие сообщения бота: очередь с лимитами и параллельная рассылка
+
+OutboundQueue пропускает вызовы Telegram через token bucket (общий и на
+каждый чат) и приоритетные полосы, а при FloodWait приостанавливает
+отправку на указанное время и повторяет вызов. Вызов в чат, исчерпавший
+свой лимит, откладывается до появления токена, и воркер тем временем
+обслуживает другие чаты. NotificationDispatcher рассылает сообщение всем
+членам семьи одновременно (с ограничением семафором) и собирает результаты
+и метрики времени.
+"""
+import asyncio
+import itertools
+import os
+import time
+
+# Максимум одновременных отправок сообщений
+NOTIFY_CONCURRENCY = int(os.getenv('NOTIFY_CONCURRENCY', '10'))
+
+# Лимиты Telegram для ботов: ~30 сообщений в секунду всего и ~1 в секунду в один чат
+GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '25'))
+CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+
+# Приоритетные полосы (меньше — раньше)
+INTERACTIVE = 0  # ответы на действия пользователя
+URGENT = 1       # срочные напоминания о кормлении и сне
+NORMAL = 2       # обычные напоминания
+LOW = 3          # советы
+
+def flood_wait_seconds(error):
+    """Сколько секунд просит подождать Telegram (None, если ошибка не FloodWait)"""
+    if type(error).__name__ in ("FloodWaitError", "FloodPremiumWaitError", "SlowModeWaitError"):
+        return getattr(error, "seconds", None)
+    return None
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate, capacity, now=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.now = now
+        self.tokens = capacity
+        self.updated = now()
+
+    def wait_time(self):
+        """Сколько ждать до появления токена (0 — токен есть)"""
+        now = self.now()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+class OutboundQueue:
+    """Очередь исходящих вызовов Telegram с лимитами, приоритетами и повтором при FloodWait
+
+    now — монотонные часы в секундах; должны идти вместе с часами цикла
+    событий, по которым отсчитываются asyncio.sleep и отложенные вызовы.
+    """
+
+    def __init__(self, client=None, workers=NOTIFY_CONCURRENCY, global_rate=GLOBAL_RATE,
+                 chat_rate=CHAT_RATE, chat_burst=CHAT_BURST, max_retries=3, now=time.monotonic):
+        self.client = client
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.now = now
+        self._global = TokenBucket(global_rate, max(global_rate, 1), now)
+        self._chats = {}
+        self._queue = None
+        self._tasks = []
+        self._order = itertools.count()
+        self._paused_until = 0.0
+        self._parked = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.flood_waits = 0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 1000:
+                # Убираем давно неактивные чаты (их bucket уже полон)
+                now = self.now()
+                for key in [k for k, b in self._chats.items() if now - b.updated > 60]:
+                    del self._chats[key]
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, self.now)
+        return bucket
+
+    def _start(self):
+        # Очередь и воркеры создаются внутри работающего цикла событий
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def call(self, chat_id, factory, priority=NORMAL):
+        """Выполнить factory() (корутину с вызовом Telegram) через очередь"""
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((priority, next(self._order), chat_id, factory, future, 0))
+        return await future
+
+    async def send_message(self, chat_id, *args, priority=NORMAL, **kwargs):
+        """client.send_message через очередь"""
+        return await self.call(chat_id, lambda: self.client.send_message(chat_id, *args, **kwargs), priority)
+
+    def _park(self, delay, job):
+        """Вернуть вызов в очередь через delay секунд (на его прежнее место)"""
+        self._parked += 1
+        asyncio.get_running_loop().call_later(delay, self._unpark, job)
+
+    def _unpark(self, job):
+        self._parked -= 1
+        self._queue.put_nowait(job)
+
+    async def _worker(self):
+        while True:
+            priority, order, chat_id, factory, future, attempt = await self._queue.get()
+            try:
+                # После FloodWait ждём, пока Telegram снова разрешит отправку
+                pause = self._paused_until - self.now()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+
+                bucket = self._chat_bucket(chat_id)
+                delay = bucket.wait_time()
+                if delay > 0:
+                    # Лимит чата исчерпан: откладываем вызов, не занимая воркер
+                    self._park(delay, (priority, order, chat_id, factory, future, attempt))
+                    continue
+                while True:
+                    delay = self._global.wait_time()
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self._global.take()
+                bucket.take()
+
+                try:
+                    result = await factory()
+                except Exception as e:
+                    seconds = flood_wait_seconds(e)
+                    if seconds is not None and attempt < self.max_retries:
+                        self.flood_waits += 1
+                        self.retries += 1
+                        self._paused_until = max(self._paused_until, self.now() + seconds)
+                        print(f"⏳ FloodWait {seconds} с, повторим отправку в чат {chat_id}")
+                        # Возвращаем вызов на его прежнее место в очереди
+                        await self._queue.put((priority, order, chat_id, factory, future, attempt + 1))
+                        continue
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    self.sent += 1
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                self._queue.task_done()
+
+    def metrics(self):
+        """Сводка по очереди"""
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "parked": self._parked,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "flood_waits": self.flood_waits,
+        }
+
+class NotificationDispatcher:
+    """Рассылает сообщения через send(user_id, message, buttons=..., priority=...)"""
+
+    def __init__(self, send=None, limit=NOTIFY_CONCURRENCY):
+        self.send = send
+        self.limit = limit
+        self._semaphores = {}
+        self.batches = 0
+        self.sent = 0
+        self.failed = 0
+        self.total_time = 0.0
+        self.max_latency = 0.0
+        self.last_batch_time = 0.0
+
+    def _get_semaphore(self, priority):
+        # Семафор создаётся внутри работающего цикла событий, свой для каждой
+        # полосы, чтобы срочные рассылки не ждали мест, занятых советами
+        if priority not in self._semaphores:
+            self._semaphores[priority] = asyncio.Semaphore(self.limit)
+        return self._semaphores[priority]
+
+    async def _send_one(self, user_id, message, buttons, priority):
+        semaphore = self._get_semaphore(priority)
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                await self.send(user_id, message, buttons=buttons, priority=priority)
+                return None
+            finally:
+                self.max_latency = max(self.max_latency, time.monotonic() - started)
+
+    async def dispatch(self, recipients, message, buttons=None, label="уведомление", priority=NORMAL):
+        """Отправить сообщение всем получателям; возвращает {user_id: None или ошибка}"""
+        recipients = list(recipients)
+        started = time.monotonic()
+        outcomes = await asyncio.gather(
+            *(self._send_one(user_id, message, buttons, priority) for user_id in recipients),
+            return_exceptions=True
+        )
+        elapsed = time.monotonic() - started
+
+        results = dict(zip(recipients, outcomes))
+        for user_id, error in results.items():
+            if error is None:
+                self.sent += 1
+                print(f"✅ Отправлено {label} пользователю {user_id}")
+            else:
+                self.failed += 1
+                print(f"❌ Ошибка отправки ({label}) пользователю {user_id}: {error}")
+
+        self.batches += 1
+        self.total_time += elapsed
+        self.last_batch_time = elapsed
+        return results
+
+    def metrics(self):
+        """Сводка по рассылкам"""
+        return {
+            "batches": self.batches,
+            "sent": self.sent,
+            "failed": self.failed,
+            "avg_batch_time": self.total_time / self.batches if self.batches else 0.0,
+            "last_batch_time": self.last_batch_time,
+            "max_latency": self.max_latency,
+        }
+
+# Очередь и диспетчер по умолчанию; клиент Telegram задаётся ботом при запуске
+outbound = OutboundQueue()
+default = NotificationDispatcher(outbound.send_message)
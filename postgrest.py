@@ -0,0 +1,177 @@
+"""
+HTTP-клиент PostgREST (REST API Supabase)
+
+Все запросы клиента идут через один requests.Session: TCP- и TLS-соединения
+переиспользуются (keep-alive, пул на хост), а не открываются заново на каждый
+вызов. У каждого запроса есть таймаут соединения и ответа. Идемпотентные
+запросы (GET, DELETE, upsert) при сетевой ошибке, 429 или 502–504 повторяются
+с экспоненциальной задержкой и случайным разбросом; остальные — только если
+соединение так и не было установлено (отказ в соединении, ошибка DNS,
+таймаут соединения). По каждому эндпоинту копятся число
+запросов, повторов и ошибок и время ответа.
+
+Клиент не привязан к Supabase: для проверок его можно направить на локальную
+заглушку PostgREST (см. benchmark_postgrest.py):
+    client = postgrest.Client("http://127.0.0.1:3000", "test-key")
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', '10'))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv('SUPABASE_CONNECT_TIMEOUT', '3'))
+SUPABASE_RETRIES = int(os.getenv('SUPABASE_RETRIES', '3'))
+SUPABASE_BACKOFF = float(os.getenv('SUPABASE_BACKOFF', '0.2'))
+SUPABASE_POOL_SIZE = int(os.getenv('SUPABASE_POOL_SIZE', '10'))
+
+# Методы, повтор которых не меняет результат
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE")
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Сколько последних замеров хранить для перцентилей
+LATENCY_SAMPLES = 500
+
+def connect_failed(error):
+    """Ошибка возникла до отправки запроса: соединение с сервером не установлено"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    # requests оборачивает ошибку urllib3 (MaxRetryError); отказ в соединении
+    # и ошибка DNS (NewConnectionError) — подклассы ConnectTimeoutError
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, ConnectTimeoutError)
+
+class EndpointStats:
+    """Счётчики и время ответа одного эндпоинта"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_ms = 0.0
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def summary(self):
+        samples = sorted(self.samples)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(self.total_ms / self.requests, 2) if self.requests else None,
+            "p50_ms": round(samples[len(samples) // 2], 2) if samples else None,
+            "p95_ms": round(samples[max(int(len(samples) * 0.95) - 1, 0)], 2) if samples else None,
+        }
+
+class Client:
+    """Клиент PostgREST с пулом соединений, таймаутами, повторами и метриками"""
+
+    def __init__(self, url, key, timeout=SUPABASE_TIMEOUT, connect_timeout=SUPABASE_CONNECT_TIMEOUT,
+                 retries=SUPABASE_RETRIES, backoff=SUPABASE_BACKOFF, pool_size=SUPABASE_POOL_SIZE):
+        self.base_url = f"{url.rstrip('/')}/rest/v1"
+        self.timeout = (connect_timeout, timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            'apikey': key,
+            'Authorization': f'Bearer {key}',
+            'Content-Type': 'application/json'
+        })
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _record(self, name, started, error=False, retry=False):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self._stats.setdefault(name, EndpointStats())
+            stats.requests += 1
+            stats.total_ms += elapsed
+            stats.samples.append(elapsed)
+            stats.errors += error
+            stats.retries += retry
+
+    def _delay(self, attempt, response=None):
+        """Пауза перед повтором: Retry-After сервера или экспонента со случайным разбросом"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), 30)
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def request(self, method, endpoint, params=None, json=None, headers=None, idempotent=None):
+        """Выполнить запрос; возвращает requests.Response, ошибки HTTP — исключением requests"""
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        name = f"{method} {endpoint.split('?')[0]}"
+        url = f"{self.base_url}/{endpoint}"
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            response = None
+            try:
+                response = self.session.request(method, url, params=params, json=json,
+                                                headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # Если соединение не установлено, запрос не дошёл до сервера — повтор безопасен
+                retryable = idempotent or connect_failed(e)
+                if not retryable or attempt >= self.retries:
+                    self._record(name, started, error=True)
+                    raise
+            else:
+                retryable = idempotent and response.status_code in RETRY_STATUSES
+                if not retryable or attempt >= self.retries:
+                    self._record(name, started, error=response.status_code >= 400)
+                    response.raise_for_status()
+                    return response
+
+            self._record(name, started, error=True, retry=True)
+            time.sleep(self._delay(attempt, response))
+            attempt += 1
+
+    def json(self, method, endpoint, params=None, json=None, headers=None, idempotent=None):
+        """Запрос, возвращающий разобранный JSON (None для пустого ответа)"""
+        response = self.request(method, endpoint, params, json, headers, idempotent)
+        return response.json() if response.content else None
+
+    def select(self, table, params=None):
+        return self.json("GET", table, params=params)
+
+    def insert(self, table, rows, returning=True):
+        prefer = "return=representation" if returning else "return=minimal"
+        return self.json("POST", table, json=rows, headers={"Prefer": prefer})
+
+    def upsert(self, table, rows, on_conflict=None, returning=False):
+        """Вставка с заменой существующих строк; повтор безопасен"""
+        prefer = "resolution=merge-duplicates," + ("return=representation" if returning else "return=minimal")
+        params = {"on_conflict": on_conflict} if on_conflict else None
+        return self.json("POST", table, params=params, json=rows, headers={"Prefer": prefer}, idempotent=True)
+
+    def update(self, table, values, filters, returning=True):
+        prefer = "return=representation" if returning else "return=minimal"
+        return self.json("PATCH", table, params=filters, json=values, headers={"Prefer": prefer})
+
+    def delete(self, table, filters):
+        return self.json("DELETE", table, params=filters)
+
+    def rpc(self, function, args=None, idempotent=True):
+        """Вызов SQL-функции; функции чтения (STABLE) можно повторять"""
+        return self.json("POST", f"rpc/{function}", json=args or {}, idempotent=idempotent)
+
+    def metrics(self):
+        """Сводка по эндпоинтам: {"GET feedings": {...}}"""
+        with self._lock:
+            return {name: stats.summary() for name, stats in sorted(self._stats.items())}
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,128 @@
+"""
+Простой pub/sub внутри процесса для push-обновлений API
+
+Broker раздаёт сообщения подписчикам темы (у каждого своя очередь).
+VersionWatcher следит за таблицей family_versions, которую триггеры базы
+обновляют при каждой записи бота, и публикует id семьи, данные которой
+изменились. Внешний брокер не нужен: бот и API общаются через базу.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Как часто проверять, изменилась ли база (секунды)
+WATCH_INTERVAL = float(os.getenv('STREAM_WATCH_INTERVAL', '1'))
+
+class Subscription:
+    """Очередь сообщений одного подписчика"""
+
+    def __init__(self, broker, topic, maxsize=100):
+        self.broker = broker
+        self.topic = topic
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout=None):
+        """Следующее сообщение или None, если за timeout ничего не пришло"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class Broker:
+    """Темы -> подписчики"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, topic):
+        subscription = Subscription(self, topic)
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.topic]
+
+    def topics(self):
+        """Темы, у которых есть подписчики"""
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, topic, message):
+        """Отправить сообщение всем подписчикам темы; возвращает число получателей"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # Подписчик не успевает читать; уведомления об изменениях можно терять,
+                # следующее всё равно приведёт к перечитыванию данных
+                self.dropped += 1
+        self.published += 1
+        return len(subscribers)
+
+    def metrics(self):
+        with self._lock:
+            subscribers = sum(len(s) for s in self._subscribers.values())
+            topics = len(self._subscribers)
+        return {"topics": topics, "subscribers": subscribers, "published": self.published, "dropped": self.dropped}
+
+class VersionWatcher:
+    """Фоновый поток: публикует id семей, чья версия в family_versions изменилась"""
+
+    def __init__(self, manager, broker, interval=WATCH_INTERVAL):
+        self.manager = manager
+        self.broker = broker
+        self.interval = interval
+        self._versions = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Запустить поток (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="version-watcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        data_version = None
+        while True:
+            try:
+                # data_version меняется, только когда базу изменило другое соединение
+                current = self.manager.fetchone("PRAGMA data_version")[0]
+                if current != data_version:
+                    data_version = current
+                    self.check()
+            except sqlite3.Error as e:
+                print(f"❌ Ошибка отслеживания изменений базы: {e}")
+            time.sleep(self.interval)
+
+    def check(self):
+        """Сравнить версии семей с подписчиками и опубликовать изменившиеся"""
+        family_ids = self.broker.topics()
+        if not family_ids:
+            return
+        placeholders = ",".join("?" * len(family_ids))
+        rows = self.manager.fetchall(
+            f"SELECT family_id, version FROM family_versions WHERE family_id IN ({placeholders})",
+            family_ids
+        )
+        for family_id, version in rows:
+            if self._versions.get(family_id) != version:
+                self._versions[family_id] = version
+                self.broker.publish(family_id, version)
@@ -0,0 +1,181 @@
+"""
+Единый движок напоминаний
+
+Для каждой пары (семья, вид напоминания) вычисляется ближайшее время
+отправки; все они лежат в одной куче. Движок спит до самого раннего
+срока и будит себя заново, когда расписание семьи меняется (новое событие
+или изменение настроек). Работа пропорциональна числу отправленных
+напоминаний, а не числу семей, умноженному на число проверок.
+
+Вид напоминания описывается двумя функциями:
+    windows(family_id) -> [(начало, конец или None, этап, период повтора), ...]
+    send(family_id, этап) -> корутина, отправляющая напоминание
+Внутри окна напоминание повторяется не чаще одного раза за период.
+"""
+import asyncio
+import heapq
+from datetime import timedelta
+
+import clock
+
+def next_fire(windows, now, last_fired=None):
+    """Ближайшее время отправки (epoch) и этап по окнам напоминания"""
+    best = None
+    for start, end, stage, period in windows:
+        start = start.timestamp()
+        end = end.timestamp() if end is not None else None
+        if isinstance(period, timedelta):
+            period = period.total_seconds()
+
+        fire_at = max(start, now)
+        if last_fired is not None and last_fired >= start:
+            # В этом окне уже отправляли — следующий повтор через период
+            fire_at = max(fire_at, last_fired + period)
+        if end is not None and fire_at >= end:
+            continue
+        if best is None or fire_at < best[0]:
+            best = (fire_at, stage)
+    return best
+
+def daily_windows(moment, stage, days=(0, 1), offset=0):
+    """Окна ежедневного напоминания в moment (местное время) по одной минуте
+
+    Прибавление дней к времени с zoneinfo сохраняет местное время и при
+    переходе на летнее; offset (секунды) — постоянный сдвиг семьи.
+    """
+    windows = []
+    for day in days:
+        start = moment + timedelta(days=day, seconds=offset)
+        windows.append((start, start + timedelta(minutes=1), stage, timedelta(days=1)))
+    return windows
+
+def every_n_days(windows, last, period, limit=2):
+    """Первые limit ежедневных окон, в которые с last прошло не меньше period дней"""
+    return [w for w in windows if last is None or (w[0] - last).days >= period][:limit]
+
+def spread_offset(key, spread):
+    """Постоянный сдвиг ключа (id семьи) в пределах [0, spread) секунд
+
+    Мультипликативный хэш Кнута разносит соседние id по всему интервалу,
+    поэтому напоминания с одинаковым временем не уходят одной пачкой.
+    """
+    if spread <= 0:
+        return 0
+    return (key * 2654435761) % 2 ** 32 * spread // 2 ** 32
+
+class ReminderEngine:
+    """Куча ближайших сроков напоминаний по всем семьям"""
+
+    def __init__(self, now=None):
+        # Часы бота: clock.default.freeze()/advance() управляют и расписанием
+        self.clock = now or clock.default.timestamp
+        self.types = {}
+        self.fired = 0
+        self._heap = []
+        self._due = {}
+        self._last_fired = {}
+        self._wakeup = None
+        # Отправки в работе; ссылки держим, чтобы задачи не собрал сборщик мусора
+        self._sending = set()
+
+    def register(self, name, windows, send):
+        """Зарегистрировать вид напоминания"""
+        self.types[name] = (windows, send)
+
+    def reschedule(self, family_id, names=None):
+        """Пересчитать сроки напоминаний семьи (после события или смены настроек)"""
+        now = self.clock()
+        for name in names or self.types:
+            windows, _ = self.types[name]
+            key = (family_id, name)
+            try:
+                due = next_fire(windows(family_id), now, self._last_fired.get(key))
+            except Exception as e:
+                print(f"❌ Ошибка расчёта напоминания {name} для семьи {family_id}: {e}")
+                due = None
+
+            if due is None:
+                self._due.pop(key, None)
+                continue
+            if self._due.get(key) == due:
+                continue
+            self._due[key] = due
+            heapq.heappush(self._heap, (due[0], family_id, name))
+
+        # Старые записи в куче не удаляются сразу; чистим, когда их стало много
+        if len(self._heap) > 2 * len(self._due) + 100:
+            self._heap = [(due[0], fid, name) for (fid, name), due in self._due.items()]
+            heapq.heapify(self._heap)
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def warm(self, family_ids):
+        """Рассчитать расписание для всех семей при запуске"""
+        for family_id in family_ids:
+            self.reschedule(family_id)
+        print(f"✅ Движок напоминаний: запланировано {len(self._due)} напоминаний")
+
+    def next_due(self):
+        """Время ближайшего напоминания (epoch) или None"""
+        while self._heap:
+            due_at, family_id, name = self._heap[0]
+            due = self._due.get((family_id, name))
+            if due is not None and due[0] == due_at:
+                return due_at
+            heapq.heappop(self._heap)
+        return None
+
+    async def _fire(self, family_id, name, stage):
+        _, send = self.types[name]
+        try:
+            await send(family_id, stage)
+            self.fired += 1
+        except Exception as e:
+            print(f"❌ Ошибка напоминания {name} для семьи {family_id}: {e}")
+        self.reschedule(family_id, [name])
+
+    def _sent(self, task):
+        self._sending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"❌ Ошибка задачи напоминания: {task.exception()}")
+
+    async def fire_due(self):
+        """Запустить все напоминания, срок которых наступил
+
+        Отправки идут отдельными задачами: медленный чат (лимиты Telegram,
+        FloodWait) не задерживает остальные напоминания. Возвращает запущенные задачи.
+        """
+        now = self.clock()
+        started = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, family_id, name = heapq.heappop(self._heap)
+            key = (family_id, name)
+            due = self._due.get(key)
+            if due is None or due[0] != due_at:
+                # Запись устарела: расписание семьи уже пересчитано
+                continue
+            del self._due[key]
+            self._last_fired[key] = now
+            task = asyncio.ensure_future(self._fire(family_id, name, due[1]))
+            self._sending.add(task)
+            task.add_done_callback(self._sent)
+            started.append(task)
+        return started
+
+    async def run(self):
+        """Основной цикл: спим до ближайшего срока или до изменения расписания"""
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            await self.fire_due()
+
+            due_at = self.next_due()
+            timeout = max(due_at - self.clock(), 0) if due_at is not None else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+# Движок по умолчанию для бота
+default = ReminderEngine()
@@ -0,0 +1,418 @@
+"""
+Репликация базы данных бота в копию для Render или в Supabase
+
+Триггеры пишут каждое изменение в журнал change_log. Записи накапливаются
+в течение окна (debounce), после чего одна фоновая синхронизация применяет
+к цели только новые строки журнала, начиная с сохранённого checkpoint.
+Полная копия через online backup API SQLite снимается только при первом
+запуске. Одновременно выполняется не больше одной синхронизации.
+"""
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+import db
+
+# Путь к копии базы, которую читает API на Render
+RENDER_DB_PATH = os.getenv('BABYBOT_RENDER_DB_PATH', 'babybot_render.db')
+
+# Окно накопления записей и максимальная задержка синхронизации (в секундах)
+SYNC_WINDOW = float(os.getenv('SYNC_WINDOW_SECONDS', '30'))
+SYNC_MAX_DELAY = float(os.getenv('SYNC_MAX_DELAY_SECONDS', '300'))
+
+# Куда публиковать изменения: git (копия + коммит и push), local (только файл) или supabase
+SYNC_TARGET = os.getenv('SYNC_TARGET', 'git')
+
+def backup_database(source_path, target_path):
+    """Снять согласованную копию базы через backup API и атомарно заменить файл"""
+    tmp_path = f"{target_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    src = sqlite3.connect(source_path, timeout=5)
+    dst = sqlite3.connect(tmp_path)
+    try:
+        src.backup(dst)
+        # Копия должна быть самодостаточным файлом без WAL
+        dst.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        dst.close()
+        src.close()
+
+    os.replace(tmp_path, target_path)
+
+# Реплицируемые таблицы: таблица -> колонка, по которой строка однозначно находится
+CHANGE_LOG_TABLES = {
+    "families": "id",
+    "family_members": "user_id",
+    "feedings": "id",
+    "diapers": "id",
+    "baths": "id",
+    "activities": "id",
+    "sleep_sessions": "id",
+    "settings": "family_id",
+}
+
+# Сколько записей журнала применяется за один проход
+CHANGE_LOG_BATCH = 500
+
+def install_change_log(cur):
+    """Создать журнал изменений и триггеры, которые пишут в него при каждой записи"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_key INTEGER,
+            op TEXT NOT NULL
+        )
+    """)
+    for table, key in CHANGE_LOG_TABLES.items():
+        for op, event, ref in (("i", "INSERT", "NEW"), ("u", "UPDATE", "NEW"), ("d", "DELETE", "OLD")):
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS change_log_{table}_{op} AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, row_key, op) VALUES ('{table}', {ref}.{key}, '{op}');
+                END
+            """)
+
+def drop_change_log(conn):
+    """Удалить журнал и триггеры (в копии базы они не нужны)"""
+    for table in CHANGE_LOG_TABLES:
+        for op in ("i", "u", "d"):
+            conn.execute(f"DROP TRIGGER IF EXISTS change_log_{table}_{op}")
+    conn.execute("DROP TABLE IF EXISTS change_log")
+
+def max_change_seq(conn):
+    """Последний номер в журнале изменений (0, если журнала нет)"""
+    try:
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+def read_changes(conn, since, limit=CHANGE_LOG_BATCH):
+    """Прочитать изменения после checkpoint и текущее состояние затронутых строк
+
+    Несколько изменений одной строки схлопываются: важно только её последнее
+    состояние. Возвращает (последний seq, [(таблица, ключ, строка или None)]).
+    """
+    changes = conn.execute(
+        "SELECT seq, table_name, row_key FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?",
+        (since, limit)
+    ).fetchall()
+    if not changes:
+        return since, []
+
+    touched = {}
+    for seq, table, row_key in changes:
+        touched.pop((table, row_key), None)
+        touched[(table, row_key)] = seq
+
+    rows = []
+    for table, row_key in touched:
+        key = CHANGE_LOG_TABLES[table]
+        cur = conn.execute(f"SELECT * FROM {table} WHERE {key} = ?", (row_key,))
+        row = cur.fetchone()
+        if row is not None:
+            row = dict(zip([d[0] for d in cur.description], row))
+        rows.append((table, row_key, row))
+    return changes[-1][0], rows
+
+# Ошибки SQLite, означающие, что схема копии отстала от основной базы.
+# Остальные (database is locked, disk I/O error) временные: их повторит Replicator
+SCHEMA_DRIFT_ERRORS = ("no such table", "no such column", "has no column named")
+
+def is_schema_drift(error):
+    message = str(error)
+    return any(marker in message for marker in SCHEMA_DRIFT_ERRORS)
+
+def apply_change_log(source_path, target, prune=False):
+    """Применить к цели только новые изменения журнала; возвращает число строк"""
+    src = sqlite3.connect(source_path, timeout=5)
+    try:
+        checkpoint = target.get_checkpoint()
+        if checkpoint is None:
+            # Первый запуск: цель заполняется целиком, дальше только приращения
+            checkpoint = target.bootstrap(source_path)
+            print(f"📦 Начальная репликация выполнена (checkpoint {checkpoint})")
+
+        applied = 0
+        while True:
+            last_seq, rows = read_changes(src, checkpoint)
+            if not rows:
+                break
+            target.apply(rows, last_seq)
+            checkpoint = last_seq
+            applied += len(rows)
+
+        if prune:
+            # Журнал читает одна цель, применённые записи больше не нужны
+            src.execute("DELETE FROM change_log WHERE seq <= ?", (checkpoint,))
+            src.commit()
+        return applied
+    finally:
+        src.close()
+
+class LocalTarget:
+    """Локальная цель: копия базы в файле, обновляемая по журналу изменений
+
+    Подходит и для работы без сети, и как основа для публикации на Render.
+    """
+
+    def __init__(self, path=RENDER_DB_PATH, prune=True):
+        self.path = path
+        self.prune = prune
+
+    def get_checkpoint(self):
+        if not os.path.exists(self.path):
+            return None
+        conn = sqlite3.connect(self.path)
+        try:
+            row = conn.execute("SELECT seq FROM replication_state WHERE id = 1").fetchone()
+            return row[0] if row else None
+        except sqlite3.OperationalError as e:
+            if not is_schema_drift(e):
+                raise
+            # Копия создана старым способом, без checkpoint
+            return None
+        finally:
+            conn.close()
+
+    def bootstrap(self, source_path):
+        backup_database(source_path, self.path)
+        conn = sqlite3.connect(self.path)
+        try:
+            # Снимок согласован с журналом в нём же
+            seq = max_change_seq(conn)
+            drop_change_log(conn)
+            conn.execute("CREATE TABLE IF NOT EXISTS replication_state (id INTEGER PRIMARY KEY, seq INTEGER NOT NULL)")
+            conn.execute("INSERT OR REPLACE INTO replication_state (id, seq) VALUES (1, ?)", (seq,))
+            conn.commit()
+        finally:
+            conn.close()
+        return seq
+
+    def apply(self, rows, seq):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                for table, row_key, row in rows:
+                    conn.execute(f"DELETE FROM {table} WHERE {CHANGE_LOG_TABLES[table]} = ?", (row_key,))
+                    if row is not None:
+                        columns = list(row)
+                        conn.execute(
+                            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                            [row[c] for c in columns]
+                        )
+                conn.execute("UPDATE replication_state SET seq = ? WHERE id = 1", (seq,))
+        finally:
+            conn.close()
+
+    def publish(self, source_path):
+        try:
+            return apply_change_log(source_path, self, self.prune)
+        except sqlite3.OperationalError as e:
+            if not is_schema_drift(e):
+                raise
+            # Схема копии отстала от основной базы — пересоздаём копию целиком
+            print(f"⚠️ Копия базы устарела ({e}), выполняем полную репликацию")
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return apply_change_log(source_path, self, self.prune)
+
+class GitTarget(LocalTarget):
+    """Обновляет файл копии и отправляет его в репозиторий, из которого деплоится Render"""
+
+    def __init__(self, path=RENDER_DB_PATH, remote="origin", branch="main", prune=True):
+        super().__init__(path, prune)
+        self.remote = remote
+        self.branch = branch
+
+    def publish(self, source_path):
+        bootstrapped = self.get_checkpoint() is None
+        applied = super().publish(source_path)
+        if not applied and not bootstrapped:
+            return applied
+        subprocess.run(["git", "add", self.path], check=True, capture_output=True)
+        subprocess.run(["git", "commit", "-m", f"Auto-sync: {datetime.now().strftime('%H:%M:%S')}"], check=True, capture_output=True)
+        subprocess.run(["git", "push", self.remote, self.branch], check=True, capture_output=True)
+        return applied
+
+class SupabaseTarget:
+    """Применяет журнал изменений к таблицам Supabase через REST API
+
+    Начальная загрузка выполняется migrate_to_supabase.py; checkpoint хранится
+    в основной базе, в таблице replication_state.
+    """
+
+    # Ключи для upsert в Supabase (должны совпадать с UNIQUE-ограничениями схемы)
+    ON_CONFLICT = {"family_members": "family_id,user_id", "settings": "family_id"}
+
+    # Колонки, которые в Supabase имеют тип BOOLEAN
+    BOOLEAN_COLUMNS = {
+        "sleep_sessions": ("is_active",),
+        "settings": ("tips_enabled", "bath_reminder_enabled", "activity_reminder_enabled", "sleep_monitoring_enabled"),
+    }
+
+    def __init__(self, source_path=db.DB_PATH, url=None, key=None, prune=True):
+        self.source_path = source_path
+        self.url = url or os.getenv('SUPABASE_URL')
+        self.key = key or os.getenv('SUPABASE_KEY')
+        self.prune = prune
+        self._http = None
+
+    @property
+    def http(self):
+        # requests нужен только для этой цели, поэтому клиент создаётся при первом обращении
+        if self._http is None:
+            import postgrest
+            self._http = postgrest.Client(self.url, self.key)
+        return self._http
+
+    def _state(self, conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS replication_state (id INTEGER PRIMARY KEY, seq INTEGER NOT NULL)")
+
+    def get_checkpoint(self):
+        conn = sqlite3.connect(self.source_path, timeout=5)
+        try:
+            self._state(conn)
+            row = conn.execute("SELECT seq FROM replication_state WHERE id = 2").fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def _set_checkpoint(self, seq):
+        conn = sqlite3.connect(self.source_path, timeout=5)
+        try:
+            with conn:
+                self._state(conn)
+                conn.execute("INSERT OR REPLACE INTO replication_state (id, seq) VALUES (2, ?)", (seq,))
+        finally:
+            conn.close()
+
+    def bootstrap(self, source_path):
+        conn = sqlite3.connect(source_path, timeout=5)
+        try:
+            seq = max_change_seq(conn)
+        finally:
+            conn.close()
+        print("ℹ️ Начальные данные в Supabase загружаются скриптом migrate_to_supabase.py")
+        self._set_checkpoint(seq)
+        return seq
+
+    # Колонки только локальной базы (время в epoch и местный день), в Supabase их нет
+    LOCAL_COLUMNS = ("ts", "start_ts", "end_ts", "local_day")
+
+    def _to_supabase(self, table, row):
+        row = {column: value for column, value in row.items() if column not in self.LOCAL_COLUMNS}
+        if table == "settings":
+            # В Supabase есть только baby_birth_date
+            birth_date = row.pop("birth_date", None)
+            row["baby_birth_date"] = row.get("baby_birth_date") or birth_date
+        for column in self.BOOLEAN_COLUMNS.get(table, ()):
+            if row.get(column) is not None:
+                row[column] = bool(row[column])
+        return row
+
+    def apply(self, rows, seq):
+        upserts = {}
+        for table, row_key, row in rows:
+            if row is None:
+                self.http.delete(table, {CHANGE_LOG_TABLES[table]: f"eq.{row_key}"})
+            else:
+                upserts.setdefault(table, []).append(self._to_supabase(table, row))
+
+        # Родительские таблицы отправляем раньше дочерних
+        for table in CHANGE_LOG_TABLES:
+            if table not in upserts:
+                continue
+            self.http.upsert(table, upserts[table], self.ON_CONFLICT.get(table))
+
+        self._set_checkpoint(seq)
+
+    def publish(self, source_path):
+        return apply_change_log(source_path, self, self.prune)
+
+class Replicator:
+    """Фоновый воркер, объединяющий частые записи в редкие синхронизации"""
+
+    def __init__(self, target, source_path=db.DB_PATH, window=SYNC_WINDOW, max_delay=SYNC_MAX_DELAY):
+        self.target = target
+        self.source_path = source_path
+        self.window = window
+        self.max_delay = max_delay
+        self.syncs = 0
+        self.failures = 0
+        self._cond = threading.Condition()
+        self._first_change = None
+        self._last_change = None
+        self._sync_lock = threading.Lock()
+        self._thread = None
+
+    def notify(self):
+        """Отметить изменение базы; синхронизация произойдёт после окна тишины"""
+        with self._cond:
+            now = time.monotonic()
+            if self._first_change is None:
+                self._first_change = now
+            self._last_change = now
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _due_in(self, now):
+        """Сколько секунд осталось до синхронизации (None, если изменений нет)"""
+        if self._first_change is None:
+            return None
+        due = min(self._last_change + self.window, self._first_change + self.max_delay)
+        return due - now
+
+    def _run(self):
+        while True:
+            with self._cond:
+                wait = self._due_in(time.monotonic())
+                while wait is None or wait > 0:
+                    self._cond.wait(wait)
+                    wait = self._due_in(time.monotonic())
+                self._first_change = None
+                self._last_change = None
+            if not self.sync():
+                # Временная ошибка (например, база занята) — повторяем после окна тишины
+                self.notify()
+
+    def sync(self):
+        """Выполнить синхронизацию сейчас (не больше одной одновременно)"""
+        with self._sync_lock:
+            try:
+                self.target.publish(self.source_path)
+                self.syncs += 1
+                print("✅ Данные синхронизированы с Render")
+                return True
+            except Exception as e:
+                self.failures += 1
+                print(f"⚠️ Ошибка синхронизации с Render: {e}")
+                return False
+
+    def flush(self):
+        """Немедленно синхронизировать накопленные изменения (например, при остановке)"""
+        with self._cond:
+            pending = self._first_change is not None
+            self._first_change = None
+            self._last_change = None
+        if pending:
+            return self.sync()
+        return True
+
+def make_target(kind=SYNC_TARGET):
+    """Создать цель синхронизации по имени из настроек"""
+    if kind == 'local':
+        return LocalTarget()
+    if kind == 'supabase':
+        return SupabaseTarget()
+    return GitTarget()
+
+# Репликатор по умолчанию для babybot.db
+default = Replicator(make_target())
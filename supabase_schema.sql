@@ -101,11 +101,15 @@ CREATE TABLE IF NOT EXISTS settings (
     sleep_monitoring_enabled BOOLEAN DEFAULT TRUE,
     baby_age_months INTEGER DEFAULT 0,
     baby_birth_date DATE,
+    timezone TEXT,  -- имя пояса IANA; NULL — пояс бота по умолчанию
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     UNIQUE(family_id)
 );
 
+-- Для баз, созданных до появления часовых поясов семей
+ALTER TABLE settings ADD COLUMN IF NOT EXISTS timezone TEXT;
+
 -- Создаем индексы для оптимизации запросов
 CREATE INDEX IF NOT EXISTS idx_feedings_family_timestamp ON feedings(family_id, timestamp);
 CREATE INDEX IF NOT EXISTS idx_diapers_family_timestamp ON diapers(family_id, timestamp);
@@ -113,6 +117,46 @@ CREATE INDEX IF NOT EXISTS idx_baths_family_timestamp ON baths(family_id, timest
 CREATE INDEX IF NOT EXISTS idx_activities_family_timestamp ON activities(family_id, timestamp);
 CREATE INDEX IF NOT EXISTS idx_sleep_sessions_family_active ON sleep_sessions(family_id, is_active);
 CREATE INDEX IF NOT EXISTS idx_family_members_family ON family_members(family_id);
+CREATE INDEX IF NOT EXISTS idx_sleep_sessions_active_start ON sleep_sessions(family_id, start_time) WHERE is_active;
+
+-- Последние события семьи одним вызовом: POST /rest/v1/rpc/family_last_events
+-- с телом {"family_id": 1}. Возвращает объект {feeding, diaper, bath, activity,
+-- sleep}; каждое значение — последняя строка своей таблицы (для сна — активная
+-- сессия) или null. Каждый подзапрос читает одну строку по индексу семьи и времени.
+CREATE OR REPLACE FUNCTION family_last_events(family_id INTEGER)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'feeding', (SELECT row_to_json(e) FROM feedings e
+                    WHERE e.family_id = family_last_events.family_id
+                    ORDER BY e.timestamp DESC LIMIT 1),
+        'diaper', (SELECT row_to_json(e) FROM diapers e
+                   WHERE e.family_id = family_last_events.family_id
+                   ORDER BY e.timestamp DESC LIMIT 1),
+        'bath', (SELECT row_to_json(e) FROM baths e
+                 WHERE e.family_id = family_last_events.family_id
+                 ORDER BY e.timestamp DESC LIMIT 1),
+        'activity', (SELECT row_to_json(e) FROM activities e
+                     WHERE e.family_id = family_last_events.family_id
+                     ORDER BY e.timestamp DESC LIMIT 1),
+        'sleep', (SELECT row_to_json(e) FROM sleep_sessions e
+                  WHERE e.family_id = family_last_events.family_id AND e.is_active
+                  ORDER BY e.start_time DESC LIMIT 1)
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Выравнивание счётчиков id после переноса строк с явными id
+-- (migrate_to_supabase.py): следующий id каждой таблицы — MAX(id) + 1
+CREATE OR REPLACE FUNCTION sync_id_sequences()
+RETURNS VOID AS $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['families', 'family_members', 'feedings', 'diapers',
+                             'baths', 'activities', 'sleep_sessions', 'settings'] LOOP
+        EXECUTE format('SELECT setval(pg_get_serial_sequence(%L, ''id''), COALESCE(MAX(id), 0) + 1, false) FROM %I', t, t);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
 
 -- Создаем функцию для обновления updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -3,10 +3,10 @@
 Скрипт для синхронизации локальной базы данных с Render
 """
 import os
-import shutil
 import sqlite3
 import subprocess
 import sys
+from replication import LocalTarget
 from datetime import datetime
 
 def sync_database():
@@ -19,9 +19,9 @@ def sync_database():
             print("❌ Локальная база данных babybot.db не найдена!")
             return False
         
-        # Создаем копию для Render
-        shutil.copy2("babybot.db", "babybot_render.db")
-        print("✅ База данных скопирована для Render")
+        # Переносим в копию для Render только новые изменения из журнала
+        applied = LocalTarget("babybot_render.db").publish("babybot.db")
+        print(f"✅ Копия для Render обновлена (изменено строк: {applied})")
         
         # Проверяем изменения
         conn = sqlite3.connect("babybot_render.db")
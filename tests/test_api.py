@@ -0,0 +1,58 @@
+"""Соединения API с базой и проверка версии схемы перед запросами"""
+import sqlite3
+import threading
+
+import pytest
+
+import api
+import db
+import migrations
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = db.ConnectionManager("babybot.db")
+    migrations.migrate(manager)
+    manager.execute("INSERT INTO families (id, name) VALUES (1, 'Семья')")
+    manager.execute("INSERT INTO family_members (family_id, user_id, role, name) VALUES (1, 10, 'Мама', 'Анна')")
+    manager.close()
+    monkeypatch.setattr(api, "_db_managers", {})
+    monkeypatch.setattr(api, "_schema_checked", set())
+    return api.app.test_client()
+
+def get_in_new_thread(client, url):
+    """Как threaded-сервер Flask: каждый запрос в своём потоке"""
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(response=client.get(url)))
+    thread.start()
+    thread.join()
+    return result["response"]
+
+def test_requests_share_pooled_connection(client, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        opened.append(args)
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(sqlite3, "connect", counting_connect)
+    for _ in range(5):
+        response = get_in_new_thread(client, "/api/family/1/members")
+        assert response.status_code == 200
+        assert response.get_json()["members"][0]["name"] == "Анна"
+    assert len(opened) == 1
+
+def test_outdated_schema_is_refused_not_migrated(client, tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "babybot.db"))
+    conn.execute("PRAGMA user_version = 1")
+    conn.close()
+
+    response = client.get("/api/family/1/members")
+    assert response.status_code == 503
+    manager = api._db_managers["babybot.db"]
+    assert migrations.schema_version(manager) == 1
+
+    # После миграции бота API снова отвечает
+    manager.execute(f"PRAGMA user_version = {migrations.LATEST_VERSION}")
+    assert client.get("/api/family/1/members").status_code == 200
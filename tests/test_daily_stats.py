@@ -0,0 +1,83 @@
+"""Суточная статистика по местному дню семьи (local_day)"""
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import api
+import clock
+import daily_stats
+import db
+import migrations
+
+NEW_YORK = clock.get_zone("America/New_York")
+
+@pytest.fixture
+def database(tmp_path):
+    manager = db.ConnectionManager(str(tmp_path / "babybot.db"), row_factory=sqlite3.Row)
+    migrations.migrate(manager)
+    manager.execute("INSERT INTO families (id, name) VALUES (1, 'Семья')")
+    manager.execute("INSERT INTO settings (family_id, timezone) VALUES (1, 'America/New_York')")
+    yield manager
+    manager.close()
+
+def add_feeding(database, local_moment, timestamp=None):
+    """Кормление семьи из Нью-Йорка; строка времени по умолчанию в UTC, как в Supabase"""
+    moment = local_moment.replace(tzinfo=NEW_YORK)
+    timestamp = timestamp or moment.astimezone(clock.UTC).isoformat()
+    return database.execute(
+        "INSERT INTO feedings (family_id, timestamp, ts, local_day) VALUES (1, ?, ?, ?)",
+        (timestamp, clock.to_epoch(moment), moment.date().isoformat())
+    )
+
+def stats(database):
+    return {row["day"]: row["count"] for row in database.fetchall(
+        "SELECT day, count FROM daily_stats WHERE family_id = 1 AND kind = 'feedings'"
+    )}
+
+def test_event_before_local_midnight_counts_on_local_day(database):
+    # 23:30 в Нью-Йорке 1 января — это уже 2 января по UTC
+    add_feeding(database, datetime(2025, 1, 1, 23, 30))
+    assert stats(database) == {"2025-01-01": 1}
+
+    row = api.fetch_dashboard_row(database, 1, "2025-01-01", "2025-01-01")
+    assert row["feedings_count"] == 1
+    row = api.fetch_dashboard_row(database, 1, "2025-01-02", "2025-01-02")
+    assert row["feedings_count"] == 0
+
+def test_update_and_delete_move_local_day(database):
+    row_id = add_feeding(database, datetime(2025, 1, 1, 23, 30))
+    moved = datetime(2025, 1, 2, 0, 15, tzinfo=NEW_YORK)
+    database.execute(
+        "UPDATE feedings SET timestamp = ?, ts = ?, local_day = ? WHERE id = ?",
+        (moved.astimezone(clock.UTC).isoformat(), clock.to_epoch(moved), moved.date().isoformat(), row_id)
+    )
+    assert stats(database) == {"2025-01-02": 1}
+
+    database.execute("DELETE FROM feedings WHERE id = ?", (row_id,))
+    assert stats(database) == {}
+
+def test_backfill_uses_local_day(database):
+    add_feeding(database, datetime(2025, 1, 1, 23, 30))
+    add_feeding(database, datetime(2025, 1, 1, 20, 0))
+    with database.cursor() as cur:
+        cur.execute("DELETE FROM daily_stats")
+        daily_stats.backfill(cur)
+    assert stats(database) == {"2025-01-01": 2}
+
+def test_migration_rebuckets_iso_days(tmp_path):
+    # База версии 9: статистика ещё считалась по строке времени
+    manager = db.ConnectionManager(str(tmp_path / "old.db"), row_factory=sqlite3.Row)
+    try:
+        for number, _, migration in migrations.MIGRATIONS[:9]:
+            with manager.cursor() as cur:
+                migration(cur)
+                cur.execute(f"PRAGMA user_version = {number}")
+        manager.execute("INSERT INTO families (id, name) VALUES (1, 'Семья')")
+        add_feeding(manager, datetime(2025, 1, 1, 23, 30))
+        assert stats(manager) == {"2025-01-02": 1}
+
+        migrations.migrate(manager)
+        assert stats(manager) == {"2025-01-01": 1}
+    finally:
+        manager.close()
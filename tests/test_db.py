@@ -0,0 +1,44 @@
+"""Коммит и откат во вложенных блоках ConnectionManager.cursor()"""
+import asyncio
+import sqlite3
+
+import pytest
+
+import db
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = db.ConnectionManager(str(tmp_path / "test.db"))
+    manager.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    yield manager
+    manager.close()
+
+def committed(manager):
+    """Строки, видимые другому соединению (то есть закоммиченные)"""
+    conn = sqlite3.connect(manager.path)
+    try:
+        return [row[0] for row in conn.execute("SELECT name FROM items ORDER BY id")]
+    finally:
+        conn.close()
+
+def test_only_outer_block_commits(manager):
+    with manager.cursor() as cur:
+        with manager.cursor() as inner:
+            inner.execute("INSERT INTO items (name) VALUES ('a')")
+        assert committed(manager) == []
+        cur.execute("INSERT INTO items (name) VALUES ('b')")
+    assert committed(manager) == ['a', 'b']
+
+@pytest.mark.parametrize("error", [ValueError, KeyboardInterrupt, asyncio.CancelledError])
+def test_interrupted_block_rolls_back_and_resets_depth(manager, error):
+    with pytest.raises(error):
+        with manager.cursor() as cur:
+            cur.execute("INSERT INTO items (name) VALUES ('lost')")
+            with manager.cursor():
+                raise error()
+    assert manager._local.depth == 0
+    assert committed(manager) == []
+
+    # Следующая запись снова коммитится
+    manager.execute("INSERT INTO items (name) VALUES ('kept')")
+    assert committed(manager) == ['kept']
@@ -0,0 +1,152 @@
+"""Очередь исходящих сообщений на виртуальных часах цикла событий"""
+import asyncio
+
+import pytest
+
+import notifications
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Цикл событий, в котором время идёт скачками до ближайшего таймера"""
+
+    def __init__(self):
+        super().__init__()
+        self._now = 0.0
+        select = self._selector.select
+
+        def advance(timeout=None):
+            events = select(0)
+            if not events and timeout:
+                self._now += timeout
+            return events
+
+        self._selector.select = advance
+
+    def time(self):
+        return self._now
+
+class FloodWaitError(Exception):
+    """Как telethon.errors.FloodWaitError: имя класса и seconds"""
+
+    def __init__(self, seconds):
+        super().__init__(f"A wait of {seconds} seconds is required")
+        self.seconds = seconds
+
+@pytest.fixture
+def loop():
+    loop = VirtualTimeLoop()
+    yield loop
+    # Воркеры очереди работают бесконечно — отменяем их перед закрытием цикла
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+
+class FakeSender:
+    """Записывает (время, чат, текст) каждой отправки; ошибки задаются заранее"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.sent = []
+        self.errors = {}
+
+    def factory(self, chat_id, text):
+        async def send():
+            error = self.errors.get(text, [])
+            if error:
+                raise error.pop(0)
+            self.sent.append((self.loop.time(), chat_id, text))
+            return text
+        return send
+
+def make_queue(loop, **kwargs):
+    options = dict(workers=2, global_rate=100, chat_rate=1, chat_burst=3, now=loop.time)
+    options.update(kwargs)
+    return notifications.OutboundQueue(**options)
+
+def test_burst_to_one_chat_is_throttled_without_blocking_others(loop):
+    sender = FakeSender(loop)
+    queue = make_queue(loop)
+
+    async def scenario():
+        burst = [queue.call(1, sender.factory(1, f"m{i}")) for i in range(6)]
+        other = queue.call(2, sender.factory(2, "other"))
+        return await asyncio.gather(*burst, other)
+
+    results = loop.run_until_complete(scenario())
+    assert results == ["m0", "m1", "m2", "m3", "m4", "m5", "other"]
+    times = {text: at for at, _, text in sender.sent}
+    # Три сообщения запасом, дальше по одному в секунду
+    assert [times[f"m{i}"] for i in range(6)] == [0, 0, 0, 1, 2, 3]
+    # Чат 2 не ждёт, пока чат 1 выбирает свой лимит
+    assert times["other"] == 0
+    assert queue.metrics()["parked"] == 0
+    assert queue.metrics()["sent"] == 7
+
+def test_flood_wait_pauses_and_retries(loop):
+    sender = FakeSender(loop)
+    sender.errors["hello"] = [FloodWaitError(5)]
+    queue = make_queue(loop)
+
+    async def scenario():
+        first = asyncio.ensure_future(queue.call(1, sender.factory(1, "hello")))
+        await asyncio.sleep(1)
+        # Во время паузы после FloodWait не уходит ничего, и в другие чаты тоже
+        second = queue.call(2, sender.factory(2, "later"))
+        return await asyncio.gather(first, second)
+
+    assert loop.run_until_complete(scenario()) == ["hello", "later"]
+    assert sender.sent == [(5, 1, "hello"), (5, 2, "later")]
+    metrics = queue.metrics()
+    assert (metrics["flood_waits"], metrics["retries"], metrics["failed"]) == (1, 1, 0)
+
+def test_flood_wait_gives_up_after_max_retries(loop):
+    sender = FakeSender(loop)
+    sender.errors["hello"] = [FloodWaitError(2), FloodWaitError(2)]
+    queue = make_queue(loop, max_retries=1)
+
+    with pytest.raises(FloodWaitError):
+        loop.run_until_complete(queue.call(1, sender.factory(1, "hello")))
+    assert loop.time() == 2
+    assert queue.metrics()["failed"] == 1
+
+def test_high_priority_jumps_ahead(loop):
+    sender = FakeSender(loop)
+    queue = make_queue(loop, workers=1)
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def hold():
+            await gate.wait()
+            sender.sent.append((loop.time(), 0, "hold"))
+
+        busy = asyncio.ensure_future(queue.call(0, hold))
+        await asyncio.sleep(0)
+        calls = [
+            queue.call(3, sender.factory(3, "tip"), notifications.LOW),
+            queue.call(2, sender.factory(2, "reminder"), notifications.NORMAL),
+            queue.call(4, sender.factory(4, "urgent"), notifications.URGENT),
+            queue.call(1, sender.factory(1, "reply"), notifications.INTERACTIVE),
+        ]
+        pending = [asyncio.ensure_future(call) for call in calls]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(busy, *pending)
+
+    loop.run_until_complete(scenario())
+    assert [text for _, _, text in sender.sent] == ["hold", "reply", "urgent", "reminder", "tip"]
+
+def test_dispatcher_reports_each_recipient(loop):
+    sender = FakeSender(loop)
+    sender.errors["hi 2"] = [ValueError("chat not found")]
+    queue = make_queue(loop)
+
+    async def send(user_id, message, buttons=None, priority=notifications.NORMAL):
+        return await queue.call(user_id, sender.factory(user_id, f"{message} {user_id}"), priority)
+
+    dispatcher = notifications.NotificationDispatcher(send)
+    results = loop.run_until_complete(dispatcher.dispatch([1, 2, 3], "hi"))
+    assert results[1] is None and results[3] is None
+    assert isinstance(results[2], ValueError)
+    assert (dispatcher.metrics()["sent"], dispatcher.metrics()["failed"]) == (2, 1)
@@ -0,0 +1,100 @@
+"""Повторы postgrest.Client на локальной заглушке PostgREST"""
+import socket
+
+import pytest
+import requests
+
+import postgrest
+from benchmark_postgrest import start_stub
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(delay=0.0, fail_every=0):
+        server, url = start_stub(delay, fail_every)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+def closed_port_url():
+    # Порт, который только что освободили: соединение будет отклонено
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+def make_client(url, **kwargs):
+    kwargs.setdefault("retries", 2)
+    kwargs.setdefault("backoff", 0.001)
+    return postgrest.Client(url, "test-key", **kwargs)
+
+def test_idempotent_request_retried_on_503(stub):
+    server, url = stub(fail_every=1)
+    client = make_client(url)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.select("feedings")
+    assert server.count == 3
+    assert client.metrics()["GET feedings"]["retries"] == 2
+
+def test_idempotent_request_recovers_after_503(stub):
+    server, url = stub(fail_every=2)
+    client = make_client(url)
+    client.select("feedings")
+    assert client.select("feedings") == [{"id": 1, "family_id": 1, "timestamp": "2025-01-01T09:00:00+07:00"}]
+    assert server.count == 3
+
+def test_post_not_retried_on_503(stub):
+    server, url = stub(fail_every=1)
+    client = make_client(url)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.insert("feedings", {"family_id": 1})
+    assert server.count == 1
+
+def test_post_not_retried_on_read_timeout(stub):
+    server, url = stub(delay=0.3)
+    client = make_client(url, timeout=0.05)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.insert("feedings", {"family_id": 1})
+    assert server.count == 1
+    assert client.metrics()["POST feedings"]["retries"] == 0
+
+def test_get_retried_on_read_timeout(stub):
+    server, url = stub(delay=0.3)
+    client = make_client(url, timeout=0.05)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.select("feedings")
+    assert server.count == 3
+
+def test_post_retried_when_connection_refused():
+    client = make_client(closed_port_url())
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.insert("feedings", {"family_id": 1})
+    stats = client.metrics()["POST feedings"]
+    assert stats["requests"] == 3
+    assert stats["retries"] == 2
+
+def test_post_retried_after_connect_timeout(stub, monkeypatch):
+    server, url = stub()
+    client = make_client(url)
+    request = client.session.request
+    calls = []
+
+    def flaky(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise requests.exceptions.ConnectTimeout("connect timeout")
+        return request(*args, **kwargs)
+
+    monkeypatch.setattr(client.session, "request", flaky)
+    assert client.insert("feedings", {"family_id": 1}) == [{"family_id": 1}]
+    assert len(calls) == 2
+    assert server.count == 1
+
+def test_connect_failed_classification():
+    assert postgrest.connect_failed(requests.exceptions.ConnectTimeout())
+    assert not postgrest.connect_failed(requests.exceptions.ReadTimeout())
+    assert not postgrest.connect_failed(requests.exceptions.ConnectionError("Connection aborted"))
@@ -0,0 +1,92 @@
+"""Расчёт сроков напоминаний и движок на остановленных часах"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import clock
+import reminders
+
+NEW_YORK = clock.get_zone("America/New_York")
+MORNING = datetime(2025, 1, 1, 9, 0, tzinfo=clock.UTC)
+
+def at(**delta):
+    return (MORNING + timedelta(**delta)).timestamp()
+
+def test_next_fire_waits_for_window_start():
+    windows = [(MORNING, MORNING + timedelta(minutes=30), "due", 600)]
+    assert reminders.next_fire(windows, at(minutes=-5)) == (at(), "due")
+    assert reminders.next_fire(windows, at(minutes=10)) == (at(minutes=10), "due")
+
+def test_next_fire_repeats_after_period_and_stays_quiet_after_window():
+    windows = [(MORNING, MORNING + timedelta(minutes=30), "due", timedelta(minutes=10))]
+    assert reminders.next_fire(windows, at(minutes=1), last_fired=at()) == (at(minutes=10), "due")
+    # Следующий повтор выпал бы на конец окна — до нового окна молчим
+    assert reminders.next_fire(windows, at(minutes=21), last_fired=at(minutes=20)) is None
+    assert reminders.next_fire(windows, at(hours=1)) is None
+
+def test_next_fire_picks_earliest_open_window():
+    windows = [
+        (MORNING + timedelta(hours=1), None, "urgent", 600),
+        (MORNING - timedelta(minutes=15), MORNING, "soon", 600),
+        (MORNING, MORNING + timedelta(minutes=30), "due", 600),
+    ]
+    assert reminders.next_fire(windows, at(minutes=-10)) == (at(minutes=-10), "soon")
+    assert reminders.next_fire(windows, at(minutes=40)) == (at(hours=1), "urgent")
+
+def test_spread_offset_is_stable_and_bounded():
+    offsets = [reminders.spread_offset(family_id, 600) for family_id in range(1, 101)]
+    assert all(0 <= offset < 600 for offset in offsets)
+    assert offsets == [reminders.spread_offset(family_id, 600) for family_id in range(1, 101)]
+    # Соседние id не уходят одной пачкой
+    assert len(set(offsets)) > 90
+    assert reminders.spread_offset(7, 0) == 0
+
+def test_daily_windows_keep_local_time_across_dst():
+    # 9 марта 2025 Нью-Йорк переходит на летнее время
+    evening = datetime(2025, 3, 8, 20, 0, tzinfo=NEW_YORK)
+    windows = reminders.daily_windows(evening, "tip", days=(0, 1), offset=90)
+    assert [w[0].strftime("%d %H:%M:%S") for w in windows] == ["08 20:01:30", "09 20:01:30"]
+    assert windows[1][0].timestamp() - windows[0][0].timestamp() == 23 * 3600
+    assert all(end - start == timedelta(minutes=1) for start, end, _, _ in windows)
+
+def test_bath_windows_skip_days_within_period():
+    evening = datetime(2025, 1, 10, 19, 0, tzinfo=NEW_YORK)
+    candidates = reminders.daily_windows(evening, "bath", range(4))
+    last_bath = evening - timedelta(hours=4)
+    windows = reminders.every_n_days(candidates, last_bath, period=2)
+    assert [w[0].day for w in windows] == [12, 13]
+    assert [w[0].day for w in reminders.every_n_days(candidates, None, period=2)] == [10, 11]
+
+@pytest.fixture
+def frozen():
+    clock.default.freeze(MORNING)
+    yield clock.default
+    clock.default.unfreeze()
+
+def test_engine_follows_frozen_clock(frozen):
+    sent = []
+
+    async def send(family_id, stage):
+        sent.append((family_id, stage, clock.default.timestamp()))
+
+    engine = reminders.ReminderEngine()
+    windows = [(MORNING + timedelta(minutes=30), None, "due", timedelta(minutes=20))]
+    engine.register("feeding", lambda family_id: windows, send)
+
+    async def scenario():
+        engine.reschedule(1)
+        assert engine.next_due() == at(minutes=30)
+        assert await engine.fire_due() == []
+
+        frozen.advance(minutes=30)
+        await asyncio.gather(*await engine.fire_due())
+        assert sent == [(1, "due", at(minutes=30))]
+        # Повтор через период от фактической отправки
+        assert engine.next_due() == at(minutes=50)
+
+        frozen.advance(minutes=10)
+        assert await engine.fire_due() == []
+
+    asyncio.run(scenario())
+    assert engine.fired == 1
@@ -0,0 +1,73 @@
+"""Удаления и завершение сна доходят до копии базы через журнал изменений"""
+import sqlite3
+import time
+
+import pytest
+
+import db
+import migrations
+import replication
+
+def wait_for_syncs(replicator, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while replicator.syncs < count:
+        assert time.monotonic() < deadline, "синхронизация не выполнена"
+        time.sleep(0.01)
+
+@pytest.fixture
+def setup(tmp_path):
+    source = str(tmp_path / "babybot.db")
+    manager = db.ConnectionManager(source)
+    migrations.migrate(manager)
+    target = replication.LocalTarget(str(tmp_path / "replica.db"))
+    replicator = replication.Replicator(target, source, window=0.02, max_delay=0.1)
+    yield manager, target, replicator
+    manager.close()
+
+def replica_rows(target, sql):
+    conn = sqlite3.connect(target.path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+def test_delete_and_sleep_end_reach_target(setup):
+    manager, target, replicator = setup
+    with manager.cursor() as cur:
+        cur.execute("INSERT INTO families (id, name) VALUES (1, 'Семья')")
+        cur.execute("INSERT INTO feedings (id, family_id, timestamp, ts, local_day) "
+                    "VALUES (1, 1, '2025-01-01T09:00:00+07:00', 1735696800, '2025-01-01')")
+        cur.execute("INSERT INTO sleep_sessions (id, family_id, start_time, start_ts, local_day, is_active) "
+                    "VALUES (1, 1, '2025-01-01T10:00:00+07:00', 1735700400, '2025-01-01', 1)")
+    replicator.notify()
+    wait_for_syncs(replicator, 1)
+    assert replica_rows(target, "SELECT id FROM feedings") == [(1,)]
+    assert replica_rows(target, "SELECT is_active FROM sleep_sessions") == [(1,)]
+
+    # То же, что делают delete_entry и end_sleep_session в main.py
+    with manager.cursor() as cur:
+        cur.execute("DELETE FROM feedings WHERE id = ?", (1,))
+        cur.execute("UPDATE sleep_sessions SET is_active = 0, end_time = ?, end_ts = ? WHERE family_id = ? AND is_active = 1",
+                    ('2025-01-01T11:00:00+07:00', 1735704000, 1))
+    replicator.notify()
+    wait_for_syncs(replicator, 2)
+    assert replica_rows(target, "SELECT id FROM feedings") == []
+    assert replica_rows(target, "SELECT is_active, end_ts FROM sleep_sessions") == [(0, 1735704000)]
+
+def test_failed_sync_is_retried(setup, monkeypatch):
+    manager, target, replicator = setup
+    publish = target.publish
+    calls = []
+
+    def flaky(source_path):
+        calls.append(source_path)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return publish(source_path)
+
+    monkeypatch.setattr(target, "publish", flaky)
+    manager.execute("INSERT INTO families (id, name) VALUES (1, 'Семья')")
+    replicator.notify()
+    wait_for_syncs(replicator, 1)
+    assert replicator.failures == 1
+    assert replica_rows(target, "SELECT name FROM families") == [("Семья",)]
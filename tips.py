@@ -0,0 +1,179 @@
+"""
+Хранилище советов для родителей
+
+Советы из data/advice2.csv читаются один раз и раскладываются по возрасту
+малыша (колонка time — возраст в месяцах). Файл перечитывается, только
+если изменилось время его модификации. Для каждой семьи и возраста ведётся
+перемешанная колода, поэтому совет не повторяется, пока не будут показаны
+все остальные советы этого возраста.
+"""
+import csv
+import io
+import os
+import random
+import threading
+
+TIPS_PATH = os.path.join("data", "advice2.csv")
+
+# Запасные советы по возрасту (месяцы от и до), если CSV недоступен
+BUILTIN_TIPS = [
+    (0, 1, [
+        "👶 Новорожденный: Держите малыша как можно чаще на руках - это успокаивает и укрепляет связь!",
+        "🍼 Новорожденный: Кормите по требованию, не по расписанию - малыш сам знает, когда голоден!",
+        "😴 Новорожденный: Сон новорожденного может быть беспокойным - это нормально!",
+        "🧷 Новорожденный: Меняйте подгузник каждые 2-3 часа или сразу после загрязнения.",
+        "🛁 Новорожденный: Купайте малыша в воде 36-37°C - это комфортная температура для него."
+    ]),
+    (1, 3, [
+        "👶 0-3 месяца: Малыш начинает улыбаться! Отвечайте на его улыбки - это важно для развития!",
+        "🍼 0-3 месяца: Интервалы между кормлениями постепенно увеличиваются до 3-4 часов.",
+        "😴 0-3 месяца: Помогайте малышу различать день и ночь - днем больше активности, ночью тишина.",
+        "🧷 0-3 месяца: Следите за чистотой кожи - используйте защитный крем при необходимости.",
+        "🎯 0-3 месяца: Выкладывайте малыша на живот на 2-3 минуты несколько раз в день."
+    ]),
+    (3, 6, [
+        "👶 3-6 месяцев: Малыш начинает переворачиваться! Обеспечьте безопасность!",
+        "🍼 3-6 месяцев: Можно начинать вводить прикорм, но только после консультации с врачом.",
+        "😴 3-6 месяцев: Сон становится более предсказуемым - устанавливается режим.",
+        "🧷 3-6 месяцев: Подгузники меняются реже - примерно каждые 4-6 часов.",
+        "🎯 3-6 месяцев: Играйте с малышом в простые игры - прятки, ладушки!"
+    ]),
+    (6, 9, [
+        "👶 6-9 месяцев: Малыш сидит и ползает! Создайте безопасное пространство для исследований!",
+        "🍼 6-9 месяцев: Прикорм становится важной частью рациона - разнообразьте меню!",
+        "😴 6-9 месяцев: Малыш может спать всю ночь - это нормально!",
+        "🧷 6-9 месяцев: Подгузники меняются реже, но следите за сухостью кожи.",
+        "🎯 6-9 месяцев: Читайте малышу книги - это развивает речь и воображение!"
+    ]),
+    (9, 12, [
+        "👶 9-12 месяцев: Малыш делает первые шаги! Поддерживайте и поощряйте!",
+        "🍼 9-12 месяцев: Малыш ест почти как взрослый - разнообразная пища важна!",
+        "😴 9-12 месяцев: Устанавливается четкий режим сна - 2 дневных сна.",
+        "🧷 9-12 месяцев: Можно начинать приучать к горшку, но не торопитесь!",
+        "🎯 9-12 месяцев: Играйте в развивающие игры - пирамидки, кубики, мячики!"
+    ]),
+    (12, None, [
+        "👶 12+ месяцев: Малыш активно ходит и говорит! Поощряйте его развитие!",
+        "🍼 12+ месяцев: Малыш ест за общим столом - приучайте к правильному питанию!",
+        "😴 12+ месяцев: Один дневной сон - это нормально для этого возраста.",
+        "🧷 12+ месяцев: Активно приучайте к горшку - терпение и похвала важны!",
+        "🎯 12+ месяцев: Читайте, играйте, общайтесь - малыш впитывает все как губка!"
+    ]),
+]
+
+def builtin_tips(age_months):
+    """Запасные советы для возраста в месяцах: (начало группы, советы)"""
+    for start, end, tips in BUILTIN_TIPS:
+        if age_months >= start and (end is None or age_months < end):
+            return start, tips
+    return BUILTIN_TIPS[0][0], BUILTIN_TIPS[0][2]
+
+def read_tips(path):
+    """Прочитать CSV советов: [(возраст в месяцах или None, текст), ...]"""
+    with open(path, "rb") as f:
+        data = f.read()
+    # Файл может быть сохранён в UTF-8 или в Windows-1251
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = data.decode("cp1251")
+
+    rows = []
+    for row in csv.DictReader(io.StringIO(text), delimiter=';'):
+        tip = (row.get("tip") or "").strip()
+        if not tip:
+            continue
+        try:
+            month = int((row.get("time") or "").strip())
+        except ValueError:
+            month = None
+        rows.append((month, tip))
+    return rows
+
+class TipStore:
+    """Советы, сгруппированные по возрасту, с ротацией без повторов для каждой семьи"""
+
+    def __init__(self, path=TIPS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._all = []
+        self._by_month = {}
+        self._months = []
+        self._decks = {}
+
+    def load(self):
+        """Загрузить советы, если файл изменился с прошлой загрузки"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+
+        all_tips = []
+        by_month = {}
+        if mtime is not None:
+            try:
+                for month, tip in read_tips(self.path):
+                    all_tips.append(tip)
+                    if month is not None:
+                        by_month.setdefault(month, []).append(tip)
+            except Exception as e:
+                print(f"Ошибка при чтении советов: {e}")
+                return
+
+        with self._lock:
+            self._mtime = mtime
+            self._all = all_tips
+            self._by_month = by_month
+            self._months = sorted(by_month)
+            self._decks = {}
+        print(f"✅ Советы загружены: {len(all_tips)} шт., возрастов {len(by_month)}")
+
+    def month_for(self, age_months):
+        """Ближайший возраст из CSV, не старше малыша (или самый младший)"""
+        if not self._months:
+            return None
+        best = self._months[0]
+        for month in self._months:
+            if month > age_months:
+                break
+            best = month
+        return best
+
+    def _next(self, key, tips):
+        # Колода — перемешанные номера советов; берём с конца за O(1)
+        deck = self._decks.get(key)
+        if not deck:
+            deck = list(range(len(tips)))
+            random.shuffle(deck)
+            self._decks[key] = deck
+        return tips[deck.pop()]
+
+    def random_tip(self, family_id=None):
+        """Случайный совет любого возраста (без повторов для семьи) или None"""
+        self.load()
+        with self._lock:
+            if not self._all:
+                return None
+            if family_id is None:
+                return random.choice(self._all)
+            return self._next((family_id, None), self._all)
+
+    def tip_for_age(self, age_months, family_id=None):
+        """Совет для возраста малыша в месяцах (без повторов для семьи)"""
+        self.load()
+        with self._lock:
+            month = self.month_for(age_months)
+            if month is not None:
+                key, tips = (family_id, month), self._by_month[month]
+            else:
+                start, tips = builtin_tips(age_months)
+                key = (family_id, "builtin", start)
+            if family_id is None:
+                return random.choice(tips)
+            return self._next(key, tips)
+
+# Хранилище по умолчанию для бота
+default = TipStore()
@@ -3,8 +3,8 @@
 Скрипт для загрузки базы данных на Render
 """
 import os
-import shutil
 import sqlite3
+from replication import LocalTarget
 
 def upload_database():
     """Загружает базу данных на Render"""
@@ -14,9 +14,9 @@ def upload_database():
             print("❌ База данных babybot.db не найдена!")
             return False
         
-        # Создаем копию для Render
-        shutil.copy2("babybot.db", "babybot_render.db")
-        print("✅ База данных скопирована для Render")
+        # Переносим в копию для Render только новые изменения из журнала
+        applied = LocalTarget("babybot_render.db").publish("babybot.db")
+        print(f"✅ Копия для Render обновлена (изменено строк: {applied})")
         
         # Проверяем подключение к базе
         conn = sqlite3.connect("babybot_render.db")